@@ -0,0 +1,111 @@
+"""
+CFG schedule benchmark: wall-clock and shape agreement against full classifier-free guidance.
+
+Runs in-process against the checkpoint (no server, no webhook). For every image and every
+schedule the same seed is used, the latents are decoded at OCTREE_RESOLUTION and the
+occupancy grid (logits > MC_LEVEL — the volume the marching-cubes mesh encloses) is
+compared with the full-CFG one by IoU.
+
+    python benchmark_cfg.py --image demo.png --image https://.../concept.png \
+        --schedule 0.0,1.0,2 --schedule 0.0,0.66,1 --schedule 0.0,0.66,2
+"""
+
+import argparse
+import os
+import time
+
+import torch
+
+from generation import (
+    BOUNDS, GUIDANCE_SCALE, MC_LEVEL, NUM_INFERENCE_STEPS, OCTREE_RESOLUTION,
+    GenerationStages, download_image, preprocess_image, quantization_kwargs, residency_kwargs,
+)
+from hy3dgen.shapegen import Hunyuan3DDiTFlowMatchingPipeline
+from hy3dgen.shapegen.guidance import GuidanceSchedule
+
+DEFAULT_SCHEDULES = ["0.0,1.0,2", "0.0,0.66,1", "0.0,0.66,2", "0.0,0.5,1"]
+
+
+def parse_schedule(text: str) -> GuidanceSchedule:
+    lo, hi, reuse = text.split(",")
+    return GuidanceSchedule((float(lo), float(hi)), int(reuse))
+
+
+def load_image(source: str):
+    if source.startswith("http"):
+        return preprocess_image(download_image(source))
+    from PIL import Image
+    return preprocess_image(Image.open(source))
+
+
+def occupancy(stages: GenerationStages, image, schedule: GuidanceSchedule, seed: int):
+    """(occupancy grid, diffusion seconds, DiT rows) for one image under `schedule`."""
+    stats = {}
+    generator = torch.Generator(device=stages.device).manual_seed(seed)
+    if stages.device.startswith("cuda"):
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    with torch.no_grad():
+        latents = stages.pipeline(
+            image=image,
+            num_inference_steps=NUM_INFERENCE_STEPS,
+            guidance_scale=GUIDANCE_SCALE,
+            guidance_schedule=schedule,
+            sampling_stats=stats,
+            generator=generator,
+            enable_pbar=False
+        )
+    if stages.device.startswith("cuda"):
+        torch.cuda.synchronize()
+    seconds = time.perf_counter() - start
+    grid = stages.decode_grid(latents.to(stages.device, dtype=stages.pipeline.dtype), OCTREE_RESOLUTION, BOUNDS)
+    return grid[0] > MC_LEVEL, seconds, stats["dit_rows"]
+
+
+def iou(a, b) -> float:
+    union = (a | b).sum().item()
+    return (a & b).sum().item() / union if union else 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=os.environ.get("MODEL_PATH", "models/hunyuan3d-dit-v2_fp16.safetensors"))
+    parser.add_argument("--image", action="append", required=True, help="path or URL, repeatable")
+    parser.add_argument("--schedule", action="append", help="lo,hi,reuse (sigma: 0 = noise, 1 = data)")
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args()
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    pipeline, vae = Hunyuan3DDiTFlowMatchingPipeline.from_single_file(
+        ckpt_path=args.model, device=device, use_safetensors=True, **residency_kwargs(), **quantization_kwargs()
+    )
+    vae.eval()
+    stages = GenerationStages(device=device)
+    stages.attach(pipeline, vae)
+
+    schedules = [parse_schedule(s) for s in (args.schedule or DEFAULT_SCHEDULES)]
+    results = {repr(s): [] for s in schedules}
+    baseline_s = []
+    for source in args.image:
+        image = load_image(source)
+        reference, full_s, full_rows = occupancy(stages, image, GuidanceSchedule(), args.seed)
+        baseline_s.append(full_s)
+        print(f"{source}: full CFG {full_s:.2f}s, {full_rows} DiT rows")
+        for schedule in schedules:
+            occ, seconds, rows = occupancy(stages, image, schedule, args.seed)
+            results[repr(schedule)].append((iou(reference, occ), seconds, rows / full_rows))
+            print(f"  {schedule}: {seconds:.2f}s, IoU {results[repr(schedule)][-1][0]:.4f}")
+
+    full_avg = sum(baseline_s) / len(baseline_s)
+    print("\n================ CFG SCHEDULES vs FULL CFG ================")
+    print(f"{'schedule':<48} {'IoU':>8} {'min IoU':>8} {'time':>8} {'speedup':>8} {'DiT rows':>9}")
+    for name, rows in results.items():
+        ious = [r[0] for r in rows]
+        avg_s = sum(r[1] for r in rows) / len(rows)
+        dit = sum(r[2] for r in rows) / len(rows)
+        print(f"{name:<48} {sum(ious) / len(ious):>8.4f} {min(ious):>8.4f} {avg_s:>7.2f}s "
+              f"{full_avg / avg_s:>7.2f}x {dit:>8.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Volume-decode memory benchmark: peak host RSS, peak CUDA memory and time per octree resolution.
+
+Runs in-process with only the VAE loaded from the checkpoint. The raw latents come from the
+latent store (`<asset_id>.npy`), so the near-surface point sets of the hierarchical decoders
+match a real shape; without `--latents` random latents are used, which is fine for the
+vanilla decoder but gives unrealistically large surfaces for the hierarchical ones.
+Host RSS is sampled from /proc every few ms while each decode runs.
+
+With `--launches` the FlashVDM decode is instead profiled once with the per-bucket top-k
+loop and once with the segmented (batched) refinement attention, and the kernel launches
+(CUDA) or dispatched non-view aten ops (CPU) and the host syncs of each are counted.
+
+    python benchmark_decode.py --latents cache/latents/<asset_id>.npy --resolution 256 --resolution 384 --resolution 512
+    python benchmark_decode.py --latents cache/latents/<asset_id>.npy --launches
+"""
+
+import argparse
+import os
+import threading
+import time
+import warnings
+
+import numpy as np
+import torch
+
+from generation import BOUNDS, MC_LEVEL, NUM_CHUNKS
+from hy3dgen.shapegen import Hunyuan3DDiTFlowMatchingPipeline
+from hy3dgen.shapegen.models.autoencoders import (
+    FlashVDMVolumeDecoding, HierarchicalVolumeDecoding, VanillaVolumeDecoder,
+)
+
+DECODERS = {
+    "vanilla": VanillaVolumeDecoder,
+    "hierarchical": HierarchicalVolumeDecoding,
+    "flashvdm": FlashVDMVolumeDecoding,
+}
+
+
+def rss_bytes() -> int:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+class PeakRSS:
+    """Highest RSS seen by a background sampler while the block runs."""
+
+    def __enter__(self):
+        self.peak, self._stop = rss_bytes(), threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def _sample(self):
+        while not self._stop.wait(0.005):
+            self.peak = max(self.peak, rss_bytes())
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def decode(vae, decoder, latents, resolution: int, device: str):
+    """(seconds, peak host bytes, peak CUDA bytes or None) for one volume decode."""
+    if device.startswith("cuda"):
+        torch.cuda.synchronize()
+        torch.cuda.reset_peak_memory_stats()
+    with PeakRSS() as host:
+        start = time.perf_counter()
+        grid = decoder(latents, vae.geo_decoder, bounds=BOUNDS, num_chunks=NUM_CHUNKS,
+                       mc_level=MC_LEVEL, octree_resolution=resolution, enable_pbar=False)
+        grid = grid.cpu()
+        seconds = time.perf_counter() - start
+    peak = torch.cuda.max_memory_allocated() if device.startswith("cuda") else None
+    return seconds, host.peak, peak
+
+
+# ops that wait on the device on CUDA; on CPU they stand in for the host syncs of a decode
+SYNC_OPS = ("aten::nonzero", "aten::_unique2", "aten::unique_dim", "aten::_local_scalar_dense")
+VIEW_OPS = ("aten::view", "aten::reshape", "aten::_unsafe_view", "aten::transpose", "aten::permute", "aten::t",
+            "aten::unsqueeze", "aten::squeeze", "aten::expand", "aten::slice", "aten::select", "aten::narrow",
+            "aten::split", "aten::split_with_sizes", "aten::as_strided", "aten::alias", "aten::detach",
+            "aten::lift_fresh", "aten::empty", "aten::empty_like", "aten::to", "aten::contiguous")
+
+
+def count_launches(vae, latents, resolution: int, device: str, segmented: bool):
+    """(kernel launches, host syncs, seconds) of one FlashVDM decode, per-bucket loop or segmented."""
+    decoder = FlashVDMVolumeDecoding()
+    decoder.processor.segmented = segmented
+    cuda = device.startswith("cuda")
+    activities = [torch.profiler.ProfilerActivity.CPU]
+    if cuda:
+        activities.append(torch.profiler.ProfilerActivity.CUDA)
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        if cuda:
+            torch.cuda.set_sync_debug_mode("warn")
+        try:
+            with torch.profiler.profile(activities=activities) as prof:
+                seconds, _, _ = decode(vae, decoder, latents, resolution, device)
+        finally:
+            if cuda:
+                torch.cuda.set_sync_debug_mode("default")
+    events = prof.events()
+    if cuda:
+        launches = sum(1 for e in events if e.device_type == torch.autograd.DeviceType.CUDA)
+        # the final grid.cpu() of decode() is one of them
+        syncs = sum(1 for w in caught if "synchroniz" in str(w.message))
+    else:
+        top = [e.name for e in events if e.name.startswith("aten::") and e.cpu_parent is None]
+        launches = sum(1 for name in top if name not in VIEW_OPS)
+        syncs = sum(1 for e in events if e.name in SYNC_OPS)
+    return launches, syncs, seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=os.environ.get("MODEL_PATH", "models/hunyuan3d-dit-v2_fp16.safetensors"))
+    parser.add_argument("--latents", help="raw DiT latents (.npy from the latent store)")
+    parser.add_argument("--resolution", type=int, action="append", help="repeatable, default 256 384 512")
+    parser.add_argument("--decoder", choices=list(DECODERS), action="append", help="repeatable, default all")
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--launches", action="store_true", help="count FlashVDM kernel launches, loop vs segmented")
+    args = parser.parse_args()
+
+    _, vae = Hunyuan3DDiTFlowMatchingPipeline.from_single_file(
+        ckpt_path=args.model, device=args.device, use_safetensors=True, components=("vae",), load_device=args.device,
+    )
+    vae.eval()
+    if args.latents:
+        raw = torch.from_numpy(np.load(args.latents)).to(args.device, dtype=torch.float16)
+    else:
+        raw = torch.randn(1, 3072, 64, generator=torch.Generator().manual_seed(0)).to(args.device, dtype=torch.float16)
+    with torch.no_grad():
+        latents = vae(raw / vae.scale_factor)
+
+    if args.launches:
+        unit = "kernels" if args.device.startswith("cuda") else "aten ops"
+        print("\n================ FLASHVDM REFINEMENT LAUNCHES ================")
+        print(f"{'octree':>7} {'loop ' + unit:>16} {'segmented':>12} {'loop syncs':>11} {'segmented':>10} {'loop time':>10} {'segmented':>10}")
+        for resolution in args.resolution or [256, 384, 512]:
+            loop, loop_syncs, loop_s = count_launches(vae, latents, resolution, args.device, segmented=False)
+            batched, batched_syncs, batched_s = count_launches(vae, latents, resolution, args.device, segmented=True)
+            print(f"{resolution:>7} {loop:>16} {batched:>12} {loop_syncs:>11} {batched_syncs:>10} {loop_s:>9.2f}s {batched_s:>9.2f}s")
+        return
+
+    def gb(n):
+        return f"{n / 2 ** 30:.2f} GB" if n is not None else "n/a"
+
+    print("\n================ VOLUME DECODE MEMORY ================")
+    print(f"{'decoder':<14} {'octree':>7} {'time':>9} {'peak host RSS':>15} {'peak CUDA':>12}")
+    for name in args.decoder or list(DECODERS):
+        for resolution in args.resolution or [256, 384, 512]:
+            seconds, host, cuda = decode(vae, DECODERS[name](), latents, resolution, args.device)
+            print(f"{name:<14} {resolution:>7} {seconds:>8.2f}s {gb(host):>15} {gb(cuda):>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+int8 weight-only benchmark: weight memory, latency and shape agreement against fp16.
+
+Runs in-process against the checkpoint (no server, no webhook), on CUDA or CPU. Every
+image is generated with the fp16 weights, the DiT blocks and VAE transformer are then
+quantized in place (hy3dgen/shapegen/quantization.py) and the same seeds run again.
+The occupancy grids (logits > MC_LEVEL) are compared by IoU.
+
+    python benchmark_quant.py --image demo.png --steps 20 --device cpu
+"""
+
+import argparse
+import os
+import time
+
+import torch
+
+from generation import (
+    BOUNDS, GUIDANCE_SCALE, MC_LEVEL, NUM_INFERENCE_STEPS, OCTREE_RESOLUTION,
+    GenerationStages, download_image, preprocess_image, residency_kwargs,
+)
+from hy3dgen.shapegen import Hunyuan3DDiTFlowMatchingPipeline
+from hy3dgen.shapegen.quantization import module_bytes, quantize_int8
+
+
+def load_image(source: str):
+    if source.startswith("http"):
+        return preprocess_image(download_image(source))
+    from PIL import Image
+    return preprocess_image(Image.open(source))
+
+
+def synchronize(device: str):
+    if device.startswith("cuda"):
+        torch.cuda.synchronize()
+
+
+def generate(stages: GenerationStages, image, steps: int, octree_resolution: int, seed: int):
+    """(occupancy grid, diffusion seconds, decode seconds) for one image."""
+    generator = torch.Generator().manual_seed(seed)
+    synchronize(stages.device)
+    start = time.perf_counter()
+    with torch.no_grad():
+        latents = stages.pipeline(
+            image=image,
+            num_inference_steps=steps,
+            guidance_scale=GUIDANCE_SCALE,
+            generator=generator,
+            enable_pbar=False
+        )
+    synchronize(stages.device)
+    diffused = time.perf_counter()
+    grid = stages.decode_grid(latents.to(stages.device, dtype=stages.pipeline.dtype), octree_resolution, BOUNDS)
+    synchronize(stages.device)
+    return grid[0] > MC_LEVEL, diffused - start, time.perf_counter() - diffused
+
+
+def iou(a, b) -> float:
+    union = (a | b).sum().item()
+    return (a & b).sum().item() / union if union else 1.0
+
+
+def run_all(stages, images, args):
+    if stages.device.startswith("cuda"):
+        torch.cuda.reset_peak_memory_stats()
+    runs = [generate(stages, image, args.steps, args.octree_resolution, args.seed) for image in images]
+    peak = torch.cuda.max_memory_allocated() if stages.device.startswith("cuda") else None
+    return runs, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=os.environ.get("MODEL_PATH", "models/hunyuan3d-dit-v2_fp16.safetensors"))
+    parser.add_argument("--image", action="append", required=True, help="path or URL, repeatable")
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--steps", type=int, default=NUM_INFERENCE_STEPS)
+    parser.add_argument("--octree-resolution", type=int, default=OCTREE_RESOLUTION)
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args()
+
+    pipeline, vae = Hunyuan3DDiTFlowMatchingPipeline.from_single_file(
+        ckpt_path=args.model, device=args.device, use_safetensors=True, **residency_kwargs()
+    )
+    vae.eval()
+    stages = GenerationStages(device=args.device)
+    stages.attach(pipeline, vae)
+    images = [load_image(source) for source in args.image]
+
+    conditioner_bytes = module_bytes(pipeline.conditioner)
+    fp16, fp16_peak = run_all(stages, images, args)
+    memory = quantize_int8({"model": pipeline.model, "vae": vae})
+    int8, int8_peak = run_all(stages, images, args)
+
+    def gb(n):
+        return f"{n / 2 ** 30:.2f} GB" if n is not None else "n/a"
+
+    print("\n================ INT8 WEIGHT-ONLY vs FP16 ================")
+    print(f"weights (DiT + VAE): {gb(memory['before'])} -> {gb(memory['after'])} "
+          f"(conditioner, unquantized: {gb(conditioner_bytes)})")
+    print(f"peak CUDA memory:    {gb(fp16_peak)} -> {gb(int8_peak)}")
+    print(f"{'image':<40} {'IoU':>8} {'diffusion':>18} {'decode':>18}")
+    for source, (ref, ref_diff, ref_dec), (occ, diff, dec) in zip(args.image, fp16, int8):
+        print(f"{source[-40:]:<40} {iou(ref, occ):>8.4f} {ref_diff:>7.2f}s -> {diff:>6.2f}s "
+              f"{ref_dec:>7.2f}s -> {dec:>6.2f}s")
+
+
+if __name__ == "__main__":
+    main()
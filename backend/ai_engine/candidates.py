@@ -0,0 +1,56 @@
+"""
+Cheap geometric scores for picking one of several diffusion candidates.
+
+A job with `candidates=K` diffuses K seeds of the same image in one batch, decodes
+each at a low octree resolution and keeps only the best for the full-resolution
+decode. The score targets the usual failures of Flux concept images:
+
+    floaters      more than one connected component
+    holes         a surface that is not watertight
+    box / slab    occupancy filling most of its own bounding box
+    thin walls    occupancy filling almost none of it
+
+Higher is better; a candidate whose surface extraction failed scores -inf.
+"""
+
+import math
+from typing import List, Optional
+
+import numpy as np
+import trimesh
+
+# occupied fraction of the occupied bounding box above which a candidate looks like a box
+BOX_FILL = 0.85
+# ... and below which it is mostly thin shells
+THIN_FILL = 0.05
+
+
+def bbox_fill(occupancy: np.ndarray) -> float:
+    """Occupied voxels / voxels of the tight bounding box around them (0 when empty)."""
+    occupied = np.argwhere(occupancy)
+    if len(occupied) == 0:
+        return 0.0
+    extent = occupied.max(axis=0) - occupied.min(axis=0) + 1
+    return len(occupied) / float(np.prod(extent))
+
+
+def score_candidate(mesh: Optional[trimesh.Trimesh], occupancy: np.ndarray) -> dict:
+    """`{"score", "components", "watertight", "fill"}` for one decoded candidate."""
+    fill = bbox_fill(occupancy)
+    if mesh is None or len(mesh.faces) == 0:
+        return {"score": -math.inf, "components": 0, "watertight": False, "fill": fill}
+    components = mesh.body_count
+    watertight = bool(mesh.is_watertight)
+    score = -float(components - 1)
+    if watertight:
+        score += 1.0
+    if fill > BOX_FILL:
+        score -= 2.0 * (fill - BOX_FILL) / (1.0 - BOX_FILL)
+    elif fill < THIN_FILL:
+        score -= (THIN_FILL - fill) / THIN_FILL
+    return {"score": score, "components": components, "watertight": watertight, "fill": round(fill, 4)}
+
+
+def pick_best(scores: List[dict]) -> int:
+    """Index of the highest score; ties keep the earliest candidate."""
+    return max(range(len(scores)), key=lambda i: (scores[i]["score"], -i))
@@ -0,0 +1,170 @@
+"""
+Volume-decode chunk size per (GPU, octree resolution, volume decoder).
+
+`num_chunks` (query points per geo_decoder call) used to be the fixed NUM_CHUNKS=8000
+for every decoder and octree level, whatever the GPU had free: too small to saturate a
+large card, and a hard failure if a level didn't fit. `ChunkTuner`:
+
+  - `tune` times each CHUNK_CANDIDATES size on the real decode (warm-up, warmup.py) and
+    keeps the fastest one whose peak CUDA memory stays under DECODE_MEMORY_FRACTION of
+    the card; larger sizes are skipped after the first OOM
+  - `run` decodes with the stored size and, on OOM, frees the cache, halves it and
+    retries down to MIN_CHUNKS instead of failing the job; the smaller size is stored
+
+Settings live in a small JSON file (DECODE_CHUNK_CACHE, on the network volume in Docker)
+keyed by `<device name>|<octree resolution>|<decoder class>`, so later cold starts skip
+the probing.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Optional
+
+logger = logging.getLogger("AI-Engine")
+
+CHUNK_CANDIDATES = (4000, 8000, 16000, 32000, 64000)
+MIN_CHUNKS = 1000
+# tuned sizes must leave this much of the card's memory unused at their peak
+DECODE_MEMORY_FRACTION = float(os.environ.get("DECODE_MEMORY_FRACTION", "0.85"))
+
+
+def is_oom(error: BaseException) -> bool:
+    """torch.cuda.OutOfMemoryError, or the RuntimeError older builds / other backends raise."""
+    return type(error).__name__ == "OutOfMemoryError" or "out of memory" in str(error).lower()
+
+
+def device_name(device) -> str:
+    import torch
+    device = torch.device(device)
+    return torch.cuda.get_device_name(device) if device.type == "cuda" else device.type
+
+
+def memory_limit(device) -> Optional[int]:
+    import torch
+    device = torch.device(device)
+    if device.type != "cuda":
+        return None
+    return int(torch.cuda.get_device_properties(device).total_memory * DECODE_MEMORY_FRACTION)
+
+
+def measure(run: Callable[[int], object], num_chunks: int, device):
+    """(seconds, peak CUDA bytes or None) of one run(num_chunks)."""
+    import torch
+    cuda = torch.device(device).type == "cuda"
+    if cuda:
+        torch.cuda.synchronize(device)
+        torch.cuda.reset_peak_memory_stats(device)
+    start = time.perf_counter()
+    run(num_chunks)
+    if cuda:
+        torch.cuda.synchronize(device)
+    return time.perf_counter() - start, torch.cuda.max_memory_allocated(device) if cuda else None
+
+
+def report(num_chunks: int, seconds: float, peak: Optional[int]) -> dict:
+    """Rounded, JSON-friendly view of one measurement for logs and the settings file."""
+    return {"num_chunks": num_chunks, "ms": round(seconds * 1000, 1),
+            "peak_gb": round(peak / 2 ** 30, 3) if peak is not None else None}
+
+
+def free_memory():
+    import torch
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+
+class ChunkTuner:
+    def __init__(self, path: Optional[str], default: int):
+        self.path = path
+        self.default = default
+        self._lock = threading.Lock()
+        self.backoffs = 0
+        self.settings = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self.settings = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"[CHUNKS] Ignoring unreadable {path}: {e}")
+
+    @staticmethod
+    def key(device: str, resolution: int, decoder: str) -> str:
+        return f"{device}|{resolution}|{decoder}"
+
+    def get(self, device: str, resolution: int, decoder: str) -> int:
+        entry = self.settings.get(self.key(device, resolution, decoder))
+        return entry["num_chunks"] if entry else self.default
+
+    def tuned(self, device: str, resolution: int, decoder: str) -> bool:
+        return self.key(device, resolution, decoder) in self.settings
+
+    def set(self, device: str, resolution: int, decoder: str, num_chunks: int, **stats):
+        with self._lock:
+            self.settings[self.key(device, resolution, decoder)] = dict(num_chunks=num_chunks, **stats)
+            self._save()
+
+    def _save(self):
+        if not self.path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(self.settings, f, indent=2, sort_keys=True)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logger.warning(f"[CHUNKS] Could not save {self.path}: {e}")
+
+    def tune(self, run: Callable[[int], object], device, resolution: int, decoder: str,
+             candidates=CHUNK_CANDIDATES, limit: Optional[int] = None, measure=measure) -> dict:
+        """Time run(num_chunks) for each candidate and store the fastest that fits."""
+        name = device_name(device)
+        limit = memory_limit(device) if limit is None else limit
+        measured = []  # (num_chunks, seconds, peak bytes) at full precision
+        for num_chunks in sorted(candidates):
+            try:
+                seconds, peak = measure(run, num_chunks, device)
+            except Exception as e:
+                if not is_oom(e):
+                    raise
+                free_memory()
+                logger.info(f"[CHUNKS] {name} r{resolution} {decoder}: OOM at {num_chunks}")
+                break
+            measured.append((num_chunks, seconds, peak))
+            if limit is not None and peak is not None and peak > limit:
+                break
+        results = [report(*m) for m in measured]
+        fitting = [m for m in measured if limit is None or m[2] is None or m[2] <= limit]
+        if not fitting:
+            logger.warning(f"[CHUNKS] {name} r{resolution} {decoder}: no candidate fits, keeping {self.default}")
+            return {"num_chunks": self.default, "candidates": results}
+        # rank on the raw timings: the rounded `ms` ties sizes that differ by < 0.05 ms
+        best = report(*min(fitting, key=lambda m: m[1]))
+        self.set(name, resolution, decoder, best["num_chunks"], ms=best["ms"], peak_gb=best["peak_gb"])
+        timings = ", ".join(f"{r['num_chunks']}: {r['ms']} ms" for r in results)
+        logger.info(f"[CHUNKS] {name} r{resolution} {decoder}: {best['num_chunks']} ({timings})")
+        return dict(best, candidates=results)
+
+    def run(self, run: Callable[[int], object], device, resolution: int, decoder: str):
+        """run(num_chunks) with the stored size, halving it on OOM down to MIN_CHUNKS."""
+        name = device_name(device)
+        num_chunks = self.get(name, resolution, decoder)
+        while True:
+            try:
+                return run(num_chunks)
+            except Exception as e:
+                if not is_oom(e) or num_chunks <= MIN_CHUNKS:
+                    raise
+            free_memory()
+            smaller = max(num_chunks // 2, MIN_CHUNKS)
+            with self._lock:
+                self.backoffs += 1
+            logger.warning(f"[CHUNKS] OOM decoding r{resolution} with {decoder} at {num_chunks} chunks, retrying with {smaller}")
+            self.set(name, resolution, decoder, smaller, backoff=True)
+            num_chunks = smaller
+
+    def stats(self) -> dict:
+        return {"settings": dict(self.settings), "backoffs": self.backoffs}
@@ -0,0 +1,886 @@
+"""
+Image → mesh generation stages shared by `main.py` (FastAPI) and `runpod_handler.py`.
+
+A job moves through three stages of a `StagedExecutor` (see job_queue.py):
+
+    preprocess  (CPU pool)   download → rembg → RGBA canvas
+    gpu         (GPU slots)  batched DiT diffusion → VAE forward → volume decode (grid logits)
+    postprocess (CPU pool)   marching cubes → STL export → webhook upload
+
+so job N+1's download/rembg and job N-1's surface extraction/upload overlap with
+job N's diffusion instead of leaving the GPU idle.
+"""
+
+import io
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import nullcontext
+
+import numpy as np
+import PIL.ImageDraw as ImageDraw
+import requests
+import torch
+import trimesh
+from PIL import Image
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from candidates import pick_best, score_candidate
+from decode_chunks import ChunkTuner
+from job_queue import Stage, StagedExecutor
+from latent_store import LatentStore
+from result_cache import ResultCache, cache_key
+
+logger = logging.getLogger("AI-Engine")
+
+try:
+    from rembg import remove, new_session
+    # isnet-general-use has sharper edge detection and handles dark/gradient backgrounds
+    # much better than u2net — critical for Flux-generated images with dark gradient BGs
+    REMBG_SESSION = new_session("isnet-general-use")
+    REMBG_AVAILABLE = True
+    logger.info("rembg loaded with model: isnet-general-use")
+except ImportError:
+    REMBG_AVAILABLE = False
+    logger.warning("rembg not installed, background removal will be skipped.")
+
+# Production settings (see docs/ai_engine.md §3)
+NUM_INFERENCE_STEPS = 50
+GUIDANCE_SCALE = 7.5
+SEED = None
+OCTREE_RESOLUTION = 256
+MC_LEVEL = -1 / 512
+# default query points per geo_decoder call; tuned per GPU / resolution / decoder in DECODE_CHUNK_CACHE
+NUM_CHUNKS = 8000
+BOUNDS = 1.01
+# Draft preview (GenJob.draft): a few-step diffusion decoded at low resolution from the
+# same conditioning, uploaded with status "draft" before the full result
+DRAFT_STEPS = int(os.environ.get("DRAFT_STEPS", "6"))
+DRAFT_OCTREE_RESOLUTION = int(os.environ.get("DRAFT_OCTREE_RESOLUTION", "128"))
+# Classifier-free guidance schedule (hy3dgen/shapegen/guidance.py): guidance only for
+# sigma in CFG_INTERVAL ("lo,hi"; 0 = noise, 1 = data), and the unconditional branch
+# recomputed every CFG_UNCOND_REUSE guided steps. The defaults are full CFG.
+CFG_INTERVAL = tuple(float(v) for v in os.environ.get("CFG_INTERVAL", "0,1").split(","))
+CFG_UNCOND_REUSE = int(os.environ.get("CFG_UNCOND_REUSE", "1"))
+# Cross-step DiT cache (StepCache in hy3dgen/shapegen/models/hunyuan3ddit.py), opt-in:
+# skip the block stack while the accumulated relative change of the first block's
+# modulated input stays below STEP_CACHE_THRESHOLD (0 = off)
+STEP_CACHE_THRESHOLD = float(os.environ.get("STEP_CACHE_THRESHOLD", "0"))
+STEP_CACHE_REFRESH = int(os.environ.get("STEP_CACHE_REFRESH", "0"))
+STEP_CACHE_MAX_SKIPS = int(os.environ.get("STEP_CACHE_MAX_SKIPS", "2"))
+# Quality tiers a request may pick (GenJob.quality): solver (hy3dgen SCHEDULERS key),
+# diffusion steps and octree resolution, all served by the same loaded pipeline.
+# Heun evaluates the DiT twice per interval, so 17 steps cost 32 model calls.
+QUALITY_TIERS = {
+    "fast": {"scheduler": "dpmpp_2m", "steps": 12, "octree_resolution": 192},
+    "balanced": {"scheduler": "heun", "steps": 17, "octree_resolution": 256},
+    "standard": {"scheduler": "euler", "steps": NUM_INFERENCE_STEPS, "octree_resolution": OCTREE_RESOLUTION},
+    "high": {"scheduler": "heun", "steps": 33, "octree_resolution": 384},
+}
+DEFAULT_QUALITY = os.environ.get("DEFAULT_QUALITY", "standard")
+# Multi-candidate generation (GenJob.candidates, candidates.py): K seeds diffused in one
+# batch, each decoded at CANDIDATE_OCTREE_RESOLUTION and scored; the winner is decoded in full
+MAX_CANDIDATES = int(os.environ.get("MAX_CANDIDATES", "4"))
+CANDIDATE_OCTREE_RESOLUTION = int(os.environ.get("CANDIDATE_OCTREE_RESOLUTION", "128"))
+# Surface extractors a remesh may ask for (hy3dgen SurfaceExtractors keys)
+MC_ALGOS = ("mc", "dmc")
+# octree resolutions a remesh may ask for
+REMESH_OCTREE_RANGE = (16, 1024)
+
+# Finished meshes keyed by canvas + parameters (result_cache.py); RESULT_CACHE_MAX_GB=0 disables it
+RESULT_CACHE_DIR = os.environ.get("RESULT_CACHE_DIR", "cache/results")
+RESULT_CACHE_MAX_GB = float(os.environ.get("RESULT_CACHE_MAX_GB", "5"))
+
+
+def make_result_cache():
+    if RESULT_CACHE_MAX_GB <= 0:
+        return None
+    return ResultCache(RESULT_CACHE_DIR, int(RESULT_CACHE_MAX_GB * 2 ** 30))
+
+# Raw DiT latents per asset (latent_store.py) so /remesh can skip diffusion, kept as an
+# LRU of LATENT_STORE_MAX_GB (~384 KB per asset); an empty dir or LATENT_STORE_MAX_GB=0 disables it
+LATENT_STORE_DIR = os.environ.get("LATENT_STORE_DIR", "cache/latents")
+LATENT_STORE_MAX_GB = float(os.environ.get("LATENT_STORE_MAX_GB", "2"))
+
+
+def make_latent_store():
+    if not LATENT_STORE_DIR or LATENT_STORE_MAX_GB <= 0:
+        return None
+    return LatentStore(LATENT_STORE_DIR, int(LATENT_STORE_MAX_GB * 2 ** 30))
+
+# Tuned decode chunk sizes (decode_chunks.py); empty keeps them in memory only
+DECODE_CHUNK_CACHE = os.environ.get("DECODE_CHUNK_CACHE", "cache/decode_chunks.json")
+
+
+def make_chunk_tuner():
+    return ChunkTuner(DECODE_CHUNK_CACHE or None, NUM_CHUNKS)
+
+
+def decode_resolutions() -> list:
+    """Every octree resolution the service decodes at (tiers, drafts, candidates)."""
+    tiers = {tier["octree_resolution"] for tier in QUALITY_TIERS.values()}
+    return sorted(tiers | {DRAFT_OCTREE_RESOLUTION, CANDIDATE_OCTREE_RESOLUTION})
+
+# (connect, read) timeouts in seconds for image downloads and webhook uploads
+DOWNLOAD_TIMEOUT = (5, 30)
+WEBHOOK_TIMEOUT = (5, 60)
+HTTP_RETRIES = int(os.environ.get("HTTP_RETRIES", "3"))
+
+
+def make_http_session() -> requests.Session:
+    """
+    One keep-alive client shared by every stage worker. Downloads retry on connection
+    errors and 5xx; webhook POSTs only retry when the connection could not be made,
+    so the Worker never receives the same upload twice.
+    """
+    retry = Retry(
+        total=HTTP_RETRIES,
+        connect=HTTP_RETRIES,
+        read=HTTP_RETRIES,
+        status=HTTP_RETRIES,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset({"GET", "HEAD"}),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=4, pool_maxsize=16)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+HTTP = make_http_session()
+
+# Where the DiT / conditioner / VAE weights live between jobs (hy3dgen/shapegen/residency.py).
+# A dedicated worker keeps them on the GPU; a shared box can offload after idling or under pressure.
+WEIGHT_RESIDENCY = os.environ.get("WEIGHT_RESIDENCY", "resident")
+RESIDENCY_IDLE_S = float(os.environ.get("RESIDENCY_IDLE_S", "300"))
+RESIDENCY_MIN_FREE_GB = float(os.environ.get("RESIDENCY_MIN_FREE_GB", "2"))
+
+
+def residency_kwargs() -> dict:
+    """`from_single_file` kwargs selecting the residency policy configured by env vars."""
+    options = {
+        "idle": {"idle_timeout": RESIDENCY_IDLE_S},
+        "pressure": {"min_free_gb": RESIDENCY_MIN_FREE_GB},
+    }
+    return {"residency": WEIGHT_RESIDENCY, "residency_kwargs": options.get(WEIGHT_RESIDENCY, {})}
+
+# Weight-only quantization of the DiT blocks and VAE transformer (hy3dgen/shapegen/quantization.py):
+# "int8" or empty for the checkpoint's fp16. Converted weights are cached in QUANTIZED_CACHE_DIR.
+WEIGHT_QUANTIZATION = os.environ.get("WEIGHT_QUANTIZATION", "")
+QUANTIZED_CACHE_DIR = os.environ.get("QUANTIZED_CACHE_DIR", "cache/quantized")
+
+
+def quantization_kwargs() -> dict:
+    """`from_single_file` kwargs selecting the weight quantization configured by env vars."""
+    if not WEIGHT_QUANTIZATION:
+        return {}
+    return {"quantization": WEIGHT_QUANTIZATION, "quantization_cache": QUANTIZED_CACHE_DIR or None}
+
+
+# Per-component, already renamed and cast copies of MODEL_PATH (hy3dgen/shapegen/conversion.py),
+# written on the first load and preferred afterwards. Empty reads the single-file checkpoint.
+CONVERTED_CACHE_DIR = os.environ.get("CONVERTED_CACHE_DIR", "cache/converted")
+
+
+def checkpoint_kwargs() -> dict:
+    """`from_single_file` kwargs selecting the converted checkpoint cache configured by env vars."""
+    return {"converted_cache": CONVERTED_CACHE_DIR or None}
+
+
+def guidance_schedule():
+    from hy3dgen.shapegen.guidance import GuidanceSchedule
+    return GuidanceSchedule(CFG_INTERVAL, CFG_UNCOND_REUSE)
+
+
+def make_step_cache():
+    """A fresh StepCache for one pipeline call, or None when disabled."""
+    if STEP_CACHE_THRESHOLD <= 0:
+        return None
+    from hy3dgen.shapegen.models.hunyuan3ddit import StepCache
+    return StepCache(STEP_CACHE_THRESHOLD, STEP_CACHE_REFRESH, STEP_CACHE_MAX_SKIPS)
+
+
+class GenJob:
+    """
+    One image → mesh request as it moves through the stages. With remesh=True the
+    stored latents of `asset_id` are decoded again (image_url is ignored) using the
+    given octree_resolution / mc_level / bounds / mc_algo. With draft=True a coarse
+    preview is uploaded first and the full-quality mesh follows for the same asset_id.
+    `quality` picks a QUALITY_TIERS entry (solver, steps and, unless given, octree_resolution).
+    With candidates=K, K seeds are diffused and only the best-scoring one is meshed.
+    """
+
+    def __init__(
+        self,
+        image_url: str,
+        webhook_url: str,
+        session_id: str,
+        asset_id: str,
+        remesh: bool = False,
+        octree_resolution: int = None,
+        mc_level: float = MC_LEVEL,
+        bounds: float = BOUNDS,
+        mc_algo: str = "mc",
+        draft: bool = False,
+        quality: str = None,
+        candidates: int = 1,
+    ):
+        quality = quality or DEFAULT_QUALITY
+        if quality not in QUALITY_TIERS:
+            raise ValueError(f"Unknown quality {quality}, available: {list(QUALITY_TIERS)}")
+        if not 1 <= candidates <= MAX_CANDIDATES:
+            raise ValueError(f"candidates must be within 1..{MAX_CANDIDATES}")
+        tier = QUALITY_TIERS[quality]
+        self.image_url = image_url
+        self.webhook_url = webhook_url
+        self.session_id = session_id
+        self.asset_id = asset_id
+        self.remesh = remesh
+        self.quality = quality
+        self.scheduler = tier["scheduler"]
+        self.steps = tier["steps"]
+        self.octree_resolution = octree_resolution or tier["octree_resolution"]
+        self.mc_level = mc_level
+        self.bounds = bounds
+        self.mc_algo = mc_algo
+        self.draft = draft
+        self.candidates = candidates
+        self.seed = SEED
+        self.image = None
+        self.latents = None
+        self.grid = None
+        self.cache_key = None
+        # pending draft preview upload; settled before the final webhook so it can't overwrite it
+        self.draft_upload = None
+        self.started_at = time.monotonic()
+        # Resolved with the handler result once the job completes or fails (RunPod awaits it)
+        self.result = Future()
+
+
+def _number(job_input: dict, key: str, default, cast):
+    try:
+        return cast(job_input.get(key, default))
+    except (TypeError, ValueError):
+        raise ValueError(f"{key} must be a number") from None
+
+
+def job_from_input(job_input: dict) -> GenJob:
+    """
+    A GenJob from a RunPod `input` dict, with the checks main.py's /generate-3d and
+    /remesh apply to their request bodies. Raises ValueError with the message to return.
+    """
+    webhook_url = job_input.get("webhook_url")
+    session_id = job_input.get("session_id", "unknown-session")
+    asset_id = job_input.get("asset_id", "unknown-asset")
+    if job_input.get("remesh"):
+        # Re-decode stored latents with new mesh settings, skipping diffusion
+        octree_resolution = _number(job_input, "octree_resolution", OCTREE_RESOLUTION, int)
+        mc_algo = job_input.get("mc_algo", "mc")
+        low, high = REMESH_OCTREE_RANGE
+        if mc_algo not in MC_ALGOS or not low <= octree_resolution <= high:
+            raise ValueError(f"mc_algo must be one of {MC_ALGOS}, octree_resolution within {low}..{high}")
+        return GenJob(
+            None, webhook_url, session_id, asset_id,
+            remesh=True,
+            octree_resolution=octree_resolution,
+            mc_level=_number(job_input, "mc_level", MC_LEVEL, float),
+            bounds=_number(job_input, "bounds", BOUNDS, float),
+            mc_algo=mc_algo,
+        )
+    if not job_input.get("image_url"):
+        raise ValueError("Missing image_url")
+    if job_input.get("quality") not in (None, *QUALITY_TIERS):
+        raise ValueError(f"quality must be one of {list(QUALITY_TIERS)}")
+    candidates = _number(job_input, "candidates", 1, int)
+    if not 1 <= candidates <= MAX_CANDIDATES:
+        raise ValueError(f"candidates must be within 1..{MAX_CANDIDATES}")
+    return GenJob(
+        job_input["image_url"], webhook_url, session_id, asset_id,
+        draft=bool(job_input.get("draft")),
+        quality=job_input.get("quality"),
+        candidates=candidates,
+    )
+
+
+def export_stl(mesh_obj) -> io.BytesIO:
+    """Binary STL of one surface extractor output, straight into memory (no file on disk)."""
+    if mesh_obj is None:
+        raise Exception("No mesh generated")
+    # Convert to trimesh for export (it's often a custom mesh type)
+    try:
+        from hy3dgen.shapegen.pipelines import export_to_trimesh
+        mesh = export_to_trimesh(mesh_obj)
+    except Exception as e:
+        logger.warning(f"Export to trimesh failed, using raw mesh: {e}")
+        mesh = mesh_obj
+    mesh_buffer = io.BytesIO()
+    mesh.export(mesh_buffer, file_type='stl')
+    return mesh_buffer
+
+
+def download_image(url: str) -> Image.Image:
+    logger.info(f"Downloading image: {url}")
+    resp = HTTP.get(url, timeout=DOWNLOAD_TIMEOUT)
+    if resp.status_code != 200:
+        raise Exception(f"Failed to download image: {resp.status_code}")
+    # Return raw Image, do not convert to RGB yet
+    return Image.open(io.BytesIO(resp.content))
+
+
+def preprocess_image(raw_image: Image.Image) -> Image.Image:
+    """Remove the background and centre the subject on the RGBA canvas Hunyuan3D expects."""
+    if not REMBG_AVAILABLE:
+        return raw_image.convert("RGB")
+
+    logger.info("[REMBG] Running isnet-general-use background removal...")
+    rgba_image = remove(raw_image, session=REMBG_SESSION)
+
+    # ✅ VERIFICATION STEP: Check how well rembg removed the background
+    verify_data = np.array(rgba_image)
+    total_pixels = verify_data.shape[0] * verify_data.shape[1]
+    transparent_pixels = np.sum(verify_data[:, :, 3] < 10)   # near-fully transparent
+    opaque_pixels = np.sum(verify_data[:, :, 3] > 245)        # near-fully opaque (object)
+    semi_pixels = total_pixels - transparent_pixels - opaque_pixels  # fringe/semi
+    transparent_pct = (transparent_pixels / total_pixels) * 100
+    opaque_pct = (opaque_pixels / total_pixels) * 100
+    semi_pct = (semi_pixels / total_pixels) * 100
+    logger.info(f"[REMBG-VERIFY] Transparent BG: {transparent_pct:.1f}% | Solid Subject: {opaque_pct:.1f}% | Fringe: {semi_pct:.1f}%")
+
+    if transparent_pct < 20:
+        logger.warning(f"[REMBG-VERIFY] ⚠️ WARNING: Only {transparent_pct:.1f}% of pixels are transparent — background removal may have failed! Dark gradient BG detected?")
+    elif transparent_pct > 50:
+        logger.info(f"[REMBG-VERIFY] ✅ Good isolation: {transparent_pct:.1f}% transparent background.")
+
+    # 1. 🔍 Strict Alpha Thresholding
+    # Kill ALL fringe pixels early. If it's not mostly solid, it's gone.
+    data = np.array(rgba_image)
+    alpha = data[:, :, 3]
+    data[:, :, 3] = np.where(alpha < 200, 0, 255)  # Strict binary: 0 or 255
+    rgba_image = Image.fromarray(data)
+
+    # 2. 🧹 Super-Clear Borders (20px border wipe)
+    w, h = rgba_image.size
+    draw = ImageDraw.Draw(rgba_image)
+    border = 20
+    draw.rectangle([0, 0, w, border], fill=(0,0,0,0))
+    draw.rectangle([0, h-border, w, h], fill=(0,0,0,0))
+    draw.rectangle([0, 0, border, h], fill=(0,0,0,0))
+    draw.rectangle([w-border, 0, w, h], fill=(0,0,0,0))
+
+    # 3. 🎯 Tight Bounding Box
+    bbox = rgba_image.getbbox()
+    if bbox:
+        rgba_image = rgba_image.crop(bbox)
+
+    # 4. 📏 Safe Scaling (75% canvas fill to maximize padding)
+    max_size = 512
+    side_len = int(max_size * 0.75)  # 25% total padding
+    w, h = rgba_image.size
+    # Protect against divide by zero if image becomes empty
+    if w > 0 and h > 0:
+        scale = side_len / max(w, h)
+        new_w, new_h = int(w * scale), int(h * scale)
+        rgba_image = rgba_image.resize((new_w, new_h), Image.Resampling.LANCZOS)
+    else:
+        new_w, new_h = w, h
+
+    # 5. 🖼️ Centre subject on a TRANSPARENT canvas (NOT white!)
+    # CRITICAL: alpha=0 background tells Hunyuan3D "this is empty space".
+    # A solid white (alpha=255) background gets interpreted as geometry
+    # → extruded into the box/wall artifact we want to eliminate.
+    canvas = Image.new("RGBA", (max_size, max_size), (0, 0, 0, 0))  # fully transparent
+    paste_x = (max_size - new_w) // 2
+    paste_y = (max_size - new_h) // 2
+    canvas.paste(rgba_image, (paste_x, paste_y), rgba_image)
+
+    # 6. Keep as RGBA — pass the transparent image directly to Hunyuan3D.
+    # The alpha channel lets the pipeline know exactly which pixels are
+    # subject (α=255) vs background (α=0). No RGB conversion = no box artifact.
+    final_data = np.array(canvas)
+    final_transparent = np.sum(final_data[:, :, 3] < 10)
+    final_opaque = np.sum(final_data[:, :, 3] > 245)
+    final_total = max_size * max_size
+    logger.info(f"[REMBG-VERIFY] ✅ Final RGBA canvas — Transparent: {(final_transparent/final_total*100):.1f}% | Subject: {(final_opaque/final_total*100):.1f}%")
+    logger.info("[REMBG] Done — RGBA image with transparent BG ready for Hunyuan3D.")
+    return canvas
+
+
+class GenerationStages:
+    """
+    Stage handlers for the executor. `pipeline` / `vae` are attached once loaded
+    (main.py loads them in its startup hook); until then the GPU stage is skipped
+    and a fallback cube is uploaded instead.
+    """
+
+    def __init__(
+        self,
+        device: str = "cuda",
+        webhook_headers: dict = None,
+        cache: ResultCache = None,
+        latent_store: LatentStore = None,
+        checkpoint_id: str = None,
+        chunk_tuner: ChunkTuner = None,
+    ):
+        self.pipeline = None
+        self.vae = None
+        self.device = device
+        self.webhook_headers = webhook_headers or {}
+        self.cache = cache
+        self.latent_store = latent_store
+        self.checkpoint_id = checkpoint_id
+        self.chunk_tuner = chunk_tuner
+        self.executor = None
+        # draft previews upload off the GPU thread while the full diffusion runs
+        self.draft_uploads = ThreadPoolExecutor(max_workers=2, thread_name_prefix="draft-upload")
+        self._sampling_lock = threading.Lock()
+        self._sampling = {
+            "runs": 0, "steps": 0, "cfg_steps": 0, "dit_rows": 0,
+            "cache_computed": 0, "cache_skipped": 0, "last_rows_per_step": None,
+        }
+
+    def build_executor(
+        self,
+        preprocess_workers: int = 2,
+        gpu_slots: int = 1,
+        postprocess_workers: int = 2,
+        max_queue: int = 8,
+        handoff_queue: int = 2,
+        max_batch: int = 1,
+        max_wait: float = 0.0,
+    ) -> StagedExecutor:
+        self.executor = StagedExecutor([
+            Stage("preprocess", self.preprocess, workers=preprocess_workers, max_queue=max_queue),
+            Stage("gpu", self.diffuse, workers=gpu_slots, max_queue=handoff_queue,
+                  max_batch=max_batch, max_wait=max_wait),
+            Stage("postprocess", self.postprocess, workers=postprocess_workers, max_queue=handoff_queue),
+        ])
+        return self.executor
+
+    def attach(self, pipeline, vae):
+        """Hand the loaded models to the stages; the VAE joins the pipeline's residency policy."""
+        pipeline.residency.register("vae", vae)
+        self.pipeline, self.vae = pipeline, vae
+
+    def record_sampling(self, stats: dict):
+        """Accumulate a pipeline call's sampling_stats (DiT rows per step)."""
+        with self._sampling_lock:
+            self._sampling["runs"] += 1
+            for key in ("steps", "cfg_steps", "dit_rows", "cache_computed", "cache_skipped"):
+                self._sampling[key] += stats.get(key, 0)
+            self._sampling["last_rows_per_step"] = stats.get("rows_per_step")
+
+    def sampling_stats(self) -> dict:
+        with self._sampling_lock:
+            steps = self._sampling["steps"]
+            return dict(
+                self._sampling,
+                cfg_interval=list(CFG_INTERVAL),
+                cfg_uncond_reuse=CFG_UNCOND_REUSE,
+                avg_rows_per_step=round(self._sampling["dit_rows"] / steps, 3) if steps else None,
+                cfg_step_fraction=round(self._sampling["cfg_steps"] / steps, 3) if steps else None,
+            )
+
+    def timed(self, name: str):
+        return self.executor.stage(name) if self.executor is not None else nullcontext()
+
+    def fail(self, job: GenJob, error: Exception):
+        logger.error(f"Generation failed for {job.asset_id}: {error}")
+        self.settle_draft(job)
+        if job.webhook_url:
+            # Notify failure
+            try:
+                HTTP.post(job.webhook_url, data={
+                    "session_id": job.session_id,
+                    "asset_id": job.asset_id,
+                    "status": "failed",
+                    "error": str(error)
+                }, headers=self.webhook_headers, timeout=WEBHOOK_TIMEOUT)
+            except Exception as w_err:
+                logger.error(f"Failure webhook failed for {job.asset_id}: {w_err}")
+        job.image = job.latents = job.grid = None
+        if not job.result.done():
+            job.result.set_result({"error": str(error)})
+
+    def result_key(self, image: Image.Image, job: GenJob) -> str:
+        """Cache key: the exact canvas the DiT would see plus everything that changes the mesh."""
+        canvas = f"{image.mode}:{image.size}:".encode() + image.tobytes()
+        return cache_key(canvas, {
+            "scheduler": job.scheduler,
+            "steps": job.steps,
+            "guidance_scale": GUIDANCE_SCALE,
+            "cfg_interval": CFG_INTERVAL,
+            "cfg_uncond_reuse": CFG_UNCOND_REUSE,
+            "step_cache": (STEP_CACHE_THRESHOLD, STEP_CACHE_REFRESH, STEP_CACHE_MAX_SKIPS),
+            "seed": SEED,
+            "candidates": job.candidates,
+            "octree_resolution": job.octree_resolution,
+            "mc_level": MC_LEVEL,
+            "bounds": BOUNDS,
+            "checkpoint": self.checkpoint_id,
+            "weights": WEIGHT_QUANTIZATION or "fp16",
+        })
+
+    def preprocess(self, jobs):
+        """Download + rembg; cache hits are uploaded right here and skip the GPU."""
+        ready, served = [], []
+        for job in jobs:
+            if job.remesh:
+                try:
+                    self.load_latents(job)
+                    ready.append(job)
+                except Exception as e:
+                    self.fail(job, e)
+                continue
+
+            logger.info(f"Starting 3D generation for session {job.session_id}...")
+            try:
+                with self.timed("download"):
+                    raw_image = download_image(job.image_url)
+                with self.timed("rembg"):
+                    job.image = preprocess_image(raw_image)
+                if self.cache is not None:
+                    job.cache_key = self.result_key(job.image, job)
+                    cached = self.cache.get(job.cache_key)
+                    if cached is not None:
+                        logger.info(f"[CACHE] Hit for {job.asset_id} ({job.cache_key[:12]}), skipping GPU")
+                        job.image = None
+                        if self.latent_store is not None and self.latent_store.exists(job.cache_key):
+                            # the new asset can be remeshed from the original generation's latents
+                            try:
+                                self.latent_store.alias(job.cache_key, job.asset_id)
+                            except (OSError, ValueError) as e:
+                                logger.warning(f"[LATENTS] Could not alias {job.asset_id}: {e}")
+                        self.deliver(job, io.BytesIO(cached), len(cached), cached=True)
+                        served.append(job)
+                        continue
+                ready.append(job)
+            except Exception as e:
+                self.fail(job, e)
+        return ready, served
+
+    def load_latents(self, job: GenJob):
+        if self.latent_store is None or not self.latent_store.exists(job.asset_id):
+            raise Exception(f"No stored latents for asset {job.asset_id}")
+        with self.timed("latent_load"):
+            latents, meta = self.latent_store.load(job.asset_id)
+            job.latents = torch.from_numpy(np.array(latents))
+        logger.info(f"[REMESH] Loaded latents for {job.asset_id} {tuple(job.latents.shape)} (generated with {meta})")
+
+    def diffuse(self, jobs):
+        """
+        Jobs that reached the GPU together share one batched diffusion loop (with CFG)
+        per quality tier; latents are then split back out per request for the VAE and
+        volume decode.
+        Remesh jobs arrive with stored latents and only need the decode.
+        Grid logits leave on the CPU so marching cubes runs in the postprocess pool.
+        """
+        pipeline, vae = self.pipeline, self.vae
+        if pipeline is None or vae is None:
+            remeshing = [job for job in jobs if job.remesh]
+            for job in remeshing:
+                self.fail(job, Exception("Model not loaded, cannot remesh"))
+            logger.warning(f"Pipeline not loaded (pipeline={pipeline}, vae={vae}), using fallback cube.")
+            return [job for job in jobs if not job.remesh]
+
+        failed = set()
+        fresh = [job for job in jobs if not job.remesh]
+        for quality in dict.fromkeys(job.quality for job in fresh):
+            group = [job for job in fresh if job.quality == quality]
+            if not self.run_diffusion(group):
+                failed.update(id(job) for job in group)
+        jobs = [job for job in jobs if id(job) not in failed]
+
+        ready = []
+        for job in jobs:
+            try:
+                self.decode(job)
+                ready.append(job)
+            except Exception as e:
+                self.fail(job, e)
+        return ready
+
+    def run_diffusion(self, jobs) -> bool:
+        """
+        Batched DiT diffusion of jobs sharing one quality tier; sets job.latents to each
+        request's (1, 3072, 64) row. The images are encoded once and the conditioning is
+        shared by the draft pass; jobs with candidates > 1 get that many rows (one seed
+        each) and keep the best-scoring one.
+        """
+        pipeline = self.pipeline
+        tier = jobs[0]
+        logger.info(
+            f"Running HunyuanAI Inference on a batch of {len(jobs)} "
+            f"(quality={tier.quality}: {tier.scheduler}, {tier.steps} steps)..."
+        )
+        try:
+            with torch.no_grad(), self.timed("encode"):
+                cond = pipeline.encode_image([job.image for job in jobs], guidance_scale=GUIDANCE_SCALE)
+            if any(job.draft for job in jobs):
+                self.run_draft(jobs, cond)
+            generator, seeds = None, [None] * len(jobs)
+            if any(job.candidates > 1 for job in jobs):
+                cond = pipeline.repeat_cond(cond, [job.candidates for job in jobs], guidance_scale=GUIDANCE_SCALE)
+                seeds = [self.candidate_seeds(job) for job in jobs]
+                generator = [torch.Generator().manual_seed(seed) for job_seeds in seeds for seed in job_seeds]
+            with torch.no_grad(), self.timed("diffusion"):
+                # 1. Pipeline call (DiT diffusion -> raw latents), one row per request
+                logger.info(f"Step 1: Pipeline call started (device={self.device})...")
+                sampling = {}
+                latents = pipeline(
+                    cond=cond,
+                    num_inference_steps=tier.steps,
+                    guidance_scale=GUIDANCE_SCALE,
+                    guidance_schedule=guidance_schedule(),
+                    sampling_stats=sampling,
+                    step_cache=make_step_cache(),
+                    scheduler=tier.scheduler,
+                    generator=generator,
+                    enable_pbar=False
+                )
+                self.record_sampling(sampling)
+                if "cache_skipped" in sampling:
+                    logger.info(
+                        f"[STEPCACHE] {[job.asset_id for job in jobs]}: computed {sampling['cache_computed']}, "
+                        f"skipped {sampling['cache_skipped']} of {sampling['steps']} steps"
+                    )
+                logger.info(f"Step 1 Complete. Latents shape: {latents.shape}")
+        except Exception as e:
+            for job in jobs:
+                self.fail(job, e)
+            return False
+
+        for job, job_latents, job_seeds in zip(jobs, latents.split([job.candidates for job in jobs], dim=0), seeds):
+            job.image = None
+            best = self.select_candidate(job, job_latents) if job.candidates > 1 else 0
+            job.latents = job_latents[best:best + 1]
+            if job_seeds is not None:
+                job.seed = job_seeds[best]
+        return True
+
+    def candidate_seeds(self, job: GenJob):
+        """One seed per candidate, consecutive from SEED (or a random base)."""
+        base = SEED if SEED is not None else random.randrange(2 ** 31)
+        return [base + k for k in range(job.candidates)]
+
+    def select_candidate(self, job: GenJob, candidates):
+        """
+        Decode every candidate at CANDIDATE_OCTREE_RESOLUTION, score the meshes (candidates.py)
+        and return the winner's index. A failed selection keeps the first one.
+        """
+        try:
+            with self.timed("candidates"):
+                grid = self.decode_grid(candidates.to(self.device, dtype=self.pipeline.dtype), CANDIDATE_OCTREE_RESOLUTION, job.bounds)
+                meshes = self.vae.grid2mesh(
+                    grid,
+                    bounds=job.bounds,
+                    octree_resolution=CANDIDATE_OCTREE_RESOLUTION,
+                    mc_level=job.mc_level
+                )
+                scores = []
+                for mesh, logits in zip(meshes, grid):
+                    mesh = trimesh.Trimesh(mesh.mesh_v, mesh.mesh_f) if mesh is not None else None
+                    scores.append(score_candidate(mesh, (logits > job.mc_level).numpy()))
+            best = pick_best(scores)
+        except Exception as e:
+            logger.warning(f"[CANDIDATES] Scoring failed for {job.asset_id}, keeping the first candidate: {e}")
+            best = 0
+        else:
+            logger.info(f"[CANDIDATES] {job.asset_id}: picked {best} of {scores}")
+        return best
+
+    def run_draft(self, jobs, cond):
+        """
+        Few-step diffusion of the draft jobs' rows of the shared conditioning, decoded and
+        meshed at DRAFT_OCTREE_RESOLUTION. A failed draft only costs the preview, never the job.
+        """
+        pipeline, vae = self.pipeline, self.vae
+        drafts = [job for job in jobs if job.draft]
+        try:
+            with torch.no_grad(), self.timed("draft"):
+                if len(drafts) < len(jobs):
+                    # keep only the draft rows (and their uncond halves): repeat each 0 or 1 times
+                    cond = pipeline.repeat_cond(cond, [int(job.draft) for job in jobs], guidance_scale=GUIDANCE_SCALE)
+                latents = pipeline(
+                    cond=cond,
+                    num_inference_steps=DRAFT_STEPS,
+                    guidance_scale=GUIDANCE_SCALE,
+                    guidance_schedule=guidance_schedule(),
+                    enable_pbar=False
+                )
+                for job, job_latents in zip(drafts, latents.split(1, dim=0)):
+                    grid = self.decode_grid(job_latents, DRAFT_OCTREE_RESOLUTION, job.bounds)
+                    meshes = vae.grid2mesh(
+                        grid,
+                        bounds=job.bounds,
+                        octree_resolution=DRAFT_OCTREE_RESOLUTION,
+                        mc_level=job.mc_level
+                    )
+                    job.draft_upload = self.draft_uploads.submit(self.upload_draft, job, export_stl(meshes[0]))
+        except Exception as e:
+            logger.warning(f"[DRAFT] Draft pass failed, continuing with the full result: {e}")
+
+    def upload_draft(self, job: GenJob, mesh_buffer: io.BytesIO):
+        try:
+            self.upload(job, mesh_buffer, "draft")
+        except Exception as e:
+            logger.warning(f"[DRAFT] Draft upload failed for {job.asset_id}: {e}")
+
+    def settle_draft(self, job: GenJob):
+        """
+        Drop the draft upload if it hasn't started, otherwise wait for it, so the Worker
+        never receives the preview after the final status (it would replace the mesh).
+        """
+        upload, job.draft_upload = job.draft_upload, None
+        if upload is not None and not upload.cancel():
+            upload.result()
+
+    def decode_grid(self, latents, octree_resolution: int, bounds: float):
+        """
+        VAE forward + volume decode of raw DiT latents into CPU grid logits, with the
+        chunk_tuner's size for this resolution (halved and retried on OOM).
+        """
+        pipeline, vae = self.pipeline, self.vae
+        with torch.no_grad(), pipeline.residency.use("vae"):
+            # 1b. CRITICAL: Run VAE forward pass (post_kl + transformer)
+            # Raw pipeline latents must be processed by ShapeVAE before
+            # being passed to the volume decoder.
+            latents = latents / vae.scale_factor
+            latents = vae(latents)
+
+            # 2. Volume decode — mc_level=-1/512 is Hunyuan3D's calibrated isovalue
+            logger.info(f"Step 2: Volume decoding started (octree_resolution={octree_resolution})...")
+            volume_decode = self._volume_decode(latents, octree_resolution, bounds)
+            if self.chunk_tuner is None:
+                return volume_decode(NUM_CHUNKS).cpu()
+            decoder = type(vae.volume_decoder).__name__
+            return self.chunk_tuner.run(volume_decode, self.device, octree_resolution, decoder).cpu()
+
+    def _volume_decode(self, latents, octree_resolution: int, bounds: float):
+        def volume_decode(num_chunks: int):
+            return self.vae.latents2grid(
+                latents,
+                bounds=bounds,
+                octree_resolution=octree_resolution,
+                num_chunks=num_chunks
+            )
+        return volume_decode
+
+    def tune_chunks(self, latents, octree_resolution: int, bounds: float = BOUNDS) -> dict:
+        """Probe the decode chunk sizes for one resolution on raw DiT latents (warm-up)."""
+        vae = self.vae
+        with torch.no_grad(), self.pipeline.residency.use("vae"):
+            latents = vae(latents / vae.scale_factor)
+            decoder = type(vae.volume_decoder).__name__
+            return self.chunk_tuner.tune(self._volume_decode(latents, octree_resolution, bounds),
+                                         self.device, octree_resolution, decoder)
+
+    def decode(self, job: GenJob):
+        with self.timed("decode"):
+            job_latents = job.latents.to(self.device, dtype=self.pipeline.dtype)
+            # keep the raw latents (CPU) for the store; remesh jobs already came from it
+            job.latents = job_latents.cpu() if self.latent_store is not None and not job.remesh else None
+            job.grid = self.decode_grid(job_latents, job.octree_resolution, job.bounds)
+
+    def postprocess(self, jobs):
+        for job in jobs:
+            try:
+                self.finish(job)
+            except Exception as e:
+                self.fail(job, e)
+        return None
+
+    def finish(self, job: GenJob):
+        """Marching cubes on the CPU grid, STL export, cache store and upload to the Worker webhook."""
+        generated = job.grid is not None
+        if job.latents is not None:
+            # a full disk or an asset_id the store rejects must not cost the finished mesh
+            try:
+                with self.timed("latent_save"):
+                    self.latent_store.save(job.asset_id, job.latents.numpy(), {
+                        "quality": job.quality,
+                        "scheduler": job.scheduler,
+                        "steps": job.steps,
+                        "guidance_scale": GUIDANCE_SCALE,
+                        "seed": job.seed,
+                        "checkpoint": self.checkpoint_id,
+                        "image_url": job.image_url,
+                    })
+                    if job.cache_key is not None:
+                        self.latent_store.alias(job.asset_id, job.cache_key)
+            except (OSError, ValueError) as e:
+                logger.warning(f"[LATENTS] Could not store latents for {job.asset_id}: {e}")
+            job.latents = None
+        if generated:
+            grid = job.grid
+            extractor = None
+            if job.mc_algo != "mc":
+                from hy3dgen.shapegen.models.autoencoders import SurfaceExtractors
+                # dmc (diso) runs on the GPU
+                extractor = SurfaceExtractors[job.mc_algo]()
+                grid = grid.to(self.device)
+            with self.timed("surface"):
+                meshes = self.vae.grid2mesh(
+                    grid,
+                    surface_extractor=extractor,
+                    bounds=job.bounds,
+                    octree_resolution=job.octree_resolution,
+                    mc_level=job.mc_level
+                )
+            job.grid = None
+            mesh_buffer = export_stl(meshes[0] if isinstance(meshes, list) else meshes)
+        else:
+            mesh_buffer = io.BytesIO()
+            trimesh.creation.box(extents=[1, 1, 1]).export(mesh_buffer, file_type='stl')
+
+        mesh_size = mesh_buffer.tell()
+        mesh_buffer.seek(0)
+        logger.info(f"Mesh generated for {job.asset_id}: {mesh_size} bytes")
+
+        # never cache the fallback cube; remeshes are not keyed by canvas
+        if generated and self.cache is not None and job.cache_key is not None:
+            try:
+                self.cache.put(job.cache_key, mesh_buffer.getbuffer())
+            except OSError as e:
+                logger.warning(f"[CACHE] Could not store {job.asset_id}: {e}")
+
+        self.deliver(job, mesh_buffer, mesh_size)
+
+    def upload(self, job: GenJob, mesh_buffer: io.BytesIO, status: str = "completed"):
+        # 3. Call Webhook back at the Worker
+        if not job.webhook_url:
+            return
+        mesh_buffer.seek(0)
+        logger.info(f"Uploading {status} STL to Webhook: {job.webhook_url}")
+        with self.timed("upload"):
+            r = HTTP.post(
+                job.webhook_url,
+                files={"file": (f"{job.asset_id}.stl", mesh_buffer, "model/stl")},
+                data={
+                    "session_id": job.session_id,
+                    "asset_id": job.asset_id,
+                    "status": status
+                },
+                headers=self.webhook_headers,
+                timeout=WEBHOOK_TIMEOUT
+            )
+        logger.info(f"Webhook response: {r.status_code}")
+        if r.status_code != 200:
+            logger.warning(f"Non-200 webhook response: {r.text[:500]}")
+
+    def deliver(self, job: GenJob, mesh_buffer: io.BytesIO, mesh_size: int, cached: bool = False):
+        self.settle_draft(job)
+        self.upload(job, mesh_buffer)
+        job.result.set_result({
+            "status": "success",
+            "message": "Mesh generated and sent via webhook",
+            "duration": time.monotonic() - job.started_at,
+            "mesh_size": mesh_size,
+            "cached": cached,
+        })
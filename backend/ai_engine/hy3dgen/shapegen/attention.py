@@ -0,0 +1,229 @@
+# Open Source Model Licensed under the Apache License Version 2.0
+# and Other Licenses of the Third-Party Components therein:
+# The below Model in this distribution may have been modified by THL A29 Limited
+# ("Tencent Modifications"). All Tencent Modifications are Copyright (C) 2024 THL A29 Limited.
+
+# Copyright (C) 2024 THL A29 Limited, a Tencent company.  All rights reserved.
+# The below software and/or models in this distribution may have been
+# modified by THL A29 Limited ("Tencent Modifications").
+# All Tencent Modifications are Copyright (C) THL A29 Limited.
+
+# Hunyuan 3D is licensed under the TENCENT HUNYUAN NON-COMMERCIAL LICENSE AGREEMENT
+# except for the third-party components listed below.
+# Hunyuan 3D does not impose any additional limitations beyond what is outlined
+# in the repsective licenses of these third-party components.
+# Users must comply with all terms and conditions of original licenses of these third-party
+# components and must ensure that the usage of the third party components adheres to
+# all relevant laws and regulations.
+
+# For avoidance of doubts, Hunyuan 3D means the large language models and
+# their software and algorithms, including trained model weights, parameters (including
+# optimizer states), machine-learning model code, inference-enabling code, training-enabling code,
+# fine-tuning enabling code and other elements of the foregoing made publicly available
+# by Tencent in accordance with TENCENT HUNYUAN COMMUNITY LICENSE AGREEMENT.
+
+"""
+One attention backend registry for the DiT, the VAE self-attention and the geo_decoder
+cross-attention. Callers go through `scaled_dot_product_attention(q, k, v, site)` with
+[B, H, L, D] tensors; the backend is, in order of precedence:
+
+    the caller's explicit `backend` (e.g. the DiT's attention_mode)
+    a backend forced for the site (`force_backend`, the *_USE_SAGEATTN env vars)
+    the micro-benchmark winner for that exact shape (`autotune`)
+    the site's most frequent winner, else 'sdpa'
+
+Until `autotune` runs, every distinct shape seen (up to MAX_TUNED_SHAPES per site) is
+recorded so the startup warm-up pass doubles as the list of shapes to benchmark.
+
+Backends: 'sdpa' (torch), 'chunked' (sdpa over ATTENTION_CHUNK query rows at a time, for
+the geo_decoder's long query sets), and, when installed and on CUDA in fp16/bf16,
+'sage' (sageattention), 'flash' (flash-attn) and 'xformers'.
+"""
+
+import logging
+import os
+import time
+from collections import Counter
+
+import torch
+import torch.nn.functional as F
+
+logger = logging.getLogger(__name__)
+
+ATTENTION_CHUNK = int(os.environ.get('ATTENTION_CHUNK', '4096'))
+MAX_TUNED_SHAPES = 16
+
+
+def _sdpa(q, k, v):
+    return F.scaled_dot_product_attention(q, k, v)
+
+
+def _chunked(q, k, v):
+    if q.shape[-2] <= ATTENTION_CHUNK:
+        return F.scaled_dot_product_attention(q, k, v)
+    return torch.cat([
+        F.scaled_dot_product_attention(q[:, :, i:i + ATTENTION_CHUNK], k, v)
+        for i in range(0, q.shape[-2], ATTENTION_CHUNK)
+    ], dim=-2)
+
+
+def _sage(q, k, v):
+    from sageattention import sageattn
+    return sageattn(q, k, v, tensor_layout='HND')
+
+
+def _flash(q, k, v):
+    from flash_attn import flash_attn_func
+    return flash_attn_func(q.transpose(1, 2), k.transpose(1, 2), v.transpose(1, 2)).transpose(1, 2)
+
+
+def _xformers(q, k, v):
+    from xformers.ops import memory_efficient_attention
+    return memory_efficient_attention(q.transpose(1, 2), k.transpose(1, 2), v.transpose(1, 2)).transpose(1, 2)
+
+
+def _installed(module):
+    try:
+        __import__(module)
+        return True
+    except ImportError:
+        return False
+
+
+def _cuda_half(module, head_dims=None):
+    def available(device, dtype, head_dim):
+        return (torch.device(device).type == 'cuda' and dtype in (torch.float16, torch.bfloat16)
+                and (head_dims is None or head_dim in head_dims) and _installed(module))
+    return available
+
+
+# name -> (fn(q, k, v) on [B, H, L, D], available(device, dtype, head_dim))
+ATTENTION_BACKENDS = {
+    'sdpa': (_sdpa, lambda device, dtype, head_dim: True),
+    'chunked': (_chunked, lambda device, dtype, head_dim: True),
+    'sage': (_sage, _cuda_half('sageattention', (64, 96, 128))),
+    'flash': (_flash, _cuda_half('flash_attn')),
+    'xformers': (_xformers, _cuda_half('xformers')),
+}
+# legacy attention_mode values
+ATTENTION_MODE_ALIASES = {'sageattn': 'sage'}
+
+_forced = {}
+_decisions = {}
+_site_defaults = {}
+_timings = {}
+_seen = {}
+_recording = True
+
+
+def resolve_backend(name):
+    """Registry key for a backend or attention_mode; None for 'auto'."""
+    if name in (None, 'auto'):
+        return None
+    name = ATTENTION_MODE_ALIASES.get(name, name)
+    if name not in ATTENTION_BACKENDS:
+        raise ValueError(f'Unsupported attention backend {name}, available: {["auto", *ATTENTION_BACKENDS]}')
+    return name
+
+
+def force_backend(site, name):
+    """Pin `site` to a backend (None un-pins it)."""
+    name = resolve_backend(name)
+    if name is None:
+        _forced.pop(site, None)
+    else:
+        _forced[site] = name
+
+
+def _shape_key(site, q, k):
+    return site, tuple(q.shape), tuple(k.shape), q.dtype, q.device.type
+
+
+def scaled_dot_product_attention(q, k, v, site='default', backend=None):
+    name = backend or _forced.get(site)
+    if name is None:
+        key = _shape_key(site, q, k)
+        name = _decisions.get(key)
+        if name is None:
+            if _recording and len(_seen.setdefault(site, {})) < MAX_TUNED_SHAPES:
+                _seen[site][key] = q.device
+            name = _site_defaults.get(site, 'sdpa')
+    return ATTENTION_BACKENDS[name][0](q, k, v)
+
+
+def _time(fn, q, k, v, repeats):
+    sync = torch.cuda.synchronize if q.device.type == 'cuda' else (lambda: None)
+    fn(q, k, v)
+    sync()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn(q, k, v)
+    sync()
+    return (time.perf_counter() - start) / repeats
+
+
+@torch.no_grad()
+def autotune(repeats=5, atol=2e-2):
+    """
+    Benchmark every available backend on each recorded shape, keep the fastest one whose
+    output matches sdpa within `atol`, and stop recording. Returns attention_report().
+    """
+    global _recording
+    for site, shapes in _seen.items():
+        wins = Counter()
+        for key, device in shapes.items():
+            _, q_shape, k_shape, dtype, _ = key
+            q = torch.randn(q_shape, device=device, dtype=dtype)
+            k = torch.randn(k_shape, device=device, dtype=dtype)
+            v = torch.randn(k_shape, device=device, dtype=dtype)
+            reference = _sdpa(q, k, v)
+            times = {}
+            for name, (fn, available) in ATTENTION_BACKENDS.items():
+                if not available(device, dtype, q_shape[-1]):
+                    continue
+                try:
+                    if name != 'sdpa' and not torch.allclose(fn(q, k, v), reference, atol=atol):
+                        logger.warning(f'[ATTENTION] {name} disagrees with sdpa on {site} {q_shape}, skipped')
+                        continue
+                    times[name] = _time(fn, q, k, v, repeats)
+                except Exception as e:
+                    logger.warning(f'[ATTENTION] {name} failed on {site} {q_shape}: {e}')
+            if not times:
+                continue
+            best = min(times, key=times.get)
+            _decisions[key] = best
+            _timings[key] = {name: round(seconds * 1e3, 3) for name, seconds in times.items()}
+            wins[best] += 1
+            logger.info(f'[ATTENTION] {site} q={q_shape} kv={k_shape}: {best} ({_timings[key]} ms)')
+        if wins:
+            _site_defaults[site] = wins.most_common(1)[0][0]
+    _seen.clear()
+    _recording = False
+    return attention_report()
+
+
+def attention_report():
+    """Forced backends, per-site defaults and per-shape benchmark decisions (for /health)."""
+    decisions = []
+    for key, backend in _decisions.items():
+        site, q_shape, k_shape, dtype, _ = key
+        decisions.append({
+            'site': site, 'q': list(q_shape), 'kv': list(k_shape), 'dtype': str(dtype).replace('torch.', ''),
+            'backend': backend, 'ms': _timings.get(key, {}),
+        })
+    return {
+        'forced': dict(_forced),
+        'site_defaults': dict(_site_defaults),
+        'tuned': not _recording,
+        'decisions': decisions,
+    }
+
+
+def reset():
+    """Forget decisions and start recording again (tests, or re-tuning after a device change)."""
+    global _recording
+    _decisions.clear()
+    _site_defaults.clear()
+    _timings.clear()
+    _seen.clear()
+    _recording = True
@@ -0,0 +1,233 @@
+# Open Source Model Licensed under the Apache License Version 2.0
+# and Other Licenses of the Third-Party Components therein:
+# The below Model in this distribution may have been modified by THL A29 Limited
+# ("Tencent Modifications"). All Tencent Modifications are Copyright (C) 2024 THL A29 Limited.
+
+# Copyright (C) 2024 THL A29 Limited, a Tencent company.  All rights reserved.
+# The below software and/or models in this distribution may have been
+# modified by THL A29 Limited ("Tencent Modifications").
+# All Tencent Modifications are Copyright (C) THL A29 Limited.
+
+# Hunyuan 3D is licensed under the TENCENT HUNYUAN NON-COMMERCIAL LICENSE AGREEMENT
+# except for the third-party components listed below.
+# Hunyuan 3D does not impose any additional limitations beyond what is outlined
+# in the repsective licenses of these third-party components.
+# Users must comply with all terms and conditions of original licenses of these third-party
+# components and must ensure that the usage of the third party components adheres to
+# all relevant laws and regulations.
+
+# For avoidance of doubts, Hunyuan 3D means the large language models and
+# their software and algorithms, including trained model weights, parameters (including
+# optimizer states), machine-learning model code, inference-enabling code, training-enabling code,
+# fine-tuning enabling code and other elements of the foregoing made publicly available
+# by Tencent in accordance with TENCENT HUNYUAN COMMUNITY LICENSE AGREEMENT.
+
+"""
+Pre-converted checkpoint cache.
+
+Every cold start used to repeat the same work on the single-file checkpoint: counting
+blocks to pick dit_config.yaml or dit_config_mini.yaml, probing for guidance_in,
+applying the V2.1 key renames and casting to the pipeline dtype. `convert_checkpoint`
+does it once and writes, under `<cache_dir>/<checkpoint stem>/`:
+
+    model.safetensors, vae.safetensors, conditioner.safetensors   renamed, cast, unprefixed keys
+    manifest.json                                                  resolved config + source fingerprint
+
+`load_manifest` accepts the cache only if it was converted from the same checkpoint: same
+size and the same sha256. The recorded hash stands for the file while its (inode, mtime_ns,
+size) stamp is unchanged; any other stamp (e.g. the file was copied or replaced) is hashed
+again, and a match records the new stamp so the next start skips the hashing.
+
+    python -m hy3dgen.shapegen.conversion models/hunyuan3d-dit-v2_fp16.safetensors --cache-dir cache/converted
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import time
+
+import torch
+import yaml
+
+from hy3dgen.shapegen.loading import CheckpointReader
+
+logger = logging.getLogger(__name__)
+
+CONVERTED_VERSION = 1
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'configs')
+# Mapping for V2.1 / Standard naming renames (parameter name -> checkpoint key)
+KEY_MAPPING = {
+    "latent_in.weight": "x_embedder.weight",
+    "latent_in.bias": "x_embedder.bias",
+    "time_in.in_layer.weight": "t_embedder.mlp.0.weight",
+    "time_in.in_layer.bias": "t_embedder.mlp.0.bias",
+    "time_in.out_layer.weight": "t_embedder.mlp.2.weight",
+    "time_in.out_layer.bias": "t_embedder.mlp.2.bias",
+}
+
+
+def resolve_config(model_keys):
+    """The pipeline config for a checkpoint whose DiT has `model_keys`."""
+    block_nums = set()
+    for k in model_keys:
+        if k.startswith('single_blocks.') or k.startswith('blocks.'):
+            block_nums.add(int(k.split('.')[1]))
+    name = 'dit_config_mini.yaml' if len(block_nums) < 17 else 'dit_config.yaml'
+    logger.info(f"Model has {len(block_nums)} blocks, setting config to {name}")
+    with open(os.path.join(CONFIG_DIR, name), 'r') as f:
+        config = yaml.safe_load(f)
+
+    if "guidance_in.in_layer.bias" in model_keys:
+        logger.info("Model has guidance_in, setting guidance_embed to True")
+        config['model']['params']['guidance_embed'] = True
+        config['conditioner']['params']['main_image_encoder']['kwargs']['has_guidance_embed'] = True
+    return config
+
+
+def renamed_keys(keys):
+    """{checkpoint key: parameter name} with KEY_MAPPING applied where only the old name exists."""
+    keys = set(keys)
+    renames = {mapped: name for name, mapped in KEY_MAPPING.items() if name not in keys and mapped in keys}
+    return {key: renames.get(key, key) for key in keys}
+
+
+def file_sha256(path, chunk=64 * 2 ** 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _fingerprint(path):
+    stat = os.stat(path)
+    return {'path': os.path.basename(path), 'size': stat.st_size, 'mtime': int(stat.st_mtime),
+            'mtime_ns': stat.st_mtime_ns, 'inode': stat.st_ino}
+
+
+def _same_stamp(recorded, source):
+    """Whether `recorded`'s sha256 still describes the file fingerprinted as `source`."""
+    return all(recorded.get(key) == source[key] for key in ('inode', 'mtime_ns', 'size'))
+
+
+def converted_dir(cache_dir, ckpt_path):
+    return os.path.join(cache_dir, os.path.splitext(os.path.basename(ckpt_path))[0])
+
+
+def _dtype_name(dtype):
+    return str(dtype).replace('torch.', '')
+
+
+def _write_manifest(target, manifest):
+    path = os.path.join(target, 'manifest.json')
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, path)
+
+
+def convert_checkpoint(ckpt_path, cache_dir, dtype=torch.float16, use_safetensors=True):
+    """Write the per-component files and manifest for `ckpt_path`; returns the manifest."""
+    import safetensors.torch
+
+    start = time.perf_counter()
+    target = converted_dir(cache_dir, ckpt_path)
+    os.makedirs(target, exist_ok=True)
+    source = _fingerprint(ckpt_path)
+    source['sha256'] = file_sha256(ckpt_path)
+    reader = CheckpointReader(ckpt_path, use_safetensors=use_safetensors)
+
+    components = {}
+    for component in sorted(reader.components):
+        tensors = {}
+        for key, name in renamed_keys(reader.keys(component)).items():
+            value = reader.get(component, key)
+            tensors[name] = (value.to(dtype) if value.is_floating_point() else value).contiguous()
+        path = os.path.join(target, f'{component}.safetensors')
+        tmp = f'{path}.{os.getpid()}.tmp'
+        safetensors.torch.save_file(tensors, tmp)
+        os.replace(tmp, path)
+        components[component] = {'file': os.path.basename(path), 'size': os.path.getsize(path), 'tensors': len(tensors)}
+        del tensors
+
+    manifest = {
+        'version': CONVERTED_VERSION,
+        'dtype': _dtype_name(dtype),
+        'source': source,
+        'config': resolve_config(reader.keys('model')),
+        'components': components,
+    }
+    # written last, so a cache interrupted mid-conversion is never picked up
+    _write_manifest(target, manifest)
+    logger.info(f'Converted {ckpt_path} to {target} in {time.perf_counter() - start:.1f}s')
+    return manifest
+
+
+def load_manifest(cache_dir, ckpt_path, dtype=torch.float16):
+    """The manifest of a valid cache converted from `ckpt_path` to `dtype`, else None."""
+    target = converted_dir(cache_dir, ckpt_path)
+    try:
+        with open(os.path.join(target, 'manifest.json')) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    source = _fingerprint(ckpt_path)
+    restamped = not _same_stamp(manifest.get('source', {}), source)
+    if manifest.get('version') != CONVERTED_VERSION or manifest.get('dtype') != _dtype_name(dtype):
+        reason = 'version or dtype changed'
+    elif manifest['source']['size'] != source['size']:
+        reason = 'source size changed'
+    elif restamped and manifest['source']['sha256'] != file_sha256(ckpt_path):
+        reason = 'source sha256 changed'
+    elif any(
+        not os.path.exists(os.path.join(target, entry['file']))
+        or os.path.getsize(os.path.join(target, entry['file'])) != entry['size']
+        for entry in manifest['components'].values()
+    ):
+        reason = 'component file missing or truncated'
+    else:
+        if restamped:
+            # same bytes under a new stamp: record it so the next load trusts the hash again
+            manifest['source'] = dict(source, sha256=manifest['source']['sha256'])
+            try:
+                _write_manifest(target, manifest)
+            except OSError as e:
+                logger.warning(f'Could not update {target}/manifest.json: {e}')
+        return manifest
+    logger.info(f'Converted checkpoint {target} is stale ({reason})')
+    return None
+
+
+def converted_reader(cache_dir, ckpt_path, manifest):
+    """A CheckpointReader over the per-component files of `manifest`."""
+    target = converted_dir(cache_dir, ckpt_path)
+    reader = CheckpointReader()
+    for component, entry in manifest['components'].items():
+        reader.add(os.path.join(target, entry['file']), component=component)
+    return reader
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pre-convert a single-file checkpoint for fast cold starts.')
+    parser.add_argument('ckpt_path')
+    parser.add_argument('--cache-dir', default=os.environ.get('CONVERTED_CACHE_DIR', 'cache/converted'))
+    parser.add_argument('--dtype', default='float16', choices=['float16', 'bfloat16', 'float32'])
+    parser.add_argument('--force', action='store_true', help='convert even if a valid cache exists')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    dtype = getattr(torch, args.dtype)
+    use_safetensors = args.ckpt_path.endswith('.safetensors')
+    if not args.force and load_manifest(args.cache_dir, args.ckpt_path, dtype) is not None:
+        print(f'{converted_dir(args.cache_dir, args.ckpt_path)} is up to date')
+        return
+    manifest = convert_checkpoint(args.ckpt_path, args.cache_dir, dtype, use_safetensors)
+    for component, entry in manifest['components'].items():
+        print(f"{component:<12} {entry['tensors']:>6} tensors {entry['size'] / 2 ** 30:>7.2f} GB")
+
+
+if __name__ == '__main__':
+    main()
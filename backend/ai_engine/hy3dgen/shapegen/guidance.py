@@ -0,0 +1,77 @@
+# Open Source Model Licensed under the Apache License Version 2.0
+# and Other Licenses of the Third-Party Components therein:
+# The below Model in this distribution may have been modified by THL A29 Limited
+# ("Tencent Modifications"). All Tencent Modifications are Copyright (C) 2024 THL A29 Limited.
+
+# Copyright (C) 2024 THL A29 Limited, a Tencent company.  All rights reserved.
+# The below software and/or models in this distribution may have been
+# modified by THL A29 Limited ("Tencent Modifications").
+# All Tencent Modifications are Copyright (C) THL A29 Limited.
+
+# Hunyuan 3D is licensed under the TENCENT HUNYUAN NON-COMMERCIAL LICENSE AGREEMENT
+# except for the third-party components listed below.
+# Hunyuan 3D does not impose any additional limitations beyond what is outlined
+# in the repsective licenses of these third-party components.
+# Users must comply with all terms and conditions of original licenses of these third-party
+# components and must ensure that the usage of the third party components adheres to
+# all relevant laws and regulations.
+
+# For avoidance of doubts, Hunyuan 3D means the large language models and
+# their software and algorithms, including trained model weights, parameters (including
+# optimizer states), machine-learning model code, inference-enabling code, training-enabling code,
+# fine-tuning enabling code and other elements of the foregoing made publicly available
+# by Tencent in accordance with TENCENT HUNYUAN COMMUNITY LICENSE AGREEMENT.
+
+"""
+Classifier-free guidance schedules for the flow-matching loop.
+
+Full CFG runs the DiT on the conditional and the unconditional batch at every step,
+i.e. two passes per step. A GuidanceSchedule narrows that down:
+
+    interval  (lo, hi) range of sigma (0 = noise, 1 = data, the loop's t / 1000) in
+              which guidance is applied; outside it only the conditional branch runs
+    reuse     inside the interval, recompute the unconditional prediction every
+              `reuse` steps and reuse the last one in between (1 = every step)
+"""
+
+from typing import Tuple
+
+
+class GuidanceSchedule:
+    def __init__(self, interval: Tuple[float, float] = (0.0, 1.0), reuse: int = 1):
+        lo, hi = interval
+        if not 0.0 <= lo <= hi <= 1.0:
+            raise ValueError(f'CFG interval must satisfy 0 <= lo <= hi <= 1, got {interval}')
+        if reuse < 1:
+            raise ValueError(f'CFG uncond reuse must be >= 1, got {reuse}')
+        self.interval = (float(lo), float(hi))
+        self.reuse = int(reuse)
+
+    @property
+    def is_full(self) -> bool:
+        return self.interval == (0.0, 1.0) and self.reuse == 1
+
+    def applies(self, sigma: float) -> bool:
+        lo, hi = self.interval
+        return lo <= sigma <= hi
+
+    def plan(self, sigmas):
+        """
+        Per step: 'both' (cond + uncond rows), 'cond' (cond rows, reuse the cached
+        uncond prediction) or 'none' (cond rows, no guidance).
+        """
+        plan, since = [], None
+        for sigma in sigmas:
+            if not self.applies(sigma):
+                plan.append('none')
+                since = None  # a cached uncond from before the gap is stale
+            elif since is None or since >= self.reuse:
+                plan.append('both')
+                since = 1
+            else:
+                plan.append('cond')
+                since += 1
+        return plan
+
+    def __repr__(self):
+        return f'GuidanceSchedule(interval={self.interval}, reuse={self.reuse})'
@@ -0,0 +1,136 @@
+# Open Source Model Licensed under the Apache License Version 2.0
+# and Other Licenses of the Third-Party Components therein:
+# The below Model in this distribution may have been modified by THL A29 Limited
+# ("Tencent Modifications"). All Tencent Modifications are Copyright (C) 2024 THL A29 Limited.
+
+# Copyright (C) 2024 THL A29 Limited, a Tencent company.  All rights reserved.
+# The below software and/or models in this distribution may have been
+# modified by THL A29 Limited ("Tencent Modifications").
+# All Tencent Modifications are Copyright (C) THL A29 Limited.
+
+# Hunyuan 3D is licensed under the TENCENT HUNYUAN NON-COMMERCIAL LICENSE AGREEMENT
+# except for the third-party components listed below.
+# Hunyuan 3D does not impose any additional limitations beyond what is outlined
+# in the repsective licenses of these third-party components.
+# Users must comply with all terms and conditions of original licenses of these third-party
+# components and must ensure that the usage of the third party components adheres to
+# all relevant laws and regulations.
+
+# For avoidance of doubts, Hunyuan 3D means the large language models and
+# their software and algorithms, including trained model weights, parameters (including
+# optimizer states), machine-learning model code, inference-enabling code, training-enabling code,
+# fine-tuning enabling code and other elements of the foregoing made publicly available
+# by Tencent in accordance with TENCENT HUNYUAN COMMUNITY LICENSE AGREEMENT.
+
+"""
+Streaming loader for single-file checkpoints (`<component>.<param>` keys).
+
+`safetensors.torch.load_file` used to read the whole multi-GB file into host RAM, the
+keys were regrouped into nested dicts and every parameter was copied one at a time,
+so host RAM peaked at about twice the checkpoint. Here the file is memory-mapped
+(`safe_open`; `torch.load(mmap=True)` for .ckpt), only the requested components are
+touched, and each tensor goes straight from the mapping to its target device and dtype
+on a small thread pool. Every component reports its load time, bytes and the process's
+peak host RSS so far.
+"""
+
+import logging
+import os
+import time
+from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+from accelerate.utils import set_module_tensor_to_device
+
+try:
+    import resource
+except ImportError:  # Windows dev boxes: loads report no peak RSS
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+LOAD_WORKERS = int(os.environ.get('LOAD_WORKERS', '8'))
+
+
+def peak_rss_gb() -> Optional[float]:
+    """Peak resident set size of this process (Linux reports ru_maxrss in KiB), None without `resource`."""
+    if resource is None:
+        return None
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 20, 3)
+
+
+class CheckpointReader:
+    """
+    Per-tensor access to single-file checkpoints, grouped by component prefix. Further
+    files can be indexed with `add`; a file given a `component` holds unprefixed keys
+    (the per-component files of conversion.py).
+    """
+
+    def __init__(self, path=None, use_safetensors=True, component=None):
+        self.components = {}
+        if path is not None:
+            self.add(path, use_safetensors, component)
+
+    def add(self, path, use_safetensors=True, component=None):
+        if use_safetensors:
+            from safetensors import safe_open
+            handle = safe_open(path, framework='pt', device='cpu')
+            get, names = handle.get_tensor, list(handle.keys())
+        else:
+            ckpt = torch.load(path, map_location='cpu', mmap=True, weights_only=False)
+            flat = {f'{prefix}.{key}': value for prefix, state in ckpt.items() for key, value in state.items()}
+            get, names = flat.__getitem__, list(flat)
+        for name in names:
+            prefix, key = (component, name) if component else name.split('.', 1)
+            self.components.setdefault(prefix, {})[key] = (get, name)
+        return self
+
+    def __contains__(self, component):
+        return component in self.components
+
+    def keys(self, component):
+        return self.components.get(component, {}).keys()
+
+    def get(self, component, key):
+        get, name = self.components[component][key]
+        return get(name)
+
+
+def load_component(module, reader, component, device, dtype, key_mapping=None, workers=LOAD_WORKERS):
+    """
+    Fill `module`'s (meta) parameters with `reader`'s `component` tensors on `device` in
+    `dtype`. Parameters missing from the checkpoint are logged and left untouched;
+    `key_mapping` gives fallback checkpoint names for renamed parameters.
+    """
+    keys = reader.keys(component)
+    key_mapping = key_mapping or {}
+    start = time.perf_counter()
+
+    def copy(name):
+        key = name if name in keys else key_mapping.get(name)
+        if key not in keys:
+            return name, 0
+        value = reader.get(component, key).to(device)
+        set_module_tensor_to_device(module, name, device=device, dtype=dtype, value=value)
+        return None, value.numel() * value.element_size()
+
+    names = [name for name, _ in module.named_parameters()]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(copy, names))
+    if torch.device(device).type == 'cuda':
+        torch.cuda.synchronize(device)
+
+    missing = [name for name, _ in results if name is not None]
+    for name in missing:
+        logger.warning(f'Key {name} not found in checkpoint component {component}')
+    report = {
+        'seconds': round(time.perf_counter() - start, 3),
+        'gb': round(sum(size for _, size in results) / 2 ** 30, 3),
+        'tensors': len(names) - len(missing),
+        'missing': len(missing),
+        'device': str(device),
+        'peak_rss_gb': peak_rss_gb(),
+    }
+    logger.info(f'Loaded {component}: {report}')
+    return report
@@ -12,7 +12,7 @@
 # fine-tuning enabling code and other elements of the foregoing made publicly available
 # by Tencent in accordance with TENCENT HUNYUAN COMMUNITY LICENSE AGREEMENT.
 
-from hy3dgen.shapegen.models.autoencoders.attention_blocks import CrossAttentionDecoder
+from hy3dgen.shapegen.models.autoencoders.attention_blocks import CrossAttentionDecoder, DecodeSession
 from hy3dgen.shapegen.models.autoencoders.attention_processors import FlashVDMCrossAttentionProcessor, CrossAttentionProcessor, \
     FlashVDMTopMCrossAttentionProcessor
 from hy3dgen.shapegen.models.autoencoders.model import ShapeVAE, VectsetVAE
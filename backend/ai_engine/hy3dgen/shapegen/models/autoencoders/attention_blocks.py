@@ -14,23 +14,32 @@
 
 
 import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import partial
 from typing import Optional
 
 import torch
 import torch.nn as nn
 from einops import rearrange
 
+from hy3dgen.shapegen.attention import force_backend, scaled_dot_product_attention as dispatch_attention
 from hy3dgen.shapegen.models.autoencoders.attention_processors import CrossAttentionProcessor
 from hy3dgen.shapegen.utils import logger
 
-scaled_dot_product_attention = nn.functional.scaled_dot_product_attention
+# fixed first-level decode lattices whose projected query embeddings are kept, see QueryEmbeddingCache
+QUERY_EMBED_CACHE_SIZE = int(os.environ.get('QUERY_EMBED_CACHE_SIZE', '8'))
+
+# VAE self-attention goes through the shared backend registry
+scaled_dot_product_attention = partial(dispatch_attention, site='vae_self')
 
 if os.environ.get('USE_SAGEATTN', '0') == '1':
     try:
-        from sageattention import sageattn
+        import sageattention  # noqa: F401
     except ImportError:
         raise ImportError('Please install the package "sageattention" to use this USE_SAGEATTN.')
-    scaled_dot_product_attention = sageattn
+    force_backend('vae_self', 'sage')
 
 
 class FourierEmbedder(nn.Module):
@@ -199,17 +208,23 @@ class QKVMultiheadCrossAttention(nn.Module):
 
         self.attn_processor = CrossAttentionProcessor()
 
-    def forward(self, q, kv):
-        _, n_ctx, _ = q.shape
+    def split_kv(self, kv):
+        """Per-head (k, v), each (b, h, n_data, d), from the packed c_kv output."""
         bs, n_data, width = kv.shape
         attn_ch = width // self.heads // 2
-        q = q.view(bs, n_ctx, self.heads, -1)
         kv = kv.view(bs, n_data, self.heads, -1)
         k, v = torch.split(kv, attn_ch, dim=-1)
-
-        q = self.q_norm(q)
         k = self.k_norm(k)
-        q, k, v = map(lambda t: rearrange(t, 'b n h d -> b h n d', h=self.heads), (q, k, v))
+        return rearrange(k, 'b n h d -> b h n d'), rearrange(v, 'b n h d -> b h n d')
+
+    def forward(self, q, kv=None, projected=None):
+        """`projected` is a precomputed split_kv result (see DecodeSession); a batch-1 K/V is shared by all queries."""
+        bs, n_ctx, _ = q.shape
+        k, v = projected if projected is not None else self.split_kv(kv)
+        if k.shape[0] != bs:
+            k, v = k.expand(bs, -1, -1, -1), v.expand(bs, -1, -1, -1)
+        q = self.q_norm(q.view(bs, n_ctx, self.heads, -1))
+        q = rearrange(q, 'b n h d -> b h n d')
         out = self.attn_processor(self, q, k, v)
         out = out.transpose(1, 2).reshape(bs, n_ctx, -1)
         return out
@@ -243,19 +258,16 @@ class MultiheadCrossAttention(nn.Module):
             norm_layer=norm_layer,
             qk_norm=qk_norm
         )
-        self.kv_cache = kv_cache
-        self.data = None
+        if kv_cache:
+            # the old per-module cache was never reset and reused the previous mesh's K/V
+            logger.warning('kv_cache is ignored, use CrossAttentionDecoder.decode_session instead')
 
-    def forward(self, x, data):
+    def project_kv(self, data):
+        return self.attention.split_kv(self.c_kv(data))
+
+    def forward(self, x, data=None, kv=None):
         x = self.c_q(x)
-        if self.kv_cache:
-            if self.data is None:
-                self.data = self.c_kv(data)
-                logger.info('Save kv cache,this should be called only once for one mesh')
-            data = self.data
-        else:
-            data = self.c_kv(data)
-        x = self.attention(x, data)
+        x = self.attention(x, projected=kv if kv is not None else self.project_kv(data))
         x = self.c_proj(x)
         return x
 
@@ -292,8 +304,11 @@ class ResidualCrossAttentionBlock(nn.Module):
         self.ln_3 = norm_layer(width, elementwise_affine=True, eps=1e-6)
         self.mlp = MLP(width=width, expand_ratio=mlp_expand_ratio)
 
-    def forward(self, x: torch.Tensor, data: torch.Tensor):
-        x = x + self.attn(self.ln_1(x), self.ln_2(data))
+    def project_kv(self, data: torch.Tensor):
+        return self.attn.project_kv(self.ln_2(data))
+
+    def forward(self, x: torch.Tensor, data: Optional[torch.Tensor] = None, kv=None):
+        x = x + self.attn(self.ln_1(x), self.ln_2(data) if kv is None else None, kv=kv)
         x = x + self.mlp(self.ln_3(x))
         return x
 
@@ -432,6 +447,102 @@ class Transformer(nn.Module):
         return x
 
 
+class DecodeSession:
+    """
+    K/V of one latent set, projected once and shared by every geo_decoder call of a mesh
+    (all chunks and octree levels). Released when the `decode_session` block exits, so a
+    later mesh can never pick up stale keys.
+    """
+
+    def __init__(self, kv):
+        self._kv = kv
+
+    @property
+    def kv(self):
+        if self._kv is None:
+            raise RuntimeError('Decode session already released')
+        return self._kv
+
+    def release(self):
+        self._kv = None
+
+
+class QueryEmbeddingCache:
+    """
+    `query_proj(fourier_embedder(xyz))` of fixed decode lattices, reused across meshes.
+
+    The Fourier features of a point are per-axis, so the projection is a sum of one term
+    per axis: an (n, 3) lattice of n = resolution + 1 points per side is stored as three
+    fp32 (n, width) tables (the bias folded into the x table). A lattice point (i, j, k)
+    is then `x[i] + y[j] + z[k]`, a few MB per entry even for 257^3 grids. Entries are
+    keyed by (bbox_min, bbox_max, resolution, dtype, device) and kept in a small LRU
+    shared by the decode threads: lookups, inserts and eviction hold `_lock`, the tables
+    of a miss are built outside it.
+    """
+
+    def __init__(self, max_entries=QUERY_EMBED_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+
+    def _tables(self, decoder, lattice, dtype):
+        bbox_min, bbox_max, resolution = lattice
+        weight = decoder.query_proj.weight
+        key = (tuple(bbox_min), tuple(bbox_max), resolution, dtype, weight.device)
+        with self._lock:
+            if key in self.entries:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return self.entries[key]
+            self.misses += 1
+
+        embedder = decoder.fourier_embedder
+        num_freqs = embedder.num_freqs
+        axes = torch.arange(3, device=weight.device)
+        # axis of every embedding column: [xyz] + sin[x f.., y f.., z f..] + cos[...]
+        column_axis = torch.cat([axes] * embedder.include_input + [axes.repeat_interleave(num_freqs)] * 2)
+        tables = []
+        for axis in range(3):
+            # same float32 linspace as generate_dense_grid_points, rounded through the decode dtype
+            coords = torch.linspace(bbox_min[axis], bbox_max[axis], resolution + 1, dtype=torch.float32)
+            points = torch.zeros(resolution + 1, 3, device=weight.device)
+            points[:, axis] = coords.to(dtype).float().to(weight.device)
+            with torch.no_grad():
+                features = embedder(points) * (column_axis == axis)
+                tables.append(features @ weight.float().t())
+        if decoder.query_proj.bias is not None:
+            tables[0] += decoder.query_proj.bias.detach().float()
+
+        with self._lock:
+            # another thread may have built the same lattice meanwhile: keep the first copy
+            tables = self.entries.setdefault(key, tables)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return tables
+
+    def embed(self, decoder, lattice, index, dtype):
+        """
+        Projected embeddings of the lattice points with flat ij-order `index` (any shape),
+        shaped index.shape + (width,); None when the cache is disabled.
+        """
+        if self.max_entries <= 0:
+            return None
+        x, y, z = self._tables(decoder, lattice, dtype)
+        n = lattice[2] + 1
+        return (x[index // (n * n)] + y[index // n % n] + z[index % n]).to(dtype)
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self.entries), 'hits': self.hits, 'misses': self.misses}
+
+
 class CrossAttentionDecoder(nn.Module):
 
     def __init__(
@@ -473,20 +584,44 @@ class CrossAttentionDecoder(nn.Module):
         self.output_proj = nn.Linear(width, out_channels)
         self.label_type = label_type
         self.count = 0
+        self.query_cache = QueryEmbeddingCache()
 
     def set_cross_attention_processor(self, processor):
         self.cross_attn_decoder.attn.attention.attn_processor = processor
 
     def set_default_cross_attention_processor(self):
-        self.cross_attn_decoder.attn.attention.attn_processor = CrossAttentionProcessor
+        self.cross_attn_decoder.attn.attention.attn_processor = CrossAttentionProcessor()
+
+    def project_kv(self, latents):
+        if self.downsample_ratio != 1:
+            latents = self.latents_proj(latents)
+        k, v = self.cross_attn_decoder.project_kv(latents)
+        return k.contiguous(), v.contiguous()
+
+    @contextmanager
+    def decode_session(self, latents):
+        """
+        Project the K/V of `latents` once for the calls inside the block:
+
+            with geo_decoder.decode_session(latents) as session:
+                logits = geo_decoder(queries=chunk, latents=latents, kv=session.kv)
+        """
+        session = DecodeSession(self.project_kv(latents))
+        try:
+            yield session
+        finally:
+            session.release()
 
-    def forward(self, queries=None, query_embeddings=None, latents=None):
+    def forward(self, queries=None, query_embeddings=None, latents=None, kv=None):
         if query_embeddings is None:
             query_embeddings = self.query_proj(self.fourier_embedder(queries).to(latents.dtype))
         self.count += query_embeddings.shape[1]
-        if self.downsample_ratio != 1:
-            latents = self.latents_proj(latents)
-        x = self.cross_attn_decoder(query_embeddings, latents)
+        if kv is not None:
+            x = self.cross_attn_decoder(query_embeddings, kv=kv)
+        else:
+            if self.downsample_ratio != 1:
+                latents = self.latents_proj(latents)
+            x = self.cross_attn_decoder(query_embeddings, latents)
         if self.enable_ln_post:
             x = self.ln_post(x)
         occ = self.output_proj(x)
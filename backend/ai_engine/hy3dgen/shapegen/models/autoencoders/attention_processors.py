@@ -13,17 +13,21 @@
 # by Tencent in accordance with TENCENT HUNYUAN COMMUNITY LICENSE AGREEMENT.
 
 import os
+from functools import partial
 
+import numpy as np
 import torch
-import torch.nn.functional as F
 
-scaled_dot_product_attention = F.scaled_dot_product_attention
+from hy3dgen.shapegen.attention import force_backend, scaled_dot_product_attention as dispatch_attention
+
+# geo_decoder cross-attention goes through the shared backend registry
+scaled_dot_product_attention = partial(dispatch_attention, site='vae_cross')
 if os.environ.get('CA_USE_SAGEATTN', '0') == '1':
     try:
-        from sageattention import sageattn
+        import sageattention  # noqa: F401
     except ImportError:
         raise ImportError('Please install the package "sageattention" to use this USE_SAGEATTN.')
-    scaled_dot_product_attention = sageattn
+    force_backend('vae_cross', 'sage')
 
 
 class CrossAttentionProcessor:
@@ -33,6 +37,13 @@ class CrossAttentionProcessor:
 
 
 class FlashVDMCrossAttentionProcessor:
+    # bucketed refinement queries: one batched top-k selection + padded attention per group
+    # of similar-sized buckets instead of a select_topkv / attention per bucket (see
+    # segmented_attention)
+    segmented = True
+    # padded query rows of a group of buckets stay under this multiple of its real rows
+    max_padding = 2.0
+
     def __init__(self, topk=None):
         self.topk = topk
 
@@ -55,6 +66,9 @@ class FlashVDMCrossAttentionProcessor:
             out = scaled_dot_product_attention(q, k0, v0)
         elif self.topk is False:
             out = scaled_dot_product_attention(q, k, v)
+        elif self.segmented and len(self.topk[1]) > 1:  # a lone bucket is cheaper on the loop
+            idx, counts = self.topk
+            out = self.segmented_attention(q, k, v, counts, topk)
         else:
             idx, counts = self.topk
             start = 0
@@ -80,8 +94,89 @@ class FlashVDMCrossAttentionProcessor:
         k0 = torch.gather(k, dim=-2, index=topk_ind)
         return k0, v0
 
+    @staticmethod
+    def group_buckets(counts, max_padding):
+        """
+        Positions of the buckets in groups that are padded together: largest first, a
+        bucket joins the current group while len(group) * largest <= max_padding * rows in
+        the group. Even buckets make a single group; one large octree bucket among small
+        ones attends on its own instead of padding every other bucket to its size. Each
+        group is returned in bucket order.
+        """
+        groups, group, rows = [], [], 0
+        for i in sorted(range(len(counts)), key=lambda i: -counts[i]):
+            if group and (len(group) + 1) * counts[group[0]] > max_padding * (rows + counts[i]):
+                groups.append(sorted(group))
+                group, rows = [], 0
+            group.append(i)
+            rows += counts[i]
+        if group:
+            groups.append(sorted(group))
+        return groups
+
+    def segmented_attention(self, q, k, v, counts, topk, stride=50):
+        """
+        The per-bucket loop in a few passes. `counts` (host ints) are the sizes of the
+        consecutive query buckets of q. As in select_topkv, each bucket ranks the K/V
+        tokens by the mean similarity of its every `stride`-th query and keeps `topk`, in
+        one batched top-k over all buckets. The buckets' queries are then zero-padded to
+        the largest bucket of their group (group_buckets, at most `max_padding` times the
+        real rows) and each group attends to its selections in a single
+        (b * buckets, h, ...) attention call. All index bookkeeping is planned on the host
+        from `counts` and uploaded in one copy.
+        """
+        b, h, n, d = q.shape
+        counts_np = np.asarray(counts)
+        starts_np = np.cumsum(counts_np) - counts_np
+        groups = self.group_buckets(counts, self.max_padding)
+
+        # host plan: sampled rows and their buckets, then per group its buckets, the source
+        # rows of its queries and their slots in the (len(group) * longest) padded block
+        sampled = (counts_np + stride - 1) // stride
+        bucket_of_sample = np.repeat(np.arange(len(counts)), sampled)
+        sample_rows = starts_np[bucket_of_sample] + (np.arange(sampled.sum()) - (np.cumsum(sampled) - sampled)[bucket_of_sample]) * stride
+        plan, layout = [sample_rows, bucket_of_sample, sampled], []
+        for group in groups:
+            group_counts = counts_np[group]
+            slot = np.repeat(np.arange(len(group)), group_counts)
+            offset = np.arange(group_counts.sum()) - (np.cumsum(group_counts) - group_counts)[slot]
+            plan += [np.asarray(group), starts_np[group][slot] + offset, slot * group_counts.max() + offset]
+            layout.append((len(group), int(group_counts.max())))
+        sizes = [len(part) for part in plan]
+        parts = torch.from_numpy(np.concatenate(plan).astype(np.int64)).to(q.device).split(sizes)
+        sample_rows, bucket_of_sample, sampled = parts[:3]
+
+        # 1. batched top-k: per-bucket mean of the sampled queries' similarities
+        sim = q.index_select(2, sample_rows) @ k.transpose(-1, -2)
+        sim = torch.zeros(b, h, len(counts), k.shape[-2], device=q.device, dtype=torch.float32).index_add_(2, bucket_of_sample, sim.float())
+        topk_ind = torch.topk(sim / sampled[:, None], dim=-1, k=topk).indices
+
+        # 2. padded attention per group of similar-sized buckets
+        out = None if len(groups) == 1 else torch.empty_like(q)
+        for g, (size, longest) in enumerate(layout):
+            members, source, padded = parts[3 + 3 * g:6 + 3 * g]
+            # a single group holds every bucket in order: its source rows are q's own rows
+            q_src = q if out is None else q.index_select(2, source)
+            q_pad = q.new_zeros(b, h, size * longest, d).index_copy_(2, padded, q_src)
+            index = topk_ind.index_select(2, members).unsqueeze(-1).expand(-1, -1, -1, -1, d)
+            k0 = torch.gather(k.unsqueeze(2).expand(-1, -1, size, -1, -1), dim=-2, index=index)
+            v0 = torch.gather(v.unsqueeze(2).expand(-1, -1, size, -1, -1), dim=-2, index=index)
+
+            def per_bucket(t):  # (b, h, size, m, d) -> (b * size, h, m, d)
+                return t.transpose(1, 2).reshape(b * size, h, t.shape[-2], d)
+
+            attended = scaled_dot_product_attention(per_bucket(q_pad.view(b, h, size, longest, d)), per_bucket(k0), per_bucket(v0))
+            attended = attended.reshape(b, size, h, longest, d).transpose(1, 2).reshape(b, h, size * longest, d)
+            if out is None:
+                return attended.index_select(2, padded)
+            out.index_copy_(2, source, attended.index_select(2, padded))
+        return out
+
 
 class FlashVDMTopMCrossAttentionProcessor(FlashVDMCrossAttentionProcessor):
+    # selects a data-dependent number of tokens per bucket, so it keeps the per-bucket loop
+    segmented = False
+
     def select_topkv(self, q_chunk, k, v, topk):
         q1 = q_chunk[:, :, ::30, :]
         sim = q1 @ k.transpose(-1, -2)
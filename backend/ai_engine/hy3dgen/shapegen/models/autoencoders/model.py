@@ -102,13 +102,26 @@ class VectsetVAE(nn.Module):
         self.volume_decoder = volume_decoder
         self.surface_extractor = surface_extractor
 
-    def latents2mesh(self, latents: torch.FloatTensor, **kwargs):
+    def latents2grid(self, latents: torch.FloatTensor, **kwargs):
+        """GPU half of latents2mesh: query the geo decoder over the octree grid."""
         with synchronize_timer('Volume decoding'):
             grid_logits = self.volume_decoder(latents, self.geo_decoder, **kwargs)
+        return grid_logits
+
+    def grid2mesh(self, grid_logits: torch.FloatTensor, surface_extractor=None, **kwargs):
+        """
+        Surface extraction half of latents2mesh; with mc_algo='mc' it runs on CPU tensors.
+        `surface_extractor` overrides the configured extractor for this call only.
+        """
+        surface_extractor = surface_extractor or self.surface_extractor
         with synchronize_timer('Surface extraction'):
-            outputs = self.surface_extractor(grid_logits, **kwargs)
+            outputs = surface_extractor(grid_logits, **kwargs)
         return outputs
 
+    def latents2mesh(self, latents: torch.FloatTensor, **kwargs):
+        grid_logits = self.latents2grid(latents, **kwargs)
+        return self.grid2mesh(grid_logits, **kwargs)
+
     def enable_flashvdm_decoder(
         self,
         enabled: bool = True,
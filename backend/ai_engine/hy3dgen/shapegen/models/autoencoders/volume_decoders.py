@@ -16,8 +16,6 @@ from typing import Union, Tuple, List, Callable
 
 import numpy as np
 import torch
-import torch.nn as nn
-import torch.nn.functional as F
 from einops import repeat
 from tqdm import tqdm
 
@@ -35,96 +33,27 @@ class ProgressBar:
         self.pbar.update(n)
 
 def extract_near_surface_volume_fn(input_tensor: torch.Tensor, alpha: float):
-    device = input_tensor.device
-    D = input_tensor.shape[0]
-    signed_val = 0.0
-
-    # 添加偏移并处理无效值
+    """
+    Voxels whose sign (of input + alpha) differs from one of their 6 neighbours, ignoring
+    invalid (<= -9000) values; the borders replicate. One neighbour volume is alive at a
+    time instead of the six float32 copies the stacked version kept.
+    """
     val = input_tensor + alpha
     valid_mask = val > -9000  # 假设-9000是无效值
-
-    # 改进的邻居获取函数（保持维度一致）
-    def get_neighbor(t, shift, axis):
-        """根据指定轴进行位移并保持维度一致"""
-        if shift == 0:
-            return t.clone()
-
-        # 确定填充轴（输入为[D, D, D]对应z,y,x轴）
-        pad_dims = [0, 0, 0, 0, 0, 0]  # 格式：[x前，x后，y前，y后，z前，z后]
-
-        # 根据轴类型设置填充
-        if axis == 0:  # x轴（最后一个维度）
-            pad_idx = 0 if shift > 0 else 1
-            pad_dims[pad_idx] = abs(shift)
-        elif axis == 1:  # y轴（中间维度）
-            pad_idx = 2 if shift > 0 else 3
-            pad_dims[pad_idx] = abs(shift)
-        elif axis == 2:  # z轴（第一个维度）
-            pad_idx = 4 if shift > 0 else 5
-            pad_dims[pad_idx] = abs(shift)
-
-        # 执行填充（添加batch和channel维度适配F.pad）
-        padded = F.pad(t.unsqueeze(0).unsqueeze(0), pad_dims[::-1], mode='replicate')  # 反转顺序适配F.pad
-
-        # 构建动态切片索引
-        slice_dims = [slice(None)] * 3  # 初始化为全切片
-        if axis == 0:  # x轴（dim=2）
-            if shift > 0:
-                slice_dims[0] = slice(shift, None)
-            else:
-                slice_dims[0] = slice(None, shift)
-        elif axis == 1:  # y轴（dim=1）
+    sign = torch.sign(val)
+    differs = torch.zeros_like(valid_mask)
+    size = val.shape[0]
+    for axis in range(3):
+        for shift in (1, -1):
+            # neighbour at index + shift along `axis`, replicating the border
             if shift > 0:
-                slice_dims[1] = slice(shift, None)
+                neighbor = torch.cat((val.narrow(axis, 1, size - 1), val.narrow(axis, size - 1, 1)), dim=axis)
             else:
-                slice_dims[1] = slice(None, shift)
-        elif axis == 2:  # z轴（dim=0）
-            if shift > 0:
-                slice_dims[2] = slice(shift, None)
-            else:
-                slice_dims[2] = slice(None, shift)
-
-        # 应用切片并恢复维度
-        padded = padded.squeeze(0).squeeze(0)
-        sliced = padded[slice_dims]
-        return sliced
-
-    # 获取各方向邻居（确保维度一致）
-    left = get_neighbor(val, 1, axis=0)  # x方向
-    right = get_neighbor(val, -1, axis=0)
-    back = get_neighbor(val, 1, axis=1)  # y方向
-    front = get_neighbor(val, -1, axis=1)
-    down = get_neighbor(val, 1, axis=2)  # z方向
-    up = get_neighbor(val, -1, axis=2)
-
-    # 处理边界无效值（使用where保持维度一致）
-    def safe_where(neighbor):
-        return torch.where(neighbor > -9000, neighbor, val)
-
-    left = safe_where(left)
-    right = safe_where(right)
-    back = safe_where(back)
-    front = safe_where(front)
-    down = safe_where(down)
-    up = safe_where(up)
-
-    # 计算符号一致性（转换为float32确保精度）
-    sign = torch.sign(val.to(torch.float32))
-    neighbors_sign = torch.stack([
-        torch.sign(left.to(torch.float32)),
-        torch.sign(right.to(torch.float32)),
-        torch.sign(back.to(torch.float32)),
-        torch.sign(front.to(torch.float32)),
-        torch.sign(down.to(torch.float32)),
-        torch.sign(up.to(torch.float32))
-    ], dim=0)
-
-    # 检查所有符号是否一致
-    same_sign = torch.all(neighbors_sign == sign, dim=0)
-
-    # 生成最终掩码
-    mask = (~same_sign).to(torch.int32)
-    return mask * valid_mask.to(torch.int32)
+                neighbor = torch.cat((val.narrow(axis, 0, 1), val.narrow(axis, 0, size - 1)), dim=axis)
+            neighbor = torch.where(neighbor > -9000, neighbor, val)
+            differs |= torch.sign(neighbor) != sign
+            del neighbor
+    return (differs & valid_mask).to(torch.int32)
 
 
 def generate_dense_grid_points(
@@ -146,6 +75,113 @@ def generate_dense_grid_points(
     return xyz, grid_size, length
 
 
+def lattice_axes(bbox_min, bbox_max, resolution: int, device, dtype):
+    """Per-axis coordinates of generate_dense_grid_points' lattice, (resolution + 1,) each."""
+    return [
+        torch.from_numpy(np.linspace(bbox_min[axis], bbox_max[axis], resolution + 1, dtype=np.float32)).to(device, dtype)
+        for axis in range(3)
+    ]
+
+
+def lattice_points(axes, index):
+    """Coordinates (..., 3) of the lattice points with flat ij-order `index`, built per chunk."""
+    n = axes[0].shape[0]
+    return torch.stack((axes[0][index // (n * n)], axes[1][index // n % n], axes[2][index % n]), dim=-1)
+
+
+def dilate_indices(index, size: int, radius: int, unique: bool = True):
+    """
+    Sorted flat indices of a size^3 lattice within `radius` voxels (Chebyshev) of the sorted,
+    unique `index`, i.e. what `radius` 3x3x3 ones-convolutions of a dense mask select, kept
+    sparse: one axis at a time, so memory follows the surface rather than the volume.
+    Neighbours past the border are clamped onto it (already selected) rather than masked
+    out, which would cost a host sync per shift. `unique=False` leaves the duplicates of the
+    last axis in, for a caller that deduplicates itself (bucket_lattice_indices).
+    """
+    if radius == 0:
+        return index
+    coords = torch.stack((index // (size * size), index // size % size, index % size), dim=-1)
+    for axis in range(3):
+        shifted = []
+        for offset in range(-radius, radius + 1):
+            moved = coords.clone()
+            moved[:, axis] = (moved[:, axis] + offset).clamp_(0, size - 1)
+            shifted.append(moved)
+        coords = torch.cat(shifted)
+        flat = coords[:, 0] * size * size + coords[:, 1] * size + coords[:, 2]
+        if axis == 2 and not unique:
+            return flat
+        flat = torch.unique(flat)
+        coords = torch.stack((flat // (size * size), flat // size % size, flat % size), dim=-1)
+    return flat
+
+
+def next_level_indices(grid_logits, mc_level: float, size: int, expand_num: int, unique: bool = True):
+    """
+    Flat indices of the (size^3) next-level lattice around the surface of the coarser
+    `grid_logits`: near-surface voxels (dilated `expand_num` times), doubled, then dilated
+    2 - expand_num times at the finer level (`unique` as in dilate_indices).
+    """
+    curr_points = extract_near_surface_volume_fn(grid_logits.squeeze(0), mc_level)
+    curr_points += grid_logits.squeeze(0).abs() < 0.95
+    coarse = curr_points.shape[0]
+    index = torch.nonzero(curr_points.view(-1) > 0).squeeze(-1)
+    del curr_points
+    index = dilate_indices(index, coarse, expand_num)
+    coords = torch.stack((index // (coarse * coarse), index // coarse % coarse, index % coarse), dim=-1) * 2
+    index = coords[:, 0] * size * size + coords[:, 1] * size + coords[:, 2]
+    return dilate_indices(index, size, 2 - expand_num, unique=unique)
+
+
+def bucket_lattice_indices(index, axes, grid_num: int):
+    """
+    Deduplicated flat lattice `index` (may repeat) ordered by FlashVDM query bucket, the
+    points' bounding box split into grid_num^3 cells, and the per-bucket counts as host
+    ints. The counts, and with them the level's size, come back in one small device-to-host
+    copy that replaces both the final torch.unique and a separate bincount round-trip.
+    """
+    volume = axes[0].shape[0] ** 3
+    points = lattice_points(axes, index)
+    min_val = points.min(axis=0).values
+    max_val = points.max(axis=0).values
+    cell = torch.floor((points - min_val) / (max_val - min_val) * (grid_num - 0.001)).long()
+    bucket = cell[..., 0] * (grid_num ** 2) + cell[..., 1] * grid_num + cell[..., 2]
+    key = torch.sort(bucket * volume + index).values
+    first = torch.ones_like(key, dtype=torch.bool)
+    first[1:] = key[1:] != key[:-1]
+    counts = torch.zeros(grid_num ** 3, dtype=torch.long, device=key.device).index_add_(0, key // volume, first.long())
+    counts = counts.cpu().tolist()
+    # duplicates land on the same slot with the same value
+    slot = torch.cumsum(first, 0) - 1
+    key = key.new_empty(sum(counts)).scatter_(0, slot, key)
+    return key % volume, counts
+
+
+def lattice_queries(geo_decoder, lattice, index, axes, batch_size=None):
+    """
+    geo_decoder kwargs for the first-level lattice points with flat ij-order `index`:
+    their cached projected embeddings (QueryEmbeddingCache), or their coordinates (from
+    the `lattice_axes`) when the cache is disabled. `batch_size` repeats a (p, ...) chunk
+    over the latents batch.
+    """
+    embeddings = geo_decoder.query_cache.embed(geo_decoder, lattice, index, axes[0].dtype)
+    key, value = ('queries', lattice_points(axes, index)) if embeddings is None else ('query_embeddings', embeddings)
+    if batch_size is not None:
+        value = repeat(value, "p c -> b p c", b=batch_size)
+    return {key: value}
+
+
+def octree_resolutions(octree_resolution: int, min_resolution: int):
+    resolutions = []
+    if octree_resolution < min_resolution:
+        resolutions.append(octree_resolution)
+    while octree_resolution >= min_resolution:
+        resolutions.append(octree_resolution)
+        octree_resolution = octree_resolution // 2
+    resolutions.reverse()
+    return resolutions
+
+
 class VanillaVolumeDecoder:
     @torch.no_grad()
     def __call__(
@@ -162,27 +198,25 @@ class VanillaVolumeDecoder:
         dtype = latents.dtype
         batch_size = latents.shape[0]
 
-        # 1. generate query points
+        # 1. query points, computed per chunk from flat lattice indices
         if isinstance(bounds, float):
             bounds = [-bounds, -bounds, -bounds, bounds, bounds, bounds]
 
         bbox_min, bbox_max = np.array(bounds[0:3]), np.array(bounds[3:6])
-        xyz_samples, grid_size, length = generate_dense_grid_points(
-            bbox_min=bbox_min,
-            bbox_max=bbox_max,
-            octree_resolution=octree_resolution,
-            indexing="ij"
-        )
-        xyz_samples = torch.from_numpy(xyz_samples).to(device, dtype=dtype).contiguous().reshape(-1, 3)
-
-        # 2. latents to 3d volume
-        batch_logits = []
-        for start in tqdm(range(0, xyz_samples.shape[0], num_chunks), desc=f"Volume Decoding",
-                          disable=not enable_pbar):
-            chunk_queries = xyz_samples[start: start + num_chunks, :]
-            chunk_queries = repeat(chunk_queries, "p c -> b p c", b=batch_size)
-            logits = geo_decoder(queries=chunk_queries, latents=latents)
-            batch_logits.append(logits)
+        lattice = (tuple(bbox_min), tuple(bbox_max), octree_resolution)
+        axes = lattice_axes(bbox_min, bbox_max, octree_resolution, device, dtype)
+        grid_size = [octree_resolution + 1] * 3
+        num_points = int(np.prod(grid_size))
+
+        # 2. latents to 3d volume, with the latents' K/V projected once for every chunk
+        with geo_decoder.decode_session(latents) as session:
+            batch_logits = []
+            for start in tqdm(range(0, num_points, num_chunks), desc=f"Volume Decoding",
+                              disable=not enable_pbar):
+                index = torch.arange(start, min(start + num_chunks, num_points), device=device)
+                queries = lattice_queries(geo_decoder, lattice, index, axes, batch_size)
+                logits = geo_decoder(**queries, latents=latents, kv=session.kv)
+                batch_logits.append(logits)
 
         grid_logits = torch.cat(batch_logits, dim=1)
         grid_logits = grid_logits.view((batch_size, *grid_size)).float()
@@ -208,82 +242,57 @@ class HierarchicalVolumeDecoding:
         enable_pbar: bool = True,
         **kwargs,
     ):
+        if latents.shape[0] > 1:
+            # every latent set refines its own near-surface points: decode the rows one by one
+            return torch.cat([
+                self(latents[i:i + 1], geo_decoder, bounds=bounds, num_chunks=num_chunks, mc_level=mc_level,
+                     octree_resolution=octree_resolution, min_resolution=min_resolution,
+                     enable_pbar=enable_pbar, **kwargs)
+                for i in range(latents.shape[0])
+            ])
         device = latents.device
         dtype = latents.dtype
+        resolutions = octree_resolutions(octree_resolution, min_resolution)
 
-        resolutions = []
-        if octree_resolution < min_resolution:
-            resolutions.append(octree_resolution)
-        while octree_resolution >= min_resolution:
-            resolutions.append(octree_resolution)
-            octree_resolution = octree_resolution // 2
-        resolutions.reverse()
-
-        # 1. generate query points
+        # 1. query points, computed per chunk from flat lattice indices
         if isinstance(bounds, float):
             bounds = [-bounds, -bounds, -bounds, bounds, bounds, bounds]
         bbox_min = np.array(bounds[0:3])
         bbox_max = np.array(bounds[3:6])
-        bbox_size = bbox_max - bbox_min
-
-        xyz_samples, grid_size, length = generate_dense_grid_points(
-            bbox_min=bbox_min,
-            bbox_max=bbox_max,
-            octree_resolution=resolutions[0],
-            indexing="ij"
-        )
+        lattice = (tuple(bbox_min), tuple(bbox_max), resolutions[0])
+        axes = lattice_axes(bbox_min, bbox_max, resolutions[0], device, dtype)
+        grid_size = [resolutions[0] + 1] * 3
+        num_points = int(np.prod(grid_size))
 
-        dilate = nn.Conv3d(1, 1, 3, padding=1, bias=False, device=device, dtype=dtype)
-        dilate.weight = torch.nn.Parameter(torch.ones(dilate.weight.shape, dtype=dtype, device=device))
-
-        grid_size = np.array(grid_size)
-        xyz_samples = torch.from_numpy(xyz_samples).to(device, dtype=dtype).contiguous().reshape(-1, 3)
-
-        # 2. latents to 3d volume
-        batch_logits = []
-        batch_size = latents.shape[0]
-        for start in tqdm(range(0, xyz_samples.shape[0], num_chunks),
-                          desc=f"Hierarchical Volume Decoding [r{resolutions[0] + 1}]"):
-            queries = xyz_samples[start: start + num_chunks, :]
-            batch_queries = repeat(queries, "p c -> b p c", b=batch_size)
-            logits = geo_decoder(queries=batch_queries, latents=latents)
-            batch_logits.append(logits)
-
-        grid_logits = torch.cat(batch_logits, dim=1).view((batch_size, grid_size[0], grid_size[1], grid_size[2]))
-
-        for octree_depth_now in resolutions[1:]:
-            grid_size = np.array([octree_depth_now + 1] * 3)
-            resolution = bbox_size / octree_depth_now
-            next_index = torch.zeros(tuple(grid_size), dtype=dtype, device=device)
-            next_logits = torch.full(next_index.shape, -10000., dtype=dtype, device=device)
-            curr_points = extract_near_surface_volume_fn(grid_logits.squeeze(0), mc_level)
-            curr_points += grid_logits.squeeze(0).abs() < 0.95
-
-            if octree_depth_now == resolutions[-1]:
-                expand_num = 0
-            else:
-                expand_num = 1
-            for i in range(expand_num):
-                curr_points = dilate(curr_points.unsqueeze(0).to(dtype)).squeeze(0)
-            (cidx_x, cidx_y, cidx_z) = torch.where(curr_points > 0)
-            next_index[cidx_x * 2, cidx_y * 2, cidx_z * 2] = 1
-            for i in range(2 - expand_num):
-                next_index = dilate(next_index.unsqueeze(0)).squeeze(0)
-            nidx = torch.where(next_index > 0)
-
-            next_points = torch.stack(nidx, dim=1)
-            next_points = (next_points * torch.tensor(resolution, dtype=next_points.dtype, device=device) +
-                           torch.tensor(bbox_min, dtype=next_points.dtype, device=device))
+        # 2. latents to 3d volume, with the latents' K/V projected once for every chunk and level
+        with geo_decoder.decode_session(latents) as session:
             batch_logits = []
-            for start in tqdm(range(0, next_points.shape[0], num_chunks),
-                              desc=f"Hierarchical Volume Decoding [r{octree_depth_now + 1}]"):
-                queries = next_points[start: start + num_chunks, :]
-                batch_queries = repeat(queries, "p c -> b p c", b=batch_size)
-                logits = geo_decoder(queries=batch_queries.to(latents.dtype), latents=latents)
+            batch_size = latents.shape[0]
+            for start in tqdm(range(0, num_points, num_chunks),
+                              desc=f"Hierarchical Volume Decoding [r{resolutions[0] + 1}]"):
+                index = torch.arange(start, min(start + num_chunks, num_points), device=device)
+                queries = lattice_queries(geo_decoder, lattice, index, axes, batch_size)
+                logits = geo_decoder(**queries, latents=latents, kv=session.kv)
                 batch_logits.append(logits)
-            grid_logits = torch.cat(batch_logits, dim=1)
-            next_logits[nidx] = grid_logits[0, ..., 0]
-            grid_logits = next_logits.unsqueeze(0)
+
+            grid_logits = torch.cat(batch_logits, dim=1).view((batch_size, *grid_size))
+
+            for octree_depth_now in resolutions[1:]:
+                size = octree_depth_now + 1
+                expand_num = 0 if octree_depth_now == resolutions[-1] else 1
+                # sparse list of the next level's near-surface points instead of a dense index volume
+                nidx = next_level_indices(grid_logits, mc_level, size, expand_num)
+                axes = lattice_axes(bbox_min, bbox_max, octree_depth_now, device, dtype)
+                next_logits = torch.full((size, size, size), -10000., dtype=dtype, device=device)
+                batch_logits = []
+                for start in tqdm(range(0, nidx.shape[0], num_chunks),
+                                  desc=f"Hierarchical Volume Decoding [r{octree_depth_now + 1}]"):
+                    queries = lattice_points(axes, nidx[start: start + num_chunks])
+                    batch_queries = repeat(queries, "p c -> b p c", b=batch_size)
+                    logits = geo_decoder(queries=batch_queries, latents=latents, kv=session.kv)
+                    batch_logits.append(logits)
+                next_logits.view(-1)[nidx] = torch.cat(batch_logits, dim=1)[0, ..., 0]
+                grid_logits = next_logits.unsqueeze(0)
         grid_logits[grid_logits == -10000.] = float('nan')
 
         return grid_logits
@@ -313,139 +322,104 @@ class FlashVDMVolumeDecoding:
         enable_pbar: bool = True,
         **kwargs,
     ):
+        if latents.shape[0] > 1:
+            # every latent set refines its own near-surface points and the first level
+            # broadcasts a batch-1 K/V over the mini grids: decode the rows one by one
+            return torch.cat([
+                self(latents[i:i + 1], geo_decoder, bounds=bounds, num_chunks=num_chunks, mc_level=mc_level,
+                     octree_resolution=octree_resolution, min_resolution=min_resolution,
+                     mini_grid_num=mini_grid_num, enable_pbar=enable_pbar, **kwargs)
+                for i in range(latents.shape[0])
+            ])
         processor = self.processor
         geo_decoder.set_cross_attention_processor(processor)
 
         device = latents.device
         dtype = latents.dtype
 
-        resolutions = []
-        if octree_resolution < min_resolution:
-            resolutions.append(octree_resolution)
-        while octree_resolution >= min_resolution:
-            resolutions.append(octree_resolution)
-            octree_resolution = octree_resolution // 2
-        resolutions.reverse()
+        resolutions = octree_resolutions(octree_resolution, min_resolution)
         resolutions[0] = round(resolutions[0] / mini_grid_num) * mini_grid_num - 1
         for i, resolution in enumerate(resolutions[1:]):
             resolutions[i + 1] = resolutions[0] * 2 ** (i + 1)
 
         #logger.info(f"FlashVDMVolumeDecoding Resolution: {resolutions}")
 
-        # 1. generate query points
+        # 1. query points, computed per mini grid from flat lattice indices
         if isinstance(bounds, float):
             bounds = [-bounds, -bounds, -bounds, bounds, bounds, bounds]
         bbox_min = np.array(bounds[0:3])
         bbox_max = np.array(bounds[3:6])
-        bbox_size = bbox_max - bbox_min
-
-        xyz_samples, grid_size, length = generate_dense_grid_points(
-            bbox_min=bbox_min,
-            bbox_max=bbox_max,
-            octree_resolution=resolutions[0],
-            indexing="ij"
-        )
-
-        dilate = nn.Conv3d(1, 1, 3, padding=1, bias=False, device=device, dtype=dtype)
-        dilate.weight = torch.nn.Parameter(torch.ones(dilate.weight.shape, dtype=dtype, device=device))
-
-        grid_size = np.array(grid_size)
-
-        # 2. latents to 3d volume
-        xyz_samples = torch.from_numpy(xyz_samples).to(device, dtype=dtype)
-        batch_size = latents.shape[0]
-        mini_grid_size = xyz_samples.shape[0] // mini_grid_num
-        xyz_samples = xyz_samples.view(
-            mini_grid_num, mini_grid_size,
-            mini_grid_num, mini_grid_size,
-            mini_grid_num, mini_grid_size, 3
-        ).permute(
-            0, 2, 4, 1, 3, 5, 6
-        ).reshape(
-            -1, mini_grid_size * mini_grid_size * mini_grid_size, 3
-        )
-        batch_logits = []
-        num_batchs = max(num_chunks // xyz_samples.shape[1], 1)
-        comfy_pbar = ProgressBar(xyz_samples.shape[0])
-        for start in tqdm(range(0, xyz_samples.shape[0], num_batchs),
-                          desc=f"FlashVDM Volume Decoding", disable=not enable_pbar):
-            queries = xyz_samples[start: start + num_batchs, :]
-            batch = queries.shape[0]
-            batch_latents = repeat(latents.squeeze(0), "p c -> b p c", b=batch)
-            processor.topk = True
-            logits = geo_decoder(queries=queries, latents=batch_latents)
-            batch_logits.append(logits)
-            comfy_pbar.update(num_chunks)
-            
-        grid_logits = torch.cat(batch_logits, dim=0).reshape(
-            mini_grid_num, mini_grid_num, mini_grid_num,
-            mini_grid_size, mini_grid_size,
-            mini_grid_size
-        ).permute(0, 3, 1, 4, 2, 5).contiguous().view(
-            (batch_size, grid_size[0], grid_size[1], grid_size[2])
-            )
-            
-            
-
-        for octree_depth_now in resolutions[1:]:
-            grid_size = np.array([octree_depth_now + 1] * 3)
-            resolution = bbox_size / octree_depth_now
-            next_index = torch.zeros(tuple(grid_size), dtype=dtype, device=device)
-            next_logits = torch.full(next_index.shape, -10000., dtype=dtype, device=device)
-            curr_points = extract_near_surface_volume_fn(grid_logits.squeeze(0), mc_level)
-            curr_points += grid_logits.squeeze(0).abs() < 0.95
-
-            if octree_depth_now == resolutions[-1]:
-                expand_num = 0
-            else:
-                expand_num = 1
-            for i in range(expand_num):
-                curr_points = dilate(curr_points.unsqueeze(0).to(dtype)).squeeze(0)
-            (cidx_x, cidx_y, cidx_z) = torch.where(curr_points > 0)
-
-            next_index[cidx_x * 2, cidx_y * 2, cidx_z * 2] = 1
-            for i in range(2 - expand_num):
-                next_index = dilate(next_index.unsqueeze(0)).squeeze(0)
-            nidx = torch.where(next_index > 0)
-
-            next_points = torch.stack(nidx, dim=1)
-            next_points = (next_points * torch.tensor(resolution, dtype=torch.float32, device=device) +
-                           torch.tensor(bbox_min, dtype=torch.float32, device=device))
-
-            query_grid_num = 6
-            min_val = next_points.min(axis=0).values
-            max_val = next_points.max(axis=0).values
-            vol_queries_index = (next_points - min_val) / (max_val - min_val) * (query_grid_num - 0.001)
-            index = torch.floor(vol_queries_index).long()
-            index = index[..., 0] * (query_grid_num ** 2) + index[..., 1] * query_grid_num + index[..., 2]
-            index = index.sort()
-            next_points = next_points[index.indices].unsqueeze(0).contiguous()
-            unique_values = torch.unique(index.values, return_counts=True)
-            grid_logits = torch.zeros((next_points.shape[1]), dtype=latents.dtype, device=latents.device)
-            input_grid = [[], []]
-            logits_grid_list = []
-            start_num = 0
-            sum_num = 0
-            for grid_index, count in zip(unique_values[0].cpu().tolist(), unique_values[1].cpu().tolist()):
-                if sum_num + count < num_chunks or sum_num == 0:
-                    sum_num += count
-                    input_grid[0].append(grid_index)
-                    input_grid[1].append(count)
-                else:
+        lattice = (tuple(bbox_min), tuple(bbox_max), resolutions[0])
+        axes = lattice_axes(bbox_min, bbox_max, resolutions[0], device, dtype)
+        n = resolutions[0] + 1
+        grid_size = [n] * 3
+
+        # 2. latents to 3d volume, with the latents' K/V projected once for every chunk and level
+        with geo_decoder.decode_session(latents) as session:
+            batch_size = latents.shape[0]
+            mini_grid_size = n // mini_grid_num
+            # flat lattice index = mini grid origin + offset inside the mini grid
+            cells = torch.arange(mini_grid_size, device=device)
+            local = (cells[:, None, None] * n * n + cells[None, :, None] * n + cells[None, None, :]).reshape(-1)
+            grids = torch.arange(mini_grid_num, device=device) * mini_grid_size
+            origins = (grids[:, None, None] * n * n + grids[None, :, None] * n + grids[None, None, :]).reshape(-1)
+            batch_logits = []
+            num_batchs = max(num_chunks // local.shape[0], 1)
+            comfy_pbar = ProgressBar(origins.shape[0])
+            for start in tqdm(range(0, origins.shape[0], num_batchs),
+                              desc=f"FlashVDM Volume Decoding", disable=not enable_pbar):
+                index = origins[start: start + num_batchs, None] + local[None]
+                queries = lattice_queries(geo_decoder, lattice, index, axes)
+                processor.topk = True
+                # the batch-1 K/V is broadcast over the mini grids
+                logits = geo_decoder(**queries, latents=latents, kv=session.kv)
+                batch_logits.append(logits)
+                comfy_pbar.update(num_chunks)
+
+            grid_logits = torch.cat(batch_logits, dim=0).reshape(
+                mini_grid_num, mini_grid_num, mini_grid_num,
+                mini_grid_size, mini_grid_size,
+                mini_grid_size
+            ).permute(0, 3, 1, 4, 2, 5).contiguous().view(
+                (batch_size, grid_size[0], grid_size[1], grid_size[2])
+                )
+
+            for octree_depth_now in resolutions[1:]:
+                size = octree_depth_now + 1
+                expand_num = 0 if octree_depth_now == resolutions[-1] else 1
+                # sparse list of the next level's near-surface points in bucket order, with the
+                # bucket sizes the batches below are planned from (one small host copy per level)
+                query_grid_num = 6
+                axes = lattice_axes(bbox_min, bbox_max, octree_depth_now, device, torch.float32)
+                candidates = next_level_indices(grid_logits, mc_level, size, expand_num, unique=False)
+                nidx, counts = bucket_lattice_indices(candidates, axes, query_grid_num)
+                del candidates
+                next_points = lattice_points(axes, nidx).unsqueeze(0)
+                next_logits = torch.full((size, size, size), -10000., dtype=dtype, device=device)
+                sorted_logits = torch.empty((next_points.shape[1]), dtype=latents.dtype, device=latents.device)
+                input_grid = [[], []]
+                start_num = 0
+                sum_num = 0
+                for grid_index, count in enumerate(counts):
+                    if count == 0:
+                        continue
+                    if sum_num + count < num_chunks or sum_num == 0:
+                        sum_num += count
+                        input_grid[0].append(grid_index)
+                        input_grid[1].append(count)
+                    else:
+                        processor.topk = input_grid
+                        logits_grid = geo_decoder(queries=next_points[:, start_num:start_num + sum_num], latents=latents, kv=session.kv)
+                        sorted_logits[start_num:start_num + sum_num] = logits_grid.view(-1)
+                        start_num = start_num + sum_num
+                        input_grid = [[grid_index], [count]]
+                        sum_num = count
+                if sum_num > 0:
                     processor.topk = input_grid
-                    logits_grid = geo_decoder(queries=next_points[:, start_num:start_num + sum_num], latents=latents)
-                    start_num = start_num + sum_num
-                    logits_grid_list.append(logits_grid)
-                    input_grid = [[grid_index], [count]]
-                    sum_num = count
-            if sum_num > 0:
-                processor.topk = input_grid
-                logits_grid = geo_decoder(queries=next_points[:, start_num:start_num + sum_num], latents=latents)
-                logits_grid_list.append(logits_grid)
-            logits_grid = torch.cat(logits_grid_list, dim=1)
-            grid_logits[index.indices] = logits_grid.squeeze(0).squeeze(-1)
-            next_logits[nidx] = grid_logits
-            grid_logits = next_logits.unsqueeze(0)
+                    logits_grid = geo_decoder(queries=next_points[:, start_num:start_num + sum_num], latents=latents, kv=session.kv)
+                    sorted_logits[start_num:start_num + sum_num] = logits_grid.view(-1)
+                next_logits.view(-1)[nidx] = sorted_logits
+                grid_logits = next_logits.unsqueeze(0)
 
         grid_logits[grid_logits == -10000.] = float('nan')
 
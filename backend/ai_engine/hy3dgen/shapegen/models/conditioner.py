@@ -22,6 +22,8 @@
 # fine-tuning enabling code and other elements of the foregoing made publicly available
 # by Tencent in accordance with TENCENT HUNYUAN COMMUNITY LICENSE AGREEMENT.
 
+import time
+
 import numpy as np
 import torch
 import torch.nn as nn
@@ -34,6 +36,13 @@ from transformers import (
 )
 from hy3dgen.shapegen.utils import logger as log
 
+def _synchronized(device):
+    """perf_counter() once the work queued on `device` has finished."""
+    if torch.device(device).type == 'cuda':
+        torch.cuda.synchronize(device)
+    return time.perf_counter()
+
+
 def get_1d_sincos_pos_embed_from_grid(embed_dim, pos):
     """
     embed_dim: output dimension for each position
@@ -55,6 +64,10 @@ def get_1d_sincos_pos_embed_from_grid(embed_dim, pos):
 
 
 class ImageEncoder(nn.Module):
+    # encode_views stage times: each stage then waits for the device, so off by default
+    time_stages = False
+    last_timings = None
+
     def __init__(
         self,
         version=None,
@@ -131,48 +144,57 @@ class ImageEncoder(nn.Module):
 
             return last_hidden_state
         else:
-            images = []
-            view_indexes = []
-            supported_sizes = [518, 530]
-
-            for view_tag, view_image in view_dict.items():
-                if view_image is not None:
-                    if view_image.shape[1] == 4:
-                        log.info(f'{view_tag} view image has alpha channel, using it to set background to black')
-                        rgb = view_image[:, :3, :, :]
-                        alpha = view_image[:, 3:4, :, :]
-                        view_image = rgb * alpha
-                    else:
-                        log.warning(f"{view_tag} view image has no alpha channel, make sure the background is already black")
-                    view_image = view_image.to(self.model.device, dtype=self.model.dtype)
-                    if (view_image.shape[2] not in supported_sizes or view_image.shape[3] not in supported_sizes):
-                        log.info(f'view_image shape {view_image.shape} not supported. Resizing to 518x518')
-                        view_image = self.transform(view_image)
-                    images.append(view_image)
-                    view_indexes.append(self.view2idx[view_tag])
+            return self.encode_views(view_dict)
 
-            image_tensors = torch.cat(images, 0)
-
-            outputs = self.model(image_tensors)
-
-            self.view_num = len(images)
-
-            last_hidden_state = outputs.last_hidden_state
-            last_hidden_state = last_hidden_state.view(
-                self.view_num, 
-                -1,
-                last_hidden_state.shape[-1]
-            )
-            view_embedding = self.view_embed.to(last_hidden_state.dtype).to(last_hidden_state.device)
-            if self.view_num != 4:
-                view_embeddings = []
-                for idx in range(len(view_indexes)):
-                    view_embeddings.append(self.view_embed[:, idx, ...])
-                view_embedding = torch.cat(view_embeddings, 0).to(last_hidden_state.dtype).to(last_hidden_state.device)
-
-            last_hidden_state = last_hidden_state + view_embedding
-            last_hidden_state = last_hidden_state.view(-1, last_hidden_state.shape[-1])
-            return last_hidden_state.unsqueeze(0)
+    def prepare_views(self, views):
+        """Alpha-premultiply (black background) and resize a stack of same-sized views at once."""
+        if views.shape[1] == 4:
+            views = views[:, :3] * views[:, 3:4]
+        else:
+            log.warning("view images have no alpha channel, make sure the background is already black")
+        views = views.to(self.model.device, dtype=self.model.dtype)
+        if views.shape[2] not in (518, 530) or views.shape[3] not in (518, 530):
+            views = self.transform(views)
+        return views
+
+    def encode_views(self, view_dict):
+        """
+        Multi-view conditioning: the views are stacked and resized together, DINO encodes
+        them in one batched pass and each view's embedding is gathered by view index.
+        With `time_stages` set, per-stage times (ms) are kept in `last_timings`.
+        """
+        tags = [tag for tag, view in view_dict.items() if view is not None]
+        views = [view_dict[tag] for tag in tags]
+        device = self.model.device
+        clock = _synchronized if self.time_stages else (lambda device: None)
+
+        start = clock(device)
+        if all(view.shape[1:] == views[0].shape[1:] for view in views):
+            image_tensors = self.prepare_views(torch.cat(views, 0))
+        else:
+            image_tensors = torch.cat([self.prepare_views(view) for view in views], 0)
+        resized = clock(device)
+
+        last_hidden_state = self.model(image_tensors).last_hidden_state
+        encoded = clock(device)
+
+        self.view_num = len(views)
+        last_hidden_state = last_hidden_state.view(self.view_num, -1, last_hidden_state.shape[-1])
+        view_indexes = torch.tensor([self.view2idx[tag] for tag in tags], device=last_hidden_state.device)
+        view_embedding = self.view_embed[0].to(last_hidden_state.device, dtype=last_hidden_state.dtype)
+        last_hidden_state = last_hidden_state + view_embedding.index_select(0, view_indexes)
+        last_hidden_state = last_hidden_state.view(-1, last_hidden_state.shape[-1])
+        embedded = clock(device)
+
+        if self.time_stages:
+            self.last_timings = {
+                'views': self.view_num,
+                'resize_ms': round((resized - start) * 1e3, 2),
+                'encode_ms': round((encoded - resized) * 1e3, 2),
+                'view_embed_ms': round((embedded - encoded) * 1e3, 2),
+            }
+            log.debug(f'Multi-view conditioning: {self.last_timings}')
+        return last_hidden_state.unsqueeze(0)
 
     def unconditional_embedding(self, batch_size):
         device = next(self.model.parameters()).device
@@ -24,26 +24,20 @@
 
 import math
 from dataclasses import dataclass
+from functools import partial
 from typing import List, Tuple, Optional
 
 import torch
 from einops import rearrange
 from torch import Tensor, nn
 
+from hy3dgen.shapegen.attention import resolve_backend, scaled_dot_product_attention
 
 
-def attention(q: Tensor, k: Tensor, v: Tensor, **kwargs) -> Tensor:
-    x = torch.nn.functional.scaled_dot_product_attention(q, k, v)
-    x = rearrange(x, "B H L D -> B L (H D)")
-    return x
 
-try:
-    from sageattention import sageattn
-except ImportError:
-    sageattn = None
-    
-def attention_sage(q: Tensor, k: Tensor, v: Tensor, **kwargs) -> Tensor:
-    x = sageattn(q, k, v)
+def attention(q: Tensor, k: Tensor, v: Tensor, backend: Optional[str] = None, **kwargs) -> Tensor:
+    # backend None lets the registry pick (forced / autotuned per shape / sdpa)
+    x = scaled_dot_product_attention(q, k, v, site='dit', backend=backend)
     x = rearrange(x, "B H L D -> B L (H D)")
     return x
 
@@ -154,7 +148,13 @@ class Modulation(nn.Module):
         self.lin = nn.Linear(dim, self.multiplier * dim, bias=True)
 
     def forward(self, vec: Tensor) -> Tuple[ModulationOut, Optional[ModulationOut]]:
-        out = self.lin(nn.functional.silu(vec))[:, None, :]
+        return self.split(self.precompute(vec))
+
+    def precompute(self, vec: Tensor) -> Tensor:
+        """Raw (N, 1, multiplier * dim) modulation for `vec`; split() turns it into ModulationOut."""
+        return self.lin(nn.functional.silu(vec))[:, None, :]
+
+    def split(self, out: Tensor) -> Tuple[ModulationOut, Optional[ModulationOut]]:
         out = out.chunk(self.multiplier, dim=-1)
 
         return (
@@ -170,13 +170,10 @@ class DoubleStreamBlock(nn.Module):
         num_heads: int,
         mlp_ratio: float,
         qkv_bias: bool = False,
-        attention_mode: str = "sdpa",
+        attention_mode: str = "auto",
     ):
-        if attention_mode == "sdpa":
-            self.attention_func = attention
-        elif attention_mode == "sageattn":
-            self.attention_func = attention_sage
         super().__init__()
+        self.attention_func = partial(attention, backend=resolve_backend(attention_mode))
         mlp_hidden_dim = int(hidden_size * mlp_ratio)
         self.num_heads = num_heads
         self.hidden_size = hidden_size
@@ -202,9 +199,14 @@ class DoubleStreamBlock(nn.Module):
             nn.Linear(mlp_hidden_dim, hidden_size, bias=True),
         )
 
-    def forward(self, img: Tensor, txt: Tensor, vec: Tensor, pe: Tensor) -> Tuple[Tensor, Tensor]:
-        img_mod1, img_mod2 = self.img_mod(vec)
-        txt_mod1, txt_mod2 = self.txt_mod(vec)
+    def forward(self, img: Tensor, txt: Tensor, vec: Tensor, pe: Tensor, mod=None) -> Tuple[Tensor, Tensor]:
+        if mod is None:
+            img_mod1, img_mod2 = self.img_mod(vec)
+            txt_mod1, txt_mod2 = self.txt_mod(vec)
+        else:
+            # precomputed by Hunyuan3DDiT.modulations: (img, txt)
+            img_mod1, img_mod2 = self.img_mod.split(mod[0])
+            txt_mod1, txt_mod2 = self.txt_mod.split(mod[1])
 
         img_modulated = self.img_norm1(img)
         img_modulated = (1 + img_mod1.scale) * img_modulated + img_mod1.shift
@@ -245,13 +247,10 @@ class SingleStreamBlock(nn.Module):
         num_heads: int,
         mlp_ratio: float = 4.0,
         qk_scale: Optional[float] = None,
-        attention_mode: str = "sdpa",
+        attention_mode: str = "auto",
     ):
         super().__init__()
-        if attention_mode == "sdpa":
-            self.attention_func = attention
-        elif attention_mode == "sageattn":
-            self.attention_func = attention_sage
+        self.attention_func = partial(attention, backend=resolve_backend(attention_mode))
 
         self.hidden_dim = hidden_size
         self.num_heads = num_heads
@@ -272,8 +271,8 @@ class SingleStreamBlock(nn.Module):
         self.mlp_act = GELU(approximate="tanh")
         self.modulation = Modulation(hidden_size, double=False)
 
-    def forward(self, x: Tensor, vec: Tensor, pe: Tensor) -> Tensor:
-        mod, _ = self.modulation(vec)
+    def forward(self, x: Tensor, vec: Tensor, pe: Tensor, mod=None) -> Tensor:
+        mod, _ = self.modulation(vec) if mod is None else self.modulation.split(mod)
 
         x_mod = (1 + mod.scale) * self.pre_norm(x) + mod.shift
         qkv, mlp = torch.split(self.linear1(x_mod), [3 * self.hidden_size, self.mlp_hidden_dim], dim=-1)
@@ -295,9 +294,11 @@ class LastLayer(nn.Module):
         self.linear = nn.Linear(hidden_size, patch_size * patch_size * out_channels, bias=True)
         self.adaLN_modulation = nn.Sequential(nn.SiLU(), nn.Linear(hidden_size, 2 * hidden_size, bias=True))
 
-    def forward(self, x: Tensor, vec: Tensor) -> Tensor:
-        shift, scale = self.adaLN_modulation(vec).chunk(2, dim=1)
-        x = (1 + scale[:, None, :]) * self.norm_final(x) + shift[:, None, :]
+    def forward(self, x: Tensor, vec: Tensor, mod=None) -> Tensor:
+        if mod is None:
+            mod = self.adaLN_modulation(vec)[:, None, :]
+        shift, scale = mod.chunk(2, dim=-1)
+        x = (1 + scale) * self.norm_final(x) + shift
         x = self.linear(x)
         return x
 
@@ -318,7 +319,7 @@ class Hunyuan3DDiT(nn.Module):
         guidance_embed: bool = False,
         time_factor: float = 1000,
         ckpt_path: Optional[str] = None,
-        attention_mode: str = "sdpa",
+        attention_mode: str = "auto",
         **kwargs,
     ):
         super().__init__()
@@ -405,6 +406,31 @@ class Hunyuan3DDiT(nn.Module):
             print('unexpected keys:', unexpected)
             print('missing keys:', missing)
 
+    def embed_vec(self, t: Tensor, dtype, guidance: Optional[Tensor] = None) -> Tensor:
+        vec = self.time_in(timestep_embedding(t, 256, self.time_factor).to(dtype=dtype))
+        if self.guidance_embed:
+            if guidance is None:
+                raise ValueError("Didn't get guidance strength for guidance distilled model.")
+            vec = vec + self.guidance_in(timestep_embedding(guidance, 256, self.time_factor))
+        return vec
+
+    def modulations(self, vec: Tensor) -> List[Tensor]:
+        """
+        Every block's raw modulation for `vec`, in forward order: (img, txt) pairs of the
+        double blocks, then one per single block, then the final layer's shift/scale.
+        """
+        mods = [
+            (block.img_mod.precompute(vec), block.txt_mod.precompute(vec))
+            for block in self.double_blocks
+        ]
+        mods += [block.modulation.precompute(vec) for block in self.single_blocks]
+        mods.append(self.final_layer.adaLN_modulation(vec)[:, None, :])
+        return mods
+
+    def denoise_session(self, contexts, timesteps: Tensor, cfg: bool, guidance: Optional[Tensor] = None,
+                        step_cache: Optional["StepCache"] = None):
+        return DenoiseSession(self, contexts, timesteps, cfg, guidance, step_cache)
+
     def forward(
         self,
         x,
@@ -412,24 +438,146 @@ class Hunyuan3DDiT(nn.Module):
         contexts,
         **kwargs,
     ) -> Tensor:
-        cond = contexts['main']
         latent = self.latent_in(x)
-        vec = self.time_in(timestep_embedding(t, 256, self.time_factor).to(dtype=latent.dtype))
-        if self.guidance_embed:
-            guidance = kwargs.get('guidance', None)
-            if guidance is None:
-                raise ValueError("Didn't get guidance strength for guidance distilled model.")
-            vec = vec + self.guidance_in(timestep_embedding(guidance, 256, self.time_factor))
-        cond = self.cond_in(cond)
+        mods = kwargs.get('mods', None)
+        if mods is None:
+            vec = self.embed_vec(t, latent.dtype, kwargs.get('guidance', None))
+            mods = self.modulations(vec)
+            cond = self.cond_in(contexts['main'])
+        else:
+            # DenoiseSession: context already projected, modulation precomputed for this step
+            cond = kwargs['cond']
         pe = None
+        hidden = latent
 
-        for block in self.double_blocks:
-            latent, cond = block(img=latent, txt=cond, vec=vec, pe=pe)
+        for block, mod in zip(self.double_blocks, mods):
+            latent, cond = block(img=latent, txt=cond, vec=None, pe=pe, mod=mod)
 
         latent = torch.cat((cond, latent), 1)
-        for block in self.single_blocks:
-            latent = block(latent, vec=vec, pe=pe)
+        for block, mod in zip(self.single_blocks, mods[len(self.double_blocks):]):
+            latent = block(latent, vec=None, pe=pe, mod=mod)
 
         latent = latent[:, cond.shape[1]:, ...]
-        latent = self.final_layer(latent, vec)
+        residual = latent - hidden if kwargs.get('return_residual', False) else None
+        latent = self.final_layer(latent, None, mod=mods[-1])
+        if residual is not None:
+            # StepCache: what the block stack added to latent_in(x)
+            return latent, residual
         return latent
+
+
+class DenoiseSession:
+    """
+    The step-invariant part of one sampling run, computed once instead of per step:
+
+      - cond_in(contexts['main']), the projected conditioning tokens
+      - time (+ guidance) embeddings for the whole schedule in one batched pass
+      - every block's modulation vectors for every step, shape (1, 1, D) — they only
+        depend on the timestep, so they broadcast over the batch
+      - one preallocated CFG input buffer instead of torch.cat([latents] * 2) per step
+
+    `timesteps` are the model's inputs (0..1), one per step; `session(i, latents)` runs
+    step i and returns the raw model output for the (CFG-doubled) batch. With
+    `cfg=False` a CFG session runs the conditional rows alone. With a StepCache the block
+    stack is skipped on steps whose modulated input barely changed.
+    """
+
+    def __init__(self, model: Hunyuan3DDiT, contexts, timesteps: Tensor, cfg: bool,
+                 guidance: Optional[Tensor] = None, step_cache: Optional["StepCache"] = None):
+        self.model = model
+        self.cfg = cfg
+        self.step_cache = step_cache
+        self.cond = model.cond_in(contexts['main'])
+        dtype = self.cond.dtype
+        vec = model.embed_vec(timesteps.to(dtype), dtype, None if guidance is None else guidance[:1].expand(len(timesteps)))
+        mods = model.modulations(vec)
+        self.steps = [
+            [tuple(m[i:i + 1] for m in mod) if isinstance(mod, tuple) else mod[i:i + 1] for mod in mods]
+            for i in range(len(timesteps))
+        ]
+        self.buffer = None
+
+    def __len__(self):
+        return len(self.steps)
+
+    def __call__(self, i: int, latents: Tensor, cfg: Optional[bool] = None) -> Tensor:
+        batch = latents.shape[0]
+        if not self.cfg or cfg is False:
+            # the conditional rows come first (encode_cond appends the unconditional ones)
+            x, cond = latents, self.cond[:batch]
+        else:
+            shape = (2 * batch,) + tuple(latents.shape[1:])
+            if self.buffer is None or tuple(self.buffer.shape) != shape:
+                self.buffer = latents.new_empty(shape)
+            self.buffer[:batch].copy_(latents)
+            self.buffer[batch:].copy_(latents)
+            x, cond = self.buffer, self.cond
+        if self.step_cache is None:
+            return self.model(x, None, None, cond=cond, mods=self.steps[i])
+        return self._cached_step(i, x, cond, batch)
+
+    def _cached_step(self, i: int, x: Tensor, cond: Tensor, batch: int) -> Tensor:
+        model, mods = self.model, self.steps[i]
+        hidden = model.latent_in(x)
+        # TeaCache indicator: the first block's timestep-modulated input (conditional rows)
+        first = model.double_blocks[0]
+        img_mod1, _ = first.img_mod.split(mods[0][0])
+        indicator = (1 + img_mod1.scale) * first.img_norm1(hidden[:batch]) + img_mod1.shift
+        if self.step_cache.should_compute(i, len(self), indicator, x.shape[0]):
+            out, residual = model(x, None, None, cond=cond, mods=mods, return_residual=True)
+            self.step_cache.store(residual)
+            return out
+        return model.final_layer(hidden + self.step_cache.residual[:x.shape[0]], None, mod=mods[-1])
+
+
+class StepCache:
+    """
+    TeaCache-style cross-step cache of the block stack's residual, for one sampling run.
+
+    Each step the relative L1 change of the first block's modulated input is accumulated;
+    while the sum stays below `threshold` the double/single blocks are skipped and the
+    last computed residual is added to latent_in(x) instead. A step is always computed
+    when it is the first or last one, on every `refresh`-th step (0 = no forced refresh),
+    after `max_skips` consecutive skips, or when the cached residual has fewer rows
+    than the step needs (a CFG step after a conditional-only one).
+    """
+
+    def __init__(self, threshold: float = 0.1, refresh: int = 0, max_skips: int = 2):
+        self.threshold = threshold
+        self.refresh = refresh
+        self.max_skips = max_skips
+        self.residual = None
+        self.previous = None
+        self.accumulated = 0.0
+        self.skips_in_row = 0
+        self.computed = 0
+        self.skipped = 0
+
+    def should_compute(self, i: int, num_steps: int, indicator: Tensor, rows: int) -> bool:
+        previous, self.previous = self.previous, indicator
+        if previous is not None:
+            change = (indicator - previous).abs().mean() / previous.abs().mean().clamp_min(1e-6)
+            self.accumulated += change.item()
+        compute = (
+            previous is None
+            or i == num_steps - 1
+            or self.residual is None
+            or self.residual.shape[0] < rows
+            or self.skips_in_row >= self.max_skips
+            or (self.refresh and i % self.refresh == 0)
+            or self.accumulated >= self.threshold
+        )
+        if compute:
+            self.accumulated = 0.0
+            self.skips_in_row = 0
+            self.computed += 1
+        else:
+            self.skips_in_row += 1
+            self.skipped += 1
+        return compute
+
+    def store(self, residual: Tensor):
+        self.residual = residual
+
+    def stats(self) -> dict:
+        return {"computed": self.computed, "skipped": self.skipped}
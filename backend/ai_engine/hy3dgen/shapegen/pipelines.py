@@ -27,6 +27,7 @@ import importlib
 import inspect
 import logging
 import os
+import time
 from typing import List, Optional, Union
 
 import numpy as np
@@ -38,7 +39,6 @@ from diffusers.utils.torch_utils import randn_tensor
 from tqdm import tqdm
 
 from accelerate import init_empty_weights
-from accelerate.utils import set_module_tensor_to_device
 
 # from comfy.utils import ProgressBar
 # import comfy.model_management as mm
@@ -53,7 +53,14 @@ class ProgressBar:
 
 logger = logging.getLogger(__name__)
 
-from hy3dgen.shapegen.schedulers import FlowMatchEulerDiscreteScheduler, ConsistencyFlowMatchEulerDiscreteScheduler
+from hy3dgen.shapegen.schedulers import make_scheduler
+from hy3dgen.shapegen.residency import make_residency_policy
+from hy3dgen.shapegen.quantization import QUANT_TARGETS, load_int8, quantize_int8
+from hy3dgen.shapegen.guidance import GuidanceSchedule
+from hy3dgen.shapegen.conversion import KEY_MAPPING, convert_checkpoint, converted_reader, load_manifest, resolve_config
+from hy3dgen.shapegen.loading import CheckpointReader, LOAD_WORKERS, load_component, peak_rss_gb
+
+CHECKPOINT_COMPONENTS = ('model', 'vae', 'conditioner')
 
 def retrieve_timesteps(
     scheduler,
@@ -153,6 +160,27 @@ def instantiate_from_config(config, **kwargs):
     return instance
 
 
+def compile_models(model, vae, compile_args):
+    """
+    torch.compile the DiT, the whole VAE or just its geo_decoder, in place (the modules
+    keep their identity, so residency policies and attribute access are unaffected).
+
+    compile_args keys: compile_transformer, compile_vae, compile_geo_decoder (bools),
+    dynamo_cache_size_limit, and the optional torch.compile options mode, backend, dynamic.
+    """
+    if "dynamo_cache_size_limit" in compile_args:
+        torch._dynamo.config.cache_size_limit = compile_args["dynamo_cache_size_limit"]
+    options = {"backend": compile_args.get("backend", "inductor"), "dynamic": compile_args.get("dynamic")}
+    if options["backend"] == "inductor" and compile_args.get("mode"):
+        options["mode"] = compile_args["mode"]
+    if compile_args.get("compile_transformer"):
+        model.compile(**options)
+    if compile_args.get("compile_vae"):
+        vae.compile(**options)
+    elif compile_args.get("compile_geo_decoder"):
+        vae.geo_decoder.compile(**options)
+
+
 class Hunyuan3DDiTPipeline:
     @classmethod
     def from_single_file(
@@ -163,118 +191,123 @@ class Hunyuan3DDiTPipeline:
         dtype=torch.float16,
         use_safetensors=None,
         compile_args=None,
-        attention_mode="sdpa",
+        attention_mode="auto",
         cublas_ops=False,
         scheduler="FlowMatchEulerDiscreteScheduler", 
+        quantization=None,
+        quantization_cache=None,
+        components=CHECKPOINT_COMPONENTS,
+        load_device=None,
+        load_workers=LOAD_WORKERS,
+        converted_cache=None,
         **kwargs,
     ):
+        """
+        quantization='int8' stores the DiT block and VAE transformer Linear weights as
+        int8 with per-channel scales (see quantization.py); converted weights are cached
+        under `quantization_cache` when given. A valid cache is loaded straight to
+        `load_device` and the checkpoint's weights for those layers are never read;
+        otherwise the DiT and VAE are converted on the CPU and moved there as int8.
+        attention_mode pins the DiT to a backend of attention.py ('auto' lets it choose).
+        The checkpoint is memory-mapped and only `components` are read (see loading.py);
+        the pipeline needs 'model' and 'conditioner' and is None without them. Weights go
+        straight to `load_device`, by default the main device for the 'resident' policy
+        and `offload_device` otherwise. Per-component timings are in `load_report`.
+        With `converted_cache`, the pre-renamed, pre-cast per-component files of
+        conversion.py are used instead, converted on the first load.
+        """
+        if quantization not in (None, 'int8'):
+            raise ValueError(f"Unsupported quantization {quantization}, available: [None, 'int8']")
+        unknown = set(components) - set(CHECKPOINT_COMPONENTS)
+        if unknown:
+            raise ValueError(f"Unsupported components {sorted(unknown)}, available: {list(CHECKPOINT_COMPONENTS)}")
+        if load_device is None:
+            load_device = device if kwargs.get('residency') == 'resident' else offload_device
+        load_device = torch.device(load_device)
 
         # load ckpt
         if use_safetensors:
             ckpt_path = ckpt_path.replace('.ckpt', '.safetensors')
         if not os.path.exists(ckpt_path):
             raise FileNotFoundError(f"Model file {ckpt_path} not found")
-        logger.info(f"Loading model from {ckpt_path}")
-
-        if use_safetensors:
-            # parse safetensors
-            import safetensors.torch
-            safetensors_ckpt = safetensors.torch.load_file(ckpt_path, device='cpu')
-            ckpt = {}
-            for key, value in safetensors_ckpt.items():
-                model_name = key.split('.')[0]
-                new_key = key[len(model_name) + 1:]
-                if model_name not in ckpt:
-                    ckpt[model_name] = {}
-                ckpt[model_name][new_key] = value
+        logger.info(f"Loading {list(components)} from {ckpt_path} to {load_device}")
+        manifest = None
+        if converted_cache:
+            manifest = load_manifest(converted_cache, ckpt_path, dtype)
+            if manifest is None:
+                try:
+                    manifest = convert_checkpoint(ckpt_path, converted_cache, dtype, bool(use_safetensors))
+                except OSError as e:
+                    logger.warning(f"Could not convert {ckpt_path} into {converted_cache}: {e}")
+        if manifest is not None:
+            # already renamed and cast, config resolved at conversion time
+            reader = converted_reader(converted_cache, ckpt_path, manifest)
+            config = manifest['config']
         else:
-            ckpt = torch.load(ckpt_path, map_location='cpu')
-
-        script_directory = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-        # load config
-        block_nums = set()
-        for k in ckpt["model"].keys():
-            if k.startswith('single_blocks.'):
-                block_num = int(k.split('.')[1])
-                block_nums.add(block_num)
-            elif k.startswith('blocks.'):
-                block_num = int(k.split('.')[1])
-                block_nums.add(block_num)
-    
-        if len(block_nums) < 17:
-            config_path = os.path.join(script_directory, "configs", "dit_config_mini.yaml")
-            logger.info(f"Model has {len(block_nums)} blocks, setting config to dit_config_mini.yaml")
-        else:
-            config_path = os.path.join(script_directory, "configs", "dit_config.yaml")
-            logger.info(f"Model has {len(block_nums)} blocks, setting config to dit_config.yaml")
-        
-        with open(config_path, 'r') as f:
-            config = yaml.safe_load(f)
+            reader = CheckpointReader(ckpt_path, use_safetensors=bool(use_safetensors))
+            config = resolve_config(reader.keys('model'))
 
-        
-        # load model
-        if "guidance_in.in_layer.bias" in ckpt['model']: #guidance_in.in_layer.bias
-            logger.info("Model has guidance_in, setting guidance_embed to True")
-            config['model']['params']['guidance_embed'] = True
-            config['conditioner']['params']['main_image_encoder']['kwargs']['has_guidance_embed'] = True
         config['model']['params']['attention_mode'] = attention_mode
         #config['vae']['params']['attention_mode'] = attention_mode
 
         #if cublas_ops:
         #    config['vae']['params']['cublas_ops'] = True
         
+        modules = {}
         with init_empty_weights():
-            model = instantiate_from_config(config['model'])
-            vae = instantiate_from_config(config['vae'])
-            conditioner = instantiate_from_config(config['conditioner'])
-        # Mapping for V2.1 / Standard naming renames
-        key_mapping = {
-            "latent_in.weight": "x_embedder.weight",
-            "latent_in.bias": "x_embedder.bias",
-            "time_in.in_layer.weight": "t_embedder.mlp.0.weight",
-            "time_in.in_layer.bias": "t_embedder.mlp.0.bias",
-            "time_in.out_layer.weight": "t_embedder.mlp.2.weight",
-            "time_in.out_layer.bias": "t_embedder.mlp.2.bias",
-        }
-
-        #model
-        for name, param in model.named_parameters():
-            ckpt_key = name
-            if ckpt_key not in ckpt['model'] and name in key_mapping:
-                mapped_key = key_mapping[name]
-                if mapped_key in ckpt['model']:
-                    ckpt_key = mapped_key
-            
-            if ckpt_key in ckpt['model']:
-                set_module_tensor_to_device(model, name, device=offload_device, dtype=dtype, value=ckpt['model'][ckpt_key])
-            else:
-                logger.warning(f"Key {name} not found in checkpoint (tried mapping: {ckpt_key})")
-        
-        #vae
-        for name, param in vae.named_parameters():
-            set_module_tensor_to_device(vae, name, device=offload_device, dtype=dtype, value=ckpt['vae'][name])       
-        
-        if 'conditioner' in ckpt:
-            #conditioner.load_state_dict(ckpt['conditioner'])
-            for name, param in conditioner.named_parameters():
-                set_module_tensor_to_device(conditioner, name, device=offload_device, dtype=dtype, value=ckpt['conditioner'][name])
+            for name in components:
+                modules[name] = instantiate_from_config(config[name])
+
+        # a valid int8 cache fills the quantized Linears before the checkpoint is read, so
+        # only the rest of those components is loaded. Otherwise they are read into host
+        # memory and reach load_device as int8 (below), so their full-precision weights
+        # never take up device memory
+        quantized = [name for name in modules if name in QUANT_TARGETS] if quantization == 'int8' else []
+        int8_cached = bool(quantized) and load_int8(
+            {name: modules[name] for name in quantized}, quantization_cache, ckpt_path, load_device)
+        if int8_cached:
+            quantized = []
+        load_report = {'path': ckpt_path, 'converted': manifest is not None, 'components': {}}
+        if quantization == 'int8':
+            load_report['int8_cached'] = int8_cached
+        start = time.perf_counter()
+        for name, module in modules.items():
+            if name not in reader:
+                # checkpoints without a conditioner keep the one instantiated from config
+                logger.warning(f"Component {name} not found in checkpoint")
+                continue
+            target = torch.device('cpu') if name in quantized else load_device
+            load_report['components'][name] = load_component(
+                module, reader, name, target, dtype,
+                key_mapping=KEY_MAPPING if name == 'model' else None, workers=load_workers,
+            )
+            # buffers are not in the checkpoint, bring them along with the parameters
+            module.to(target)
+        load_report['seconds'] = round(time.perf_counter() - start, 3)
+        load_report['peak_rss_gb'] = peak_rss_gb()
+        rss = f", peak host RSS {load_report['peak_rss_gb']} GB" if load_report['peak_rss_gb'] is not None else ""
+        logger.info(f"Checkpoint loaded in {load_report['seconds']}s{rss}")
+
+        model, vae, conditioner = (modules.get(name) for name in CHECKPOINT_COMPONENTS)
+
+        if quantized:
+            targets = {name: modules[name] for name in quantized}
+            quantize_int8(targets, cache_dir=quantization_cache, ckpt_path=ckpt_path)
+            for module in targets.values():
+                module.to(load_device)
+
+        if compile_args is not None:
+            compile_models(model, vae, compile_args)
+
+        if model is None or conditioner is None:
+            return None, vae
 
         image_processor = instantiate_from_config(config['image_processor'])
 
-        if scheduler == "FlowMatchEulerDiscreteScheduler":
-            scheduler = FlowMatchEulerDiscreteScheduler(num_train_timesteps=1000)
-        elif scheduler == "ConsistencyFlowMatchEulerDiscreteScheduler":
-            scheduler = ConsistencyFlowMatchEulerDiscreteScheduler(num_train_timesteps=1000, pcm_timesteps=100)
+        scheduler = make_scheduler(scheduler)
         
         #scheduler = instantiate_from_config(config['scheduler'])
 
-        if compile_args is not None:
-            torch._dynamo.config.cache_size_limit = compile_args["dynamo_cache_size_limit"]
-            if compile_args["compile_transformer"]:
-                model = torch.compile(model)
-            if compile_args["compile_vae"]:
-                vae = torch.compile(vae)
-
         model_kwargs = dict(
             #vae=vae,
             model=model,
@@ -284,10 +317,13 @@ class Hunyuan3DDiTPipeline:
             device=device,
             offload_device=offload_device,
             dtype=dtype,
+            load_device=load_device,
         )
         model_kwargs.update(kwargs)
 
-        return cls(**model_kwargs), vae
+        pipeline = cls(**model_kwargs)
+        pipeline.load_report = load_report
+        return pipeline, vae
 
     # @classmethod
     # def from_pretrained(
@@ -342,6 +378,9 @@ class Hunyuan3DDiTPipeline:
         device=torch.device('cuda'),
         offload_device=torch.device('cpu'),
         dtype=torch.float16,
+        residency='offload',
+        residency_kwargs=None,
+        load_device=None,
         **kwargs
     ):
         #self.vae = vae
@@ -353,7 +392,19 @@ class Hunyuan3DDiTPipeline:
         self.main_device = device
         self.offload_device = offload_device
 
-        self.to(offload_device, dtype)
+        # from_single_file may already have streamed the weights to the main device
+        self.to(load_device or offload_device, dtype)
+        self.load_report = None
+        self.set_residency(residency, **(residency_kwargs or {}))
+
+    def set_residency(self, policy, **kwargs):
+        """
+        Choose where the DiT / conditioner weights live between calls, see residency.py.
+        Other modules (e.g. the VAE) can be registered on `self.residency` as well.
+        """
+        self.residency = make_residency_policy(policy, self.main_device, self.offload_device, **kwargs)
+        self.residency.register('model', self.model)
+        self.residency.register('conditioner', self.conditioner)
 
     def to(self, device=None, dtype=None):
         if device is not None:
@@ -367,13 +418,14 @@ class Hunyuan3DDiTPipeline:
             self.conditioner.to(dtype=dtype)
 
     def encode_cond(self, image, mask, do_classifier_free_guidance, dual_guidance, view_dict=None):
-        self.conditioner.to(self.main_device)
-        bsz = 1
-        cond = self.conditioner(image=image, mask=mask, view_dict=view_dict)
+        with self.residency.use('conditioner'):
+            cond = self.conditioner(image=image, mask=mask, view_dict=view_dict)
+            # one unconditional embedding per conditioned sample, so batched requests keep CFG pairs aligned
+            bsz = next(iter(cond.values())).shape[0]
+            if do_classifier_free_guidance:
+                un_cond = self.conditioner.unconditional_embedding(bsz)
 
         if do_classifier_free_guidance:
-            un_cond = self.conditioner.unconditional_embedding(bsz)
-
             if dual_guidance:
                 un_cond_drop_main = copy.deepcopy(un_cond)
                 un_cond_drop_main['additional'] = cond['additional']
@@ -389,8 +441,6 @@ class Hunyuan3DDiTPipeline:
 
                 cond = cat_recursive(cond, un_cond_drop_main, un_cond)
             else:
-                un_cond = self.conditioner.unconditional_embedding(bsz)
-
                 def cat_recursive(a, b):
                     if isinstance(a, torch.Tensor):
                         return torch.cat([a, b], dim=0).to(self.dtype)
@@ -400,7 +450,6 @@ class Hunyuan3DDiTPipeline:
                     return out
 
                 cond = cat_recursive(cond, un_cond)
-        self.conditioner.to(self.offload_device)
         return cond
 
     def prepare_extra_step_kwargs(self, generator, eta):
@@ -612,10 +661,45 @@ class Hunyuan3DDiTPipeline:
 
 class Hunyuan3DDiTFlowMatchingPipeline(Hunyuan3DDiTPipeline):
 
+    def uses_cfg(self, guidance_scale):
+        return guidance_scale >= 0 and not (
+            hasattr(self.model, 'guidance_embed') and
+            self.model.guidance_embed is True
+        )
+
+    @torch.no_grad()
+    def encode_image(self, image, guidance_scale=7.5, view_dict=None):
+        """
+        Conditioning for `image` (unconditional rows appended when CFG is on). Pass it
+        back as `__call__(cond=...)` with the same guidance_scale to run several
+        diffusion passes, e.g. a few-step draft and the full result, from one encode.
+        """
+        image, mask = self.prepare_image(image)
+        return self.encode_cond(
+            image=image,
+            mask=mask,
+            do_classifier_free_guidance=self.uses_cfg(guidance_scale),
+            dual_guidance=False,
+            view_dict=view_dict
+        )
+
+    def repeat_cond(self, cond, repeats, guidance_scale=7.5):
+        """
+        `cond` from encode_image with sample i repeated repeats[i] times, e.g. to diffuse
+        several seeds per image in one batch; CFG's [cond; uncond] halves stay aligned.
+        """
+        def expand(value):
+            if not isinstance(value, torch.Tensor):
+                return {k: expand(v) for k, v in value.items()}
+            counts = torch.as_tensor(repeats, device=value.device)
+            halves = value.chunk(2) if self.uses_cfg(guidance_scale) else (value,)
+            return torch.cat([half.repeat_interleave(counts, dim=0) for half in halves])
+        return expand(cond)
+
     @torch.no_grad()
     def __call__(
         self,
-        image: torch.Tensor,
+        image: Union[torch.Tensor, Image.Image, List[Image.Image]] = None,
         mask: Optional[torch.Tensor] = None,
         num_inference_steps: int = 50,
         timesteps: List[int] = None,
@@ -631,37 +715,65 @@ class Hunyuan3DDiTFlowMatchingPipeline(Hunyuan3DDiTPipeline):
         # output_type: Optional[str] = "trimesh",
         enable_pbar=True,
         view_dict=None,
+        cond=None,
+        guidance_schedule: Optional[GuidanceSchedule] = None,
+        sampling_stats: Optional[dict] = None,
+        step_cache=None,
+        scheduler=None,
         **kwargs,
     ) -> List[List[trimesh.Trimesh]]:
+        """
+        guidance_schedule limits which steps run the unconditional branch (default: all).
+        sampling_stats, if given, is filled with the DiT rows (batch size) of every step.
+        step_cache, a fresh `StepCache` per call, skips the DiT blocks on near-identical steps.
+        scheduler, a key of SCHEDULERS or an instance, overrides the pipeline's for this call.
+        """
         callback = kwargs.pop("callback", None)
         callback_steps = kwargs.pop("callback_steps", None)
 
+        self.residency.acquire('model')
+        try:
+            return self._sample(
+                image, cond, num_inference_steps, sigmas, guidance_scale, generator,
+                enable_pbar, view_dict, callback, callback_steps,
+                guidance_schedule=guidance_schedule or GuidanceSchedule(),
+                sampling_stats=sampling_stats,
+                step_cache=step_cache,
+                scheduler=self.call_scheduler(scheduler),
+            )
+        finally:
+            self.residency.release('model')
+
+    def call_scheduler(self, scheduler=None):
+        """
+        A scheduler for one sampling call. Step index and timesteps live on the instance,
+        so concurrent or back-to-back calls with different solvers never share one.
+        """
+        if scheduler is None:
+            return self.scheduler.__class__.from_config(self.scheduler.config)
+        return make_scheduler(scheduler)
+
+    def _sample(
+        self, image, cond, num_inference_steps, sigmas, guidance_scale, generator,
+        enable_pbar, view_dict, callback, callback_steps,
+        guidance_schedule, sampling_stats, step_cache, scheduler,
+    ):
         device = self.main_device
         dtype = self.dtype
-        self.model.to(device)
-        self.conditioner.to(device)
-        
-        do_classifier_free_guidance = guidance_scale >= 0 and not (
-            hasattr(self.model, 'guidance_embed') and
-            self.model.guidance_embed is True
-        )
 
-        image, mask = self.prepare_image(image)
-
-        cond = self.encode_cond(
-            image=image,
-            mask=mask,
-            do_classifier_free_guidance=do_classifier_free_guidance,
-            dual_guidance=False,
-            view_dict=view_dict
-        )
-        batch_size = 1
+        do_classifier_free_guidance = self.uses_cfg(guidance_scale)
+        if cond is None:
+            cond = self.encode_image(image, guidance_scale=guidance_scale, view_dict=view_dict)
+        # a list of images runs as one batched diffusion loop; latents come back as [B, 3072, 64]
+        batch_size = next(iter(cond.values())).shape[0]
+        if do_classifier_free_guidance:
+            batch_size //= 2
 
         # 5. Prepare timesteps
         # NOTE: this is slightly different from common usage, we start from 0.
         sigmas = np.linspace(0, 1, num_inference_steps) if sigmas is None else sigmas
         timesteps, num_inference_steps = retrieve_timesteps(
-            self.scheduler,
+            scheduler,
             num_inference_steps,
             device,
             sigmas=sigmas,
@@ -674,36 +786,52 @@ class Hunyuan3DDiTFlowMatchingPipeline(Hunyuan3DDiTPipeline):
             guidance = torch.tensor([guidance_scale] * batch_size, device=device, dtype=dtype)
         print("guidance: ", guidance)
 
+        # NOTE: we assume model get timesteps ranged from 0 to 1
+        # projected context, time embeddings and block modulations for every step up front
+        session = self.model.denoise_session(
+            cond,
+            timesteps.to(latents.dtype) / scheduler.config.num_train_timesteps,
+            cfg=do_classifier_free_guidance,
+            guidance=guidance,
+            step_cache=step_cache,
+        )
+
+        # 'both' runs cond + uncond rows, 'cond' reuses the last uncond prediction,
+        # 'none' runs the conditional branch alone without guidance
+        if do_classifier_free_guidance:
+            plan = guidance_schedule.plan((timesteps / scheduler.config.num_train_timesteps).tolist())
+        else:
+            plan = ['none'] * len(timesteps)
+        rows_per_step = [2 * batch_size if mode == 'both' else batch_size for mode in plan]
+        if sampling_stats is not None:
+            sampling_stats.update(
+                steps=len(plan),
+                cfg_steps=sum(mode != 'none' for mode in plan),
+                rows_per_step=rows_per_step,
+                dit_rows=sum(rows_per_step),
+            )
+
+        noise_pred_uncond = None
         comfy_pbar = ProgressBar(num_inference_steps)
         for i, t in enumerate(tqdm(timesteps, disable=not enable_pbar, desc="Diffusion Sampling:")):
-            # expand the latents if we are doing classifier free guidance
-            if do_classifier_free_guidance:
-                latent_model_input = torch.cat([latents] * 2)
-            else:
-                latent_model_input = latents
-
-            # NOTE: we assume model get timesteps ranged from 0 to 1
-            timestep = t.expand(latent_model_input.shape[0]).to(
-                latents.dtype) / self.scheduler.config.num_train_timesteps
-            noise_pred = self.model(latent_model_input, timestep, cond, guidance=guidance)
+            noise_pred = session(i, latents, cfg=plan[i] == 'both')
 
-            if do_classifier_free_guidance:
-                noise_pred_cond, noise_pred_uncond = noise_pred.chunk(2)
-                noise_pred = noise_pred_uncond + guidance_scale * (noise_pred_cond - noise_pred_uncond)
+            if plan[i] == 'both':
+                noise_pred, noise_pred_uncond = noise_pred.chunk(2)
+            if plan[i] != 'none':
+                noise_pred = noise_pred_uncond + guidance_scale * (noise_pred - noise_pred_uncond)
 
             # compute the previous noisy sample x_t -> x_t-1
-            outputs = self.scheduler.step(noise_pred, t, latents)
+            outputs = scheduler.step(noise_pred, t, latents)
             latents = outputs.prev_sample
 
             if callback is not None and i % callback_steps == 0:
-                step_idx = i // getattr(self.scheduler, "order", 1)
+                step_idx = i // getattr(scheduler, "order", 1)
                 callback(step_idx, t, outputs)
             comfy_pbar.update(1)
+        if sampling_stats is not None and step_cache is not None:
+            sampling_stats.update(cache_computed=step_cache.computed, cache_skipped=step_cache.skipped)
         print("latents shape: ", latents.shape)
-        
-        self.model.to(self.offload_device)
-        self.conditioner.to(self.offload_device)
-        
         return latents
         # return self._export(
         #     latents,
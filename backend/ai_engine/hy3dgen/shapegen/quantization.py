@@ -0,0 +1,237 @@
+# Open Source Model Licensed under the Apache License Version 2.0
+# and Other Licenses of the Third-Party Components therein:
+# The below Model in this distribution may have been modified by THL A29 Limited
+# ("Tencent Modifications"). All Tencent Modifications are Copyright (C) 2024 THL A29 Limited.
+
+# Copyright (C) 2024 THL A29 Limited, a Tencent company.  All rights reserved.
+# The below software and/or models in this distribution may have been
+# modified by THL A29 Limited ("Tencent Modifications").
+# All Tencent Modifications are Copyright (C) THL A29 Limited.
+
+# Hunyuan 3D is licensed under the TENCENT HUNYUAN NON-COMMERCIAL LICENSE AGREEMENT
+# except for the third-party components listed below.
+# Hunyuan 3D does not impose any additional limitations beyond what is outlined
+# in the repsective licenses of these third-party components.
+# Users must comply with all terms and conditions of original licenses of these third-party
+# components and must ensure that the usage of the third party components adheres to
+# all relevant laws and regulations.
+
+# For avoidance of doubts, Hunyuan 3D means the large language models and
+# their software and algorithms, including trained model weights, parameters (including
+# optimizer states), machine-learning model code, inference-enabling code, training-enabling code,
+# fine-tuning enabling code and other elements of the foregoing made publicly available
+# by Tencent in accordance with TENCENT HUNYUAN COMMUNITY LICENSE AGREEMENT.
+
+"""
+Weight-only int8 quantization for the shape DiT and the VAE transformer.
+
+Every `nn.Linear` under QUANT_TARGETS is replaced by an `Int8Linear` holding int8
+weights with one fp scale per output channel (absmax / 127). Activations stay in the
+pipeline dtype and the full-precision weight is never rebuilt: `int8_matmul`
+dequantizes DEQUANT_BLOCK output channels at a time, so a call holds at most one
+(block, in_features) slice on top of its output. Resident weight memory is roughly half
+of fp16 for these layers, on CPU as well as on CUDA.
+
+Converted tensors are cached in one safetensors file per checkpoint under `cache_dir`,
+stamped like conversion.py's manifest: the checkpoint's sha256 and the (inode, mtime_ns,
+size) it was verified at. `load_int8` swaps the cached layers into the still-empty
+modules before the checkpoint is read, so a warm cache never reads the fp16 weights of
+the quantized Linears; `quantize_int8` converts loaded modules and writes the cache.
+"""
+
+import logging
+import os
+from typing import Dict, Optional
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+from hy3dgen.shapegen.conversion import _fingerprint, _same_stamp, file_sha256
+
+logger = logging.getLogger(__name__)
+
+# output channels dequantized per matmul step (see int8_matmul)
+DEQUANT_BLOCK = int(os.environ.get('INT8_DEQUANT_BLOCK', '1024'))
+
+# component -> submodules whose Linear layers are quantized
+QUANT_TARGETS = {
+    'model': ('double_blocks', 'single_blocks'),
+    'vae': ('transformer',),
+}
+
+
+def module_bytes(module: nn.Module) -> int:
+    return sum(t.numel() * t.element_size() for t in list(module.parameters()) + list(module.buffers()))
+
+
+def quantize_weight(weight: torch.Tensor):
+    """(int8 weight, per-output-channel scale) with weight ≈ qweight * scale[:, None]."""
+    weight = weight.float()
+    scale = weight.abs().amax(dim=1).clamp(min=1e-8) / 127
+    qweight = torch.round(weight / scale[:, None]).clamp(-127, 127).to(torch.int8)
+    return qweight, scale
+
+
+def int8_matmul(x: torch.Tensor, qweight: torch.Tensor, scale: torch.Tensor) -> torch.Tensor:
+    """
+    x @ (qweight * scale[:, None]).T in x's dtype, dequantizing DEQUANT_BLOCK output
+    channels at a time so only a (block, in_features) slice of the weight exists in x's
+    dtype at once.
+    """
+    rows = x.reshape(-1, x.shape[-1])
+    scale = scale.to(x.dtype)
+    out = rows.new_empty(rows.shape[0], qweight.shape[0])
+    for start in range(0, qweight.shape[0], DEQUANT_BLOCK):
+        block = slice(start, start + DEQUANT_BLOCK)
+        out[:, block] = F.linear(rows, qweight[block].to(x.dtype)) * scale[block]
+    return out.view(*x.shape[:-1], -1)
+
+
+class Int8Linear(nn.Module):
+    def __init__(self, qweight: torch.Tensor, scale: torch.Tensor, bias: Optional[torch.Tensor], dtype=torch.float16):
+        super().__init__()
+        self.out_features, self.in_features = qweight.shape
+        self.register_buffer('qweight', qweight)
+        self.register_buffer('scale', scale.float())
+        self.bias = nn.Parameter(bias.to(dtype), requires_grad=False) if bias is not None else None
+
+    @classmethod
+    def from_linear(cls, linear: nn.Linear, quantized=None):
+        """`quantized` is a cached (qweight, scale) pair; otherwise the weight is converted."""
+        qweight, scale = quantized if quantized is not None else quantize_weight(linear.weight.data)
+        bias = linear.bias.data if linear.bias is not None else None
+        return cls(qweight.to(linear.weight.device), scale.to(linear.weight.device), bias, dtype=linear.weight.dtype)
+
+    def forward(self, x):
+        out = int8_matmul(x, self.qweight, self.scale)
+        if self.bias is not None:
+            out = out + self.bias.to(x.dtype)
+        return out
+
+    def extra_repr(self):
+        return f'in_features={self.in_features}, out_features={self.out_features}, bias={self.bias is not None}'
+
+
+def _target_linears(components: Dict[str, nn.Module]):
+    """(parent, attribute, cache prefix, Linear) of every QUANT_TARGETS Linear of `components`."""
+    def walk(root, prefix):
+        for name, child in list(root.named_children()):
+            path = f'{prefix}.{name}'
+            if isinstance(child, nn.Linear):
+                yield root, name, path, child
+            else:
+                yield from walk(child, path)
+
+    for component, module in components.items():
+        for target in QUANT_TARGETS.get(component, ()):
+            if hasattr(module, target):
+                yield from walk(getattr(module, target), f'{component}.{target}')
+
+
+def _replace_linears(components: Dict[str, nn.Module], cached: Dict[str, torch.Tensor]) -> Dict[str, torch.Tensor]:
+    converted = {}
+    for parent, name, path, child in list(_target_linears(components)):
+        hit = cached.get(f'{path}.qweight'), cached.get(f'{path}.scale')
+        layer = Int8Linear.from_linear(child, hit if hit[0] is not None and hit[1] is not None else None)
+        converted[f'{path}.qweight'] = layer.qweight
+        converted[f'{path}.scale'] = layer.scale
+        setattr(parent, name, layer)
+    return converted
+
+
+_STAMP_KEYS = ('size', 'mtime', 'mtime_ns', 'inode')
+
+
+def _source_metadata(ckpt_path: str, sha256: str) -> Dict[str, str]:
+    return {key: str(value) for key, value in dict(_fingerprint(ckpt_path), sha256=sha256).items()}
+
+
+def _verified_source(metadata: Dict[str, str], ckpt_path: str) -> Optional[str]:
+    """The checkpoint's sha256 if it is the one the cache was converted from, else None."""
+    try:
+        recorded = {key: int(value) if key in _STAMP_KEYS else value for key, value in (metadata or {}).items()}
+    except ValueError:
+        return None
+    source = _fingerprint(ckpt_path)
+    if recorded.get('size') != source['size'] or 'sha256' not in recorded:
+        return None
+    if _same_stamp(recorded, source):
+        return recorded['sha256']
+    return recorded['sha256'] if file_sha256(ckpt_path) == recorded['sha256'] else None
+
+
+def cache_path(cache_dir: str, ckpt_path: str) -> str:
+    return os.path.join(cache_dir, os.path.splitext(os.path.basename(ckpt_path))[0] + '.int8.safetensors')
+
+
+def load_cache(path: str, ckpt_path: Optional[str], device='cpu') -> Dict[str, torch.Tensor]:
+    """Cached tensors on `device`, or {} when missing or converted from a different checkpoint."""
+    if not os.path.exists(path):
+        return {}
+    from safetensors import safe_open
+    with safe_open(path, framework='pt', device=str(device)) as f:
+        metadata = f.metadata()
+        sha256 = _verified_source(metadata, ckpt_path) if ckpt_path is not None else None
+        if ckpt_path is not None and sha256 is None:
+            logger.info(f'Quantized cache {path} is stale, converting again')
+            return {}
+        tensors = {key: f.get_tensor(key) for key in f.keys()}
+    if ckpt_path is not None and metadata != _source_metadata(ckpt_path, sha256):
+        # same bytes under a new stamp (e.g. a copied checkpoint): record it so the next
+        # load trusts the hash without reading the checkpoint again
+        try:
+            save_cache(path, tensors, ckpt_path, sha256)
+        except OSError as e:
+            logger.warning(f'Could not restamp {path}: {e}')
+    return tensors
+
+
+def save_cache(path: str, tensors: Dict[str, torch.Tensor], ckpt_path: Optional[str], sha256: Optional[str] = None):
+    import safetensors.torch
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    tensors = {key: value.detach().cpu().contiguous() for key, value in tensors.items()}
+    metadata = _source_metadata(ckpt_path, sha256 or file_sha256(ckpt_path)) if ckpt_path else None
+    safetensors.torch.save_file(tensors, tmp, metadata=metadata)
+    os.replace(tmp, path)
+
+
+def load_int8(components: Dict[str, nn.Module], cache_dir: Optional[str], ckpt_path: Optional[str], device) -> bool:
+    """
+    Swap the QUANT_TARGETS Linear layers of the empty (meta) `components` for Int8Linear
+    filled from `cache_dir` on `device`, before the checkpoint is read: only their biases
+    remain to be loaded. Returns False, leaving the modules untouched, unless the cache
+    matches ckpt_path and covers exactly these layers.
+    """
+    if not cache_dir or not ckpt_path:
+        return False
+    path = cache_path(cache_dir, ckpt_path)
+    expected = {f'{layer[2]}.{kind}' for layer in _target_linears(components) for kind in ('qweight', 'scale')}
+    cached = load_cache(path, ckpt_path, device)
+    if not cached or cached.keys() != expected:
+        return False
+    for parent, name, prefix, linear in list(_target_linears(components)):
+        bias = linear.bias.data if linear.bias is not None else None
+        setattr(parent, name, Int8Linear(cached[f'{prefix}.qweight'], cached[f'{prefix}.scale'], bias, dtype=linear.weight.dtype))
+    logger.info(f'int8 weight-only: {len(cached) // 2} layers loaded from {path}')
+    return True
+
+
+def quantize_int8(components: Dict[str, nn.Module], cache_dir: Optional[str] = None, ckpt_path: Optional[str] = None):
+    """
+    Swap the QUANT_TARGETS Linear layers of `components` ({'model': dit, 'vae': vae}) for
+    Int8Linear in place, reusing `cache_dir`'s converted weights when they match ckpt_path.
+    Returns {'before': bytes, 'after': bytes, 'cached': bool}.
+    """
+    path = cache_path(cache_dir, ckpt_path) if cache_dir and ckpt_path else None
+    cached = load_cache(path, ckpt_path) if path else {}
+    before = sum(module_bytes(module) for module in components.values())
+    converted = _replace_linears(components, cached)
+    hit = bool(cached) and cached.keys() == converted.keys()
+    if path and not hit:
+        save_cache(path, converted, ckpt_path)
+        logger.info(f'Saved {len(converted) // 2} int8 layers to {path}')
+    after = sum(module_bytes(module) for module in components.values())
+    logger.info(f'int8 weight-only: {before / 2 ** 30:.2f} GB -> {after / 2 ** 30:.2f} GB ({"cached" if hit else "converted"})')
+    return {'before': before, 'after': after, 'cached': hit}
@@ -0,0 +1,233 @@
+# Open Source Model Licensed under the Apache License Version 2.0
+# and Other Licenses of the Third-Party Components therein:
+# The below Model in this distribution may have been modified by THL A29 Limited
+# ("Tencent Modifications"). All Tencent Modifications are Copyright (C) 2024 THL A29 Limited.
+
+# Copyright (C) 2024 THL A29 Limited, a Tencent company.  All rights reserved.
+# The below software and/or models in this distribution may have been
+# modified by THL A29 Limited ("Tencent Modifications").
+# All Tencent Modifications are Copyright (C) THL A29 Limited.
+
+# Hunyuan 3D is licensed under the TENCENT HUNYUAN NON-COMMERCIAL LICENSE AGREEMENT
+# except for the third-party components listed below.
+# Hunyuan 3D does not impose any additional limitations beyond what is outlined
+# in the repsective licenses of these third-party components.
+# Users must comply with all terms and conditions of original licenses of these third-party
+# components and must ensure that the usage of the third party components adheres to
+# all relevant laws and regulations.
+
+# For avoidance of doubts, Hunyuan 3D means the large language models and
+# their software and algorithms, including trained model weights, parameters (including
+# optimizer states), machine-learning model code, inference-enabling code, training-enabling code,
+# fine-tuning enabling code and other elements of the foregoing made publicly available
+# by Tencent in accordance with TENCENT HUNYUAN COMMUNITY LICENSE AGREEMENT.
+
+"""
+Weight residency policies for the shape pipeline.
+
+The pipeline used to move the DiT and the conditioner onto the GPU at the start of
+every call and back to `offload_device` at the end - gigabytes of PCIe traffic per
+request. Components are now registered with a policy and bracketed with
+`policy.use(name)`; the policy decides where the weights live between uses:
+
+    'offload'   move back to offload_device after every use (original behaviour)
+    'resident'  move to the main device once and keep them there
+    'idle'      keep them on device, offload after `idle_timeout` seconds unused
+    'pressure'  keep them on device while free device memory stays above
+                `min_free_gb`; otherwise offload idle components, LRU first
+"""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+
+def _module_bytes(module: torch.nn.Module) -> int:
+    return sum(t.numel() * t.element_size() for t in list(module.parameters()) + list(module.buffers()))
+
+
+def _free_device_bytes(device) -> int:
+    device = torch.device(device)
+    if device.type != 'cuda' or not torch.cuda.is_available():
+        return 1 << 62
+    free, _ = torch.cuda.mem_get_info(device)
+    return free
+
+
+class _Component:
+    def __init__(self, module):
+        self.module = module
+        self.on_device = False
+        self.users = 0
+        self.last_used = time.monotonic()
+        self.transfers = 0
+        self.transfer_s = 0.0
+        self.timer = None
+
+
+class ResidencyPolicy:
+    """Base policy: components are moved to `device` on use and never moved back."""
+
+    name = 'resident'
+
+    def __init__(self, device='cuda', offload_device=torch.device('cpu')):
+        self.device = device
+        self.offload_device = offload_device
+        self.components = {}
+        self._lock = threading.RLock()
+
+    def register(self, name, module):
+        with self._lock:
+            self.components[name] = _Component(module)
+            self.on_register(name)
+
+    def on_register(self, name):
+        self._move(name, to_device=True)
+
+    def on_acquire(self, name):
+        pass
+
+    def on_release(self, name):
+        pass
+
+    @contextmanager
+    def use(self, name):
+        """Make `name` resident on the main device for the duration of the block."""
+        self.acquire(name)
+        try:
+            yield self.components[name].module
+        finally:
+            self.release(name)
+
+    def acquire(self, name):
+        with self._lock:
+            comp = self.components[name]
+            comp.users += 1
+            if comp.timer is not None:
+                comp.timer.cancel()
+                comp.timer = None
+            if not comp.on_device:
+                self.on_acquire(name)
+                self._move(name, to_device=True)
+
+    def release(self, name):
+        with self._lock:
+            comp = self.components[name]
+            comp.users -= 1
+            comp.last_used = time.monotonic()
+            if comp.users == 0:
+                self.on_release(name)
+
+    def offload(self, name):
+        with self._lock:
+            comp = self.components[name]
+            if comp.users == 0 and comp.on_device:
+                self._move(name, to_device=False)
+
+    def _move(self, name, to_device):
+        comp = self.components[name]
+        target = self.device if to_device else self.offload_device
+        start = time.monotonic()
+        comp.module.to(target)
+        if torch.device(self.device).type == 'cuda' and torch.cuda.is_available():
+            torch.cuda.synchronize()
+        elapsed = time.monotonic() - start
+        comp.on_device = to_device
+        comp.transfers += 1
+        comp.transfer_s += elapsed
+        logger.info(f'[residency:{self.name}] {name} -> {target} in {elapsed:.2f}s')
+
+    def stats(self):
+        with self._lock:
+            return {
+                'policy': self.name,
+                'components': {
+                    name: {
+                        'device': str(self.device if comp.on_device else self.offload_device),
+                        'in_use': comp.users > 0,
+                        'size_mb': round(_module_bytes(comp.module) / 2 ** 20, 1),
+                        'transfers': comp.transfers,
+                        'transfer_s': round(comp.transfer_s, 3),
+                        'idle_s': round(time.monotonic() - comp.last_used, 1),
+                    }
+                    for name, comp in self.components.items()
+                },
+            }
+
+
+class AlwaysResident(ResidencyPolicy):
+    name = 'resident'
+
+
+class OffloadAfterUse(ResidencyPolicy):
+    name = 'offload'
+
+    def on_register(self, name):
+        pass
+
+    def on_release(self, name):
+        self.offload(name)
+
+
+class OffloadAfterIdle(ResidencyPolicy):
+    name = 'idle'
+
+    def __init__(self, device='cuda', offload_device=torch.device('cpu'), idle_timeout=300.0):
+        super().__init__(device, offload_device)
+        self.idle_timeout = idle_timeout
+
+    def on_release(self, name):
+        comp = self.components[name]
+        comp.timer = threading.Timer(self.idle_timeout, self.offload, args=(name,))
+        comp.timer.daemon = True
+        comp.timer.start()
+
+
+class OffloadUnderPressure(ResidencyPolicy):
+    name = 'pressure'
+
+    def __init__(self, device='cuda', offload_device=torch.device('cpu'), min_free_gb=2.0):
+        super().__init__(device, offload_device)
+        self.min_free_bytes = int(min_free_gb * 2 ** 30)
+
+    def on_register(self, name):
+        self.on_acquire(name)
+        self._move(name, to_device=True)
+
+    def on_acquire(self, name):
+        # make room for the incoming weights by evicting idle components, least recently used first
+        needed = _module_bytes(self.components[name].module) + self.min_free_bytes
+        idle = sorted(
+            (n for n, c in self.components.items() if n != name and c.on_device and c.users == 0),
+            key=lambda n: self.components[n].last_used,
+        )
+        for other in idle:
+            if _free_device_bytes(self.device) >= needed:
+                break
+            self.offload(other)
+
+    def on_release(self, name):
+        if _free_device_bytes(self.device) < self.min_free_bytes:
+            self.offload(name)
+
+
+RESIDENCY_POLICIES = {
+    'offload': OffloadAfterUse,
+    'resident': AlwaysResident,
+    'idle': OffloadAfterIdle,
+    'pressure': OffloadUnderPressure,
+}
+
+
+def make_residency_policy(policy, device='cuda', offload_device=torch.device('cpu'), **kwargs):
+    """Accepts a policy instance or a key of RESIDENCY_POLICIES (kwargs go to its constructor)."""
+    if isinstance(policy, ResidencyPolicy):
+        return policy
+    if policy not in RESIDENCY_POLICIES:
+        raise ValueError(f'Unsupported residency policy {policy}, available: {list(RESIDENCY_POLICIES.keys())}')
+    return RESIDENCY_POLICIES[policy](device, offload_device, **kwargs)
@@ -321,6 +321,148 @@ class FlowMatchEulerDiscreteScheduler(SchedulerMixin, ConfigMixin):
         return self.config.num_train_timesteps
 
 
+class _FlowMatchSolver(FlowMatchEulerDiscreteScheduler):
+    """
+    Shared plumbing of the higher-order flow-matching solvers below. They reuse Euler's
+    `set_timesteps` (so `shift` and `use_dynamic_shifting`/`time_shift(mu, ...)` shape the
+    sigma grid the same way) and then turn the grid into solver intervals:
+
+    sigma runs from 0 (noise) to 1 (data) and the model predicts the velocity dx/dsigma.
+    The pipeline's default grid `np.linspace(0, 1, n)` already ends at 1; Euler then takes
+    a zero-length last step, which the solvers drop instead of spending a model call on it.
+    """
+
+    def set_timesteps(
+        self,
+        num_inference_steps: int = None,
+        device: Union[str, torch.device] = None,
+        sigmas: Optional[List[float]] = None,
+        mu: Optional[float] = None,
+    ):
+        # time_shift divides by sigma; sigma = 0 (pure noise) maps to 0 as intended
+        with np.errstate(divide="ignore"):
+            super().set_timesteps(num_inference_steps, device=device, sigmas=sigmas, mu=mu)
+        points = self.sigmas
+        if len(points) > 2 and points[-1] == points[-2]:
+            points = points[:-1]
+        self.sigmas = points
+        # python floats for the per-step coefficients (no device syncs inside step)
+        self._points = points.cpu().tolist()
+        self._set_solver_timesteps(device)
+        self.num_inference_steps = len(self.timesteps)
+        self._step_index = None
+        self._begin_index = None
+
+    def _set_solver_timesteps(self, device):
+        raise NotImplementedError
+
+    def _init_step_index(self, timestep):
+        # the evaluation points can repeat (Heun), so the loop position is the index
+        self._step_index = self._begin_index or 0
+
+    def _output(self, prev_sample, model_output, return_dict):
+        prev_sample = prev_sample.to(model_output.dtype)
+        self._step_index += 1
+        if not return_dict:
+            return (prev_sample,)
+        return FlowMatchEulerDiscreteSchedulerOutput(prev_sample=prev_sample)
+
+
+class FlowMatchHeunDiscreteScheduler(_FlowMatchSolver):
+    """
+    Heun's method (explicit trapezoid, 2nd order): two model calls per interval. The
+    timesteps list every evaluation point, `[s0, s1, s1, s2, s2, ..., s_n]`, so the
+    pipeline loop calls the model and `step` once per entry as it does for Euler; even
+    entries take an Euler predictor step, odd entries apply the averaged correction.
+    """
+
+    order = 2
+
+    def _set_solver_timesteps(self, device):
+        evals = torch.stack([self.sigmas[:-1], self.sigmas[1:]], dim=1).flatten()
+        self.timesteps = (evals * self.config.num_train_timesteps).to(device=device)
+        self._predictor = None
+
+    def step(
+        self,
+        model_output: torch.FloatTensor,
+        timestep: Union[float, torch.FloatTensor],
+        sample: torch.FloatTensor,
+        generator: Optional[torch.Generator] = None,
+        return_dict: bool = True,
+    ) -> Union[FlowMatchEulerDiscreteSchedulerOutput, Tuple]:
+        if self.step_index is None:
+            self._init_step_index(timestep)
+
+        interval = self.step_index // 2
+        dt = self._points[interval + 1] - self._points[interval]
+        velocity = model_output.to(torch.float32)
+        if self.step_index % 2 == 0:
+            sample = sample.to(torch.float32)
+            self._predictor = (sample, velocity)
+            prev_sample = sample + dt * velocity
+        else:
+            start, start_velocity = self._predictor
+            self._predictor = None
+            prev_sample = start + dt * 0.5 * (start_velocity + velocity)
+        return self._output(prev_sample, model_output, return_dict)
+
+
+class FlowMatchDPMSolverMultistepScheduler(_FlowMatchSolver):
+    """
+    DPM-Solver++(2M) for flow matching: one model call per interval, second order from
+    the previous interval's data prediction.
+
+    With x = sigma * x0 + (1 - sigma) * noise, the data prediction is
+    x0 = x + (1 - sigma) * v and lambda = log(sigma / (1 - sigma)). The first interval
+    (lambda = -inf at pure noise) and the last one (lambda = +inf at sigma = 1, where the
+    update returns the data prediction itself) fall back to first order.
+    """
+
+    order = 1
+
+    def _set_solver_timesteps(self, device):
+        self.timesteps = (self.sigmas[:-1] * self.config.num_train_timesteps).to(device=device)
+        self._previous = None  # (x0 prediction, h) of the last interval
+
+    @staticmethod
+    def _lambda(sigma: float) -> float:
+        if sigma <= 0.0:
+            return -math.inf
+        if sigma >= 1.0:
+            return math.inf
+        return math.log(sigma) - math.log1p(-sigma)
+
+    def step(
+        self,
+        model_output: torch.FloatTensor,
+        timestep: Union[float, torch.FloatTensor],
+        sample: torch.FloatTensor,
+        generator: Optional[torch.Generator] = None,
+        return_dict: bool = True,
+    ) -> Union[FlowMatchEulerDiscreteSchedulerOutput, Tuple]:
+        if self.step_index is None:
+            self._init_step_index(timestep)
+
+        s, t = self._points[self.step_index], self._points[self.step_index + 1]
+        sample = sample.to(torch.float32)
+        x0 = sample + (1.0 - s) * model_output.to(torch.float32)
+        h = self._lambda(t) - self._lambda(s)
+
+        denoised = x0
+        if self._previous is not None:
+            x0_prev, h_prev = self._previous
+            if math.isfinite(h) and math.isfinite(h_prev) and h > 0:
+                r = h_prev / h
+                denoised = (1 + 0.5 / r) * x0 - (0.5 / r) * x0_prev
+        self._previous = (x0, h)
+
+        # x_t = (1 - t) / (1 - s) * x_s + sigma_t * (1 - exp(-h)) * D, in a form that
+        # stays finite at s = 0 and t = 1
+        prev_sample = (1.0 - t) / (1.0 - s) * sample + (t - (1.0 - t) * s / (1.0 - s)) * denoised
+        return self._output(prev_sample, model_output, return_dict)
+
+
 @dataclass
 class ConsistencyFlowMatchEulerDiscreteSchedulerOutput(BaseOutput):
     prev_sample: torch.FloatTensor
@@ -477,4 +619,29 @@ class ConsistencyFlowMatchEulerDiscreteScheduler(SchedulerMixin, ConfigMixin):
                                                                 pred_original_sample=pred_original_sample)
 
     def __len__(self):
-        return self.config.num_train_timesteps
\ No newline at end of file
+        return self.config.num_train_timesteps
+
+# short key -> (class, constructor defaults); the class name works as a key too
+SCHEDULERS = {
+    'euler': (FlowMatchEulerDiscreteScheduler, {}),
+    'heun': (FlowMatchHeunDiscreteScheduler, {}),
+    'dpmpp_2m': (FlowMatchDPMSolverMultistepScheduler, {}),
+    'consistency': (ConsistencyFlowMatchEulerDiscreteScheduler, {'pcm_timesteps': 100}),
+}
+
+
+def make_scheduler(scheduler, **kwargs):
+    """
+    Accepts a scheduler instance or a key of SCHEDULERS (kwargs override its defaults).
+    Schedulers keep their step index and timesteps on the instance, so every sampling
+    call should use one of its own rather than sharing the pipeline's.
+    """
+    if isinstance(scheduler, SchedulerMixin):
+        return scheduler
+    for key, (cls, _) in SCHEDULERS.items():
+        if scheduler == cls.__name__:
+            scheduler = key
+    if scheduler not in SCHEDULERS:
+        raise ValueError(f'Unsupported scheduler {scheduler}, available: {list(SCHEDULERS.keys())}')
+    cls, defaults = SCHEDULERS[scheduler]
+    return cls(**{'num_train_timesteps': 1000, **defaults, **kwargs})
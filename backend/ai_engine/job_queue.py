@@ -0,0 +1,346 @@
+"""
+Bounded in-process job scheduler for the AI engine.
+
+FastAPI's BackgroundTasks runs every accepted request at once in the threadpool,
+so N concurrent /generate-3d calls mean N generations fighting over one
+pipeline/vae on the GPU. `StagedExecutor` replaces that with a chain of stages:
+
+    preprocess (CPU pool) -> gpu (GPU slots, micro-batched) -> postprocess (CPU pool)
+
+Each `Stage` has its own worker pool and a bounded input queue:
+
+  - admission control: the first stage raises `QueueFullError` when its queue is full
+  - backpressure: a worker blocks handing results downstream while the next queue is
+    full, so a slow stage holds the ones before it instead of piling up memory
+  - dynamic micro-batching: a free worker takes up to `max_batch` waiting jobs,
+    holding the first one for at most `max_wait` seconds while the batch fills
+  - per-stage occupancy (utilisation, time blocked on hand-off) and wait/run timings
+
+A stage handler receives a list of 1..max_batch payloads. It returns None to pass
+all of them on, or the list of payloads that should continue (dropping the ones it
+already failed), or a `(forward, completed)` pair when it finished some jobs itself
+(e.g. cache hits) and they should skip the remaining stages. Whatever leaves the
+last stage counts as completed. A handler that raises fails its whole batch; payloads
+carrying a pending `result` Future (GenJob) get the exception set on it, so nothing
+awaiting them hangs.
+"""
+
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Future, InvalidStateError
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger("AI-Engine")
+
+# How many recent samples each stage keeps for its wait-time statistics
+STAGE_HISTORY = 100
+# Window (seconds) over which stage utilisation is reported
+UTILIZATION_WINDOW = 60.0
+
+
+class QueueFullError(Exception):
+    """Raised by `StagedExecutor.submit` when the first stage is at capacity."""
+
+
+class Job:
+    def __init__(self, payload: Any, job_id: Optional[str] = None):
+        self.id = job_id or uuid.uuid4().hex
+        self.payload = payload
+        self.submitted_at = time.monotonic()
+        self.enqueued_at = self.submitted_at
+
+
+class StageStats:
+    """Rolling window of durations (seconds) for one stage."""
+
+    def __init__(self, maxlen: int = STAGE_HISTORY):
+        self.samples = deque(maxlen=maxlen)
+        self.count = 0
+
+    def add(self, seconds: float):
+        self.samples.append(seconds)
+        self.count += 1
+
+    def summary(self) -> dict:
+        if not self.samples:
+            return {"count": self.count, "avg_s": None, "p95_s": None, "last_s": None}
+        ordered = sorted(self.samples)
+        p95 = ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+        return {
+            "count": self.count,
+            "avg_s": round(sum(ordered) / len(ordered), 3),
+            "p95_s": round(p95, 3),
+            "last_s": round(self.samples[-1], 3),
+        }
+
+
+class Stage:
+    def __init__(
+        self,
+        name: str,
+        handler: Callable[[List[Any]], Optional[List[Any]]],
+        workers: int = 1,
+        max_queue: int = 8,
+        max_batch: int = 1,
+        max_wait: float = 0.0,
+    ):
+        if workers < 1:
+            raise ValueError(f"{name}: workers must be >= 1, got {workers}")
+        if max_queue < 0:
+            raise ValueError(f"{name}: max_queue must be >= 0, got {max_queue}")
+        if max_batch < 1:
+            raise ValueError(f"{name}: max_batch must be >= 1, got {max_batch}")
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.max_queue = max_queue
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+
+        self.next: Optional["Stage"] = None
+        self.on_finished: Optional[Callable[[int, int], None]] = None
+        self._pending = deque()
+        self._running = []
+        self._cond = threading.Condition()
+        self._wait = StageStats()
+        self._run = StageStats()
+        self._batches = StageStats()
+        self._busy = deque(maxlen=1000)  # (start, end) of finished handler calls
+        self._active = {}                # worker thread -> start of its current handler call
+        self._blocked_s = 0.0
+        self._closed = False
+        self._threads = []
+
+    def start(self):
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker, name=f"{self.name}-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def in_flight(self) -> int:
+        with self._cond:
+            return len(self._pending) + len(self._running)
+
+    def put(self, job: Job, block: bool = True) -> int:
+        """
+        Hand `job` to this stage. With block=False raise QueueFullError when full,
+        otherwise wait for space (backpressure). Returns the number of jobs ahead of it.
+        """
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError(f"{self.name} stage is shut down")
+                idle = max(self.workers - len(self._running), 0)
+                if len(self._pending) < self.max_queue + idle:
+                    break
+                if not block:
+                    raise QueueFullError(
+                        f"{self.name} queue is full ({len(self._pending)} waiting, {len(self._running)} running)"
+                    )
+                self._cond.wait()
+            ahead = len(self._pending) + len(self._running)
+            job.enqueued_at = time.monotonic()
+            self._pending.append(job)
+            self._cond.notify_all()
+        return ahead
+
+    def shutdown(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def join(self):
+        for t in self._threads:
+            t.join()
+
+    def stats(self, now: float) -> dict:
+        with self._cond:
+            window_start = now - UTILIZATION_WINDOW
+            busy = sum(max(0.0, min(end, now) - max(start, window_start)) for start, end in self._busy)
+            busy += sum(now - max(start, window_start) for start in self._active.values())
+            return {
+                "workers": self.workers,
+                "depth": len(self._pending),
+                "running": len(self._running),
+                "max_queue": self.max_queue,
+                "max_batch": self.max_batch,
+                "utilization": round(busy / (self.workers * UTILIZATION_WINDOW), 3),
+                "blocked_s": round(self._blocked_s, 3),
+                "avg_batch_size": round(sum(self._batches.samples) / len(self._batches.samples), 2)
+                if self._batches.samples else None,
+                "wait": self._wait.summary(),
+                "run": self._run.summary(),
+            }
+
+    def _take_batch(self) -> List[Job]:
+        """Block for the first job, then coalesce more until max_batch or max_wait. Caller holds the lock."""
+        while True:
+            while not self._pending and not self._closed:
+                self._cond.wait()
+            if not self._pending:
+                return []
+
+            deadline = self._pending[0].enqueued_at + self.max_wait
+            while len(self._pending) < self.max_batch and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            # another worker may have taken the jobs while this one was waiting
+            if self._pending:
+                break
+
+        batch = []
+        while self._pending and len(batch) < self.max_batch:
+            batch.append(self._pending.popleft())
+        return batch
+
+    def _worker(self):
+        me = threading.current_thread()
+        while True:
+            with self._cond:
+                batch = self._take_batch()
+                if not batch:
+                    return
+                start = time.monotonic()
+                for job in batch:
+                    self._wait.add(start - job.enqueued_at)
+                self._running.extend(batch)
+                self._batches.add(len(batch))
+                self._active[me] = start
+                # space opened up in the queue; wake any upstream worker blocked in put()
+                self._cond.notify_all()
+
+            if len(batch) > 1:
+                logger.info(f"[QUEUE] {self.name}: running batch of {len(batch)}: {[job.id for job in batch]}")
+            forward, finished = [], []
+            try:
+                results = self.handler([job.payload for job in batch])
+                if results is None:
+                    forward = batch
+                else:
+                    done = []
+                    if isinstance(results, tuple):
+                        results, done = results
+                    keep = {id(p) for p in results}
+                    done = {id(p) for p in done}
+                    forward = [job for job in batch if id(job.payload) in keep]
+                    finished = [job for job in batch if id(job.payload) in done]
+            except Exception as e:
+                logger.error(f"[QUEUE] {self.name}: batch {[job.id for job in batch]} raised: {e}")
+                for job in batch:
+                    reject(job.payload, e)
+            end = time.monotonic()
+
+            with self._cond:
+                del self._active[me]
+                self._busy.append((start, end))
+                self._run.add(end - start)
+
+            if self.next is not None:
+                for job in list(forward):
+                    try:
+                        self.next.put(job, block=True)
+                    except RuntimeError as e:
+                        logger.error(f"[QUEUE] {self.name}: dropping {job.id}: {e}")
+                        forward.remove(job)
+                with self._cond:
+                    self._blocked_s += time.monotonic() - end
+
+            with self._cond:
+                for job in batch:
+                    self._running.remove(job)
+                self._cond.notify_all()
+
+            if self.on_finished is not None:
+                completed = len(finished) + (len(forward) if self.next is None else 0)
+                self.on_finished(completed, len(batch) - len(forward) - len(finished))
+
+
+def reject(payload: Any, error: BaseException):
+    """Resolve the payload's pending `result` Future, if it has one, with `error`."""
+    future = getattr(payload, "result", None)
+    if isinstance(future, Future):
+        try:
+            future.set_exception(error)
+        except InvalidStateError:  # already resolved by the handler
+            pass
+
+
+class StagedExecutor:
+    def __init__(self, stages: List[Stage]):
+        if not stages:
+            raise ValueError("StagedExecutor needs at least one stage")
+        self.stages = stages
+        for stage, nxt in zip(stages, stages[1:] + [None]):
+            stage.next = nxt
+            stage.on_finished = self._account
+        self._lock = threading.Lock()
+        self._timings: Dict[str, StageStats] = {}
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        for stage in stages:
+            stage.start()
+
+    def submit(self, payload: Any, job_id: Optional[str] = None) -> int:
+        """
+        Admit `payload` into the first stage. Returns how many jobs are ahead of it
+        anywhere in the pipeline (0 means nothing is ahead of it).
+        Raises QueueFullError when the first stage's queue is full.
+        """
+        job = Job(payload, job_id=job_id)
+        try:
+            ahead = self.stages[0].put(job, block=False)
+        except QueueFullError:
+            with self._lock:
+                self._rejected += 1
+            raise
+        ahead += sum(stage.in_flight() for stage in self.stages[1:])
+        logger.info(f"[QUEUE] Job {job.id} admitted, {ahead} job(s) ahead")
+        return ahead
+
+    def record_stage(self, name: str, seconds: float):
+        with self._lock:
+            self._timings.setdefault(name, StageStats()).add(seconds)
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time a block of work inside a job and report it under `name`."""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record_stage(name, time.monotonic() - start)
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        stages = {stage.name: stage.stats(now) for stage in self.stages}
+        busiest = max(stages, key=lambda name: stages[name]["utilization"])
+        with self._lock:
+            return {
+                "depth": sum(s["depth"] for s in stages.values()),
+                "running": sum(s["running"] for s in stages.values()),
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "bottleneck": busiest if stages[busiest]["utilization"] > 0 else None,
+                "stages": stages,
+                "timings": {name: s.summary() for name, s in self._timings.items()},
+            }
+
+    def shutdown(self, wait: bool = False):
+        """Stop admitting jobs. With wait=True, drain each stage into the next before closing it."""
+        for stage in self.stages:
+            stage.shutdown()
+            if wait:
+                stage.join()
+
+    def _account(self, completed: int, failed: int):
+        with self._lock:
+            self._completed += completed
+            self._failed += failed
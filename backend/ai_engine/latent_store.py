@@ -0,0 +1,151 @@
+"""
+Per-asset store for raw DiT latents.
+
+The diffusion loop is ~34s of a ~55s job; everything after it (VAE forward, volume
+decode, surface extraction) only needs the `(1, 3072, 64)` latents. Keeping them lets
+`/remesh` (and RunPod `{"remesh": true}`) rebuild a mesh at another octree resolution,
+mc_level, bounds or surface extractor in seconds.
+
+Each asset is `<root>/<asset_id>.npy` (fp16, ~384 KB, loadable with mmap_mode='r')
+plus `<asset_id>.json` with the parameters it was generated with. Both are written
+to a temp file first and published with os.replace.
+
+With `max_bytes` set the store is an LRU like result_cache.py: a load touches the
+.npy's mtime, and every save evicts the least recently used assets under an exclusive
+flock on `<root>/.lock` until the distinct files fit. Aliases are hard links of the
+same files, so they count once and only free space when the last name goes.
+"""
+
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+import uuid
+from typing import Optional, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows dev boxes: eviction falls back to the in-process lock only
+    fcntl = None
+
+logger = logging.getLogger("AI-Engine")
+
+_SAFE_ID = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+
+class LatentStore:
+    def __init__(self, root: str, max_bytes: Optional[int] = None):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def _path(self, asset_id: str, ext: str) -> str:
+        if not _SAFE_ID.match(asset_id) or asset_id.startswith("."):
+            raise ValueError(f"Invalid asset_id for latent store: {asset_id!r}")
+        return os.path.join(self.root, asset_id + ext)
+
+    def _publish(self, path: str, write):
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def save(self, asset_id: str, latents: np.ndarray, meta: Optional[dict] = None):
+        array = np.ascontiguousarray(latents, dtype=np.float16)
+        self._publish(self._path(asset_id, ".npy"), lambda f: np.save(f, array))
+        meta = dict(meta or {}, shape=list(array.shape), dtype="float16")
+        self._publish(self._path(asset_id, ".json"), lambda f: f.write(json.dumps(meta).encode()))
+        if self.max_bytes is not None:
+            self.evict()
+
+    def alias(self, src_id: str, dst_id: str):
+        """Make `dst_id` resolve to the same latents as `src_id` (hard link, copy as fallback)."""
+        for ext in (".npy", ".json"):
+            src = self._path(src_id, ext)
+            if not os.path.exists(src):
+                continue
+            tmp = os.path.join(self.root, f".{dst_id}{ext}.{uuid.uuid4().hex}.tmp")
+            try:
+                os.link(src, tmp)
+            except OSError:
+                shutil.copyfile(src, tmp)
+            os.replace(tmp, self._path(dst_id, ext))
+
+    def exists(self, asset_id: str) -> bool:
+        try:
+            return os.path.exists(self._path(asset_id, ".npy"))
+        except ValueError:
+            return False
+
+    def load(self, asset_id: str, mmap: bool = True) -> Tuple[np.ndarray, dict]:
+        """Returns the fp16 latents (memory-mapped, read-only by default) and their metadata."""
+        path = self._path(asset_id, ".npy")
+        latents = np.load(path, mmap_mode="r" if mmap else None)
+        try:
+            os.utime(path)
+        except FileNotFoundError:  # evicted after the load: the mapping stays valid
+            pass
+        meta_path = self._path(asset_id, ".json")
+        meta = {}
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+        return latents, meta
+
+    def _entries(self):
+        """(asset_id, stat of its .npy) for every stored asset."""
+        for name in os.listdir(self.root):
+            if not name.endswith(".npy") or name.startswith("."):
+                continue
+            try:
+                yield name[:-len(".npy")], os.stat(os.path.join(self.root, name))
+            except FileNotFoundError:
+                continue
+
+    def _bytes(self, entries) -> int:
+        # hard-linked aliases share one inode: count its bytes once
+        return sum({(st.st_dev, st.st_ino): st.st_size for _, st in entries}.values())
+
+    def size_bytes(self) -> int:
+        return self._bytes(list(self._entries()))
+
+    def evict(self):
+        """Delete least recently used assets until the distinct .npy files fit in max_bytes."""
+        with self._lock, open(os.path.join(self.root, ".lock"), "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            entries = sorted(self._entries(), key=lambda e: e[1].st_mtime)
+            total = self._bytes(entries)
+            for asset_id, st in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    # the last name of an inode frees its bytes, an alias only drops a name
+                    last = os.stat(self._path(asset_id, ".npy")).st_nlink == 1
+                except FileNotFoundError:
+                    continue
+                for ext in (".npy", ".json"):
+                    try:
+                        os.remove(self._path(asset_id, ext))
+                    except FileNotFoundError:
+                        pass
+                if last:
+                    total -= st.st_size
+                self.evictions += 1
+                logger.info(f"[LATENTS] Evicted {asset_id} ({st.st_size} bytes)")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"evictions": self.evictions, "max_bytes": self.max_bytes}
@@ -0,0 +1,147 @@
+"""
+Content-addressed disk cache for finished meshes.
+
+The Worker re-sends the same concept image on retries and regenerations. A result is
+keyed by a hash of the preprocessed RGBA canvas plus every parameter that changes the
+output (steps, guidance, seed, octree resolution, mc_level, checkpoint identity), so a
+hit can be uploaded without touching the GPU.
+
+Layout: `<root>/<key[:2]>/<key>.stl`. Several workers may share the directory (e.g. a
+network volume):
+
+  - writes go to a temp file in the same directory and are published with os.replace,
+    so readers only ever see complete files
+  - a hit touches the file's mtime, which is the LRU order used for eviction
+  - eviction holds an exclusive flock on `<root>/.lock` so two workers don't both trim
+  - a file evicted between lookup and read is treated as a miss
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows dev boxes: eviction falls back to the in-process lock only
+    fcntl = None
+
+logger = logging.getLogger("AI-Engine")
+
+SUFFIX = ".stl"
+
+
+def cache_key(canvas: bytes, params: dict) -> str:
+    """sha256 over the canvas bytes and the generation parameters (order-independent)."""
+    h = hashlib.sha256()
+    h.update(canvas)
+    h.update(json.dumps(params, sort_keys=True, default=str).encode())
+    return h.hexdigest()
+
+
+def checkpoint_identity(path: str) -> str:
+    """Cheap identity for a multi-GB checkpoint: name, size and mtime instead of a full hash."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return os.path.basename(path)
+    return f"{os.path.basename(path)}:{st.st_size}:{int(st.st_mtime)}"
+
+
+class ResultCache:
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key + SUFFIX)
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:  # evicted after the read: the bytes are still a hit
+            pass
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put(self, key: str, data: bytes):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        with self._lock:
+            self.stores += 1
+        self.evict()
+
+    def _entries(self):
+        for sub in os.listdir(self.root):
+            subdir = os.path.join(self.root, sub)
+            if not os.path.isdir(subdir):
+                continue
+            for name in os.listdir(subdir):
+                if not name.endswith(SUFFIX):
+                    continue
+                path = os.path.join(subdir, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, st.st_size, st.st_mtime
+
+    def size_bytes(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits in max_bytes."""
+        with self._lock, open(os.path.join(self.root, ".lock"), "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            entries = sorted(self._entries(), key=lambda e: e[2])
+            total = sum(size for _, size, _ in entries)
+            for path, size, _ in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                self.evictions += 1
+                logger.info(f"[CACHE] Evicted {os.path.basename(path)} ({size} bytes)")
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "max_bytes": self.max_bytes,
+            }
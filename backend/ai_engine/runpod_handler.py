@@ -1,13 +1,9 @@
 import runpod
 import os
 import sys
+import asyncio
 import torch
 import logging
-import requests
-import io
-import time
-import numpy as np
-from PIL import Image
 
 # Ensure hy3dgen is in path
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -17,33 +13,32 @@ sys.path.insert(0, CURRENT_DIR)
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("RunPod-Handler")
 
-# REMBG setup
-try:
-    from rembg import remove, new_session
-    REMBG_SESSION = new_session("isnet-general-use")
-    REMBG_AVAILABLE = True
-    logger.info("rembg loaded with model: isnet-general-use")
-except ImportError:
-    REMBG_AVAILABLE = False
-    logger.warning("rembg not installed, background removal will be skipped.")
+from job_queue import QueueFullError
+from generation import (
+    GenerationStages, job_from_input, checkpoint_kwargs, make_chunk_tuner, make_latent_store, make_result_cache, quantization_kwargs, residency_kwargs,
+)
+from result_cache import checkpoint_identity
+from warmup import warm_up
+
+# We use typical RunPod network volume path
+MODEL_PATH = os.environ.get("MODEL_PATH", "/runpod-volume/hunyuan3d-dit-v2_fp16.safetensors")
+DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
 
 # Load Pipeline Globally (Warm Start)
 try:
     from hy3dgen.shapegen import Hunyuan3DDiTFlowMatchingPipeline
     
-    # We use typical RunPod network volume path
-    MODEL_PATH = os.environ.get("MODEL_PATH", "/runpod-volume/hunyuan3d-dit-v2_fp16.safetensors")
-    DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
-    
     logger.info(f"Loading model from {MODEL_PATH} on {DEVICE}...")
     pipeline, vae = Hunyuan3DDiTFlowMatchingPipeline.from_single_file(
         ckpt_path=MODEL_PATH,
         device=DEVICE,
-        use_safetensors=True
+        use_safetensors=True,
+        **residency_kwargs(),
+        **quantization_kwargs(),
+        **checkpoint_kwargs()
     )
-    vae.to(DEVICE)
     vae.eval()
-    logger.info("Model loaded successfully and VAE moved to DEVICE!")
+    logger.info("Model loaded successfully!")
     
 except Exception as e:
     logger.error(f"Failed to load model: {e}")
@@ -52,57 +47,41 @@ except Exception as e:
     pipeline = None
     vae = None
 
-def download_image(url):
-    logger.info(f"Downloading image from {url}")
-    resp = requests.get(url, timeout=10)
-    resp.raise_for_status()
-    # Return raw Image, do not convert to RGB yet
-    return Image.open(io.BytesIO(resp.content))
+# Concurrent RunPod jobs on this worker share the staged executor (see generation.py),
+# so one job's download/rembg and another's marching cubes/upload overlap with diffusion.
+CONCURRENCY = int(os.environ.get("RUNPOD_CONCURRENCY", "4"))
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", "4"))
+BATCH_WAIT_MS = float(os.environ.get("BATCH_WAIT_MS", "250"))
 
-def process_image(raw_image):
-    if REMBG_AVAILABLE:
-        logger.info("[REMBG] Running isnet-general-use background removal...")
-        rgba_image = remove(raw_image, session=REMBG_SESSION)
-        
-        data = np.array(rgba_image)
-        alpha = data[:, :, 3]
-        data[:, :, 3] = np.where(alpha < 200, 0, 255)  # Strict binary: 0 or 255
-        rgba_image = Image.fromarray(data)
-        
-        w, h = rgba_image.size
-        import PIL.ImageDraw as ImageDraw
-        draw = ImageDraw.Draw(rgba_image)
-        border = 20
-        draw.rectangle([0, 0, w, border], fill=(0,0,0,0))
-        draw.rectangle([0, h-border, w, h], fill=(0,0,0,0))
-        draw.rectangle([0, 0, border, h], fill=(0,0,0,0))
-        draw.rectangle([w-border, 0, w, h], fill=(0,0,0,0))
-        
-        bbox = rgba_image.getbbox()
-        if bbox:
-            rgba_image = rgba_image.crop(bbox)
-        
-        max_size = 512
-        side_len = int(max_size * 0.75)  # 25% total padding
-        w, h = rgba_image.size
-        # Protect against divide by zero if image becomes empty
-        if w > 0 and h > 0:
-            scale = side_len / max(w, h)
-            new_w, new_h = int(w * scale), int(h * scale)
-            rgba_image = rgba_image.resize((new_w, new_h), Image.Resampling.LANCZOS)
-        else:
-            new_w, new_h = w, h
-        
-        canvas = Image.new("RGBA", (max_size, max_size), (0, 0, 0, 0))  # fully transparent
-        paste_x = (max_size - new_w) // 2
-        paste_y = (max_size - new_h) // 2
-        canvas.paste(rgba_image, (paste_x, paste_y), rgba_image)
-        
-        return canvas
-    else:
-        return raw_image.convert("RGB")
+stages = GenerationStages(
+    device=DEVICE,
+    cache=make_result_cache(),
+    latent_store=make_latent_store(),
+    checkpoint_id=checkpoint_identity(MODEL_PATH),
+    chunk_tuner=make_chunk_tuner(),
+    # Browser User-Agent to bypass WAF bot protection on the webhook
+    webhook_headers={
+        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+    },
+)
+if pipeline is not None:
+    stages.attach(pipeline, vae)
+    # Compile + dummy generation before the first job; artifacts persist on the volume
+    try:
+        warm_up(stages)
+    except Exception as e:
+        logger.warning(f"[WARMUP] Warm-up failed: {e}")
+executor = stages.build_executor(
+    preprocess_workers=int(os.environ.get("PREPROCESS_WORKERS", "2")),
+    gpu_slots=int(os.environ.get("GPU_SLOTS", "1")),
+    postprocess_workers=int(os.environ.get("POSTPROCESS_WORKERS", "2")),
+    max_queue=CONCURRENCY,
+    handoff_queue=int(os.environ.get("HANDOFF_QUEUE_SIZE", "2")),
+    max_batch=MAX_BATCH_SIZE,
+    max_wait=BATCH_WAIT_MS / 1000,
+)
 
-def handler(job):
+async def handler(job):
     job_input = job.get("input", {})
     
     # Validation
@@ -113,105 +92,26 @@ def handler(job):
         logger.info("Wakeup ping received. Container is warm.")
         return {"status": "success", "message": "Container is warm"}
     
-    image_url = job_input.get("image_url")
-    webhook_url = job_input.get("webhook_url")
-    session_id = job_input.get("session_id", "unknown-session")
-    asset_id = job_input.get("asset_id", "unknown-asset")
-    
-    if not image_url:
-        return {"error": "Missing image_url"}
-    
     try:
-        # 1. Download Image & Process
-        raw_image = download_image(image_url)
-        image = process_image(raw_image)
-        
-        # 2. Inference
-        logger.info(f"Starting inference for {session_id}...")
-        start_time = time.time()
-        
-        with torch.no_grad():
-            # Step 1: Diffusion
-            logger.info("Step 1: Pipeline call started...")
-            latents = pipeline(
-                image=image, 
-                num_inference_steps=50, # Production quality
-                enable_pbar=False
-            )
-            
-            # Step 1b: VAE forward pass (CRITICAL: apply scale_factor and post_kl)
-            logger.info("Step 1b: VAE forward pass...")
-            latents = latents / vae.scale_factor
-            latents = vae(latents)
-            
-            # Step 2: VAE Decode
-            logger.info("Step 2: VAE mesh generation started... Using 256 resolution.")
-            meshes = vae.latents2mesh(
-                latents,
-                bounds=1.01,
-                octree_resolution=256,
-                mc_level=-1/512,
-                num_chunks=8000
-            )
-        
-        duration = time.time() - start_time
-        logger.info(f"Generation took {duration:.2f}s")
-        
-        if not meshes:
-             return {"error": "No mesh generated"}
-             
-        # Export to Buffer
-        mesh_obj = meshes[0] if isinstance(meshes, list) else meshes
-        
-        # Safe extraction if it's the custom struct format
-        try:
-            from hy3dgen.shapegen.pipelines import export_to_trimesh
-            mesh = export_to_trimesh(mesh_obj)
-        except Exception as e:
-            logger.warning(f"Export to trimesh failed, using raw mesh: {e}")
-            mesh = mesh_obj
+        gen_job = job_from_input(job_input)
+    except ValueError as e:
+        return {"error": str(e)}
+    if gen_job.remesh and (stages.latent_store is None or not stages.latent_store.exists(gen_job.asset_id)):
+        return {"error": f"No stored latents for {gen_job.asset_id}"}
+    try:
+        executor.submit(gen_job, job_id=gen_job.asset_id)
+    except QueueFullError as e:
+        return {"error": str(e)}
 
-        # Export binary STL
-        mesh_buffer = io.BytesIO()
-        mesh.export(mesh_buffer, file_type='stl')
-        mesh_bytes = mesh_buffer.getvalue()
-        
-        logger.info(f"Mesh generated: {len(mesh_bytes)} bytes")
-        
-        # 3. Webhook Callback (Custom)
-        if webhook_url:
-            logger.info(f"Sending result to webhook: {webhook_url}")
-            files = {
-                'file': (f'{asset_id}.stl', mesh_bytes, 'model/stl')
-            }
-            data = {
-                'session_id': session_id,
-                'asset_id': asset_id,
-                'status': 'completed'
-            }
-            headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-            }
-            try:
-                # Add headers to bypass WAF bot protection
-                r = requests.post(webhook_url, data=data, files=files, headers=headers, timeout=30)
-                logger.info(f"Webhook response status: {r.status_code}")
-                logger.info(f"Webhook response body: {r.text[:500]}")
-                if r.status_code != 200:
-                    logger.warning(f"Non-200 webhook response!")
-            except Exception as w_err:
-                logger.error(f"Webhook failed: {w_err}")
-                return {"error": f"Webhook failed: {w_err}", "mesh_size": len(mesh_bytes)}
-            
-        return {
-            "status": "success",
-            "message": "Mesh generated and sent via webhook",
-            "duration": duration
-        }
-        
-    except Exception as e:
-        logger.error(f"Handler error: {e}")
-        import traceback
-        return {"error": str(e), "traceback": traceback.format_exc()}
+    try:
+        result = await asyncio.wrap_future(gen_job.result)
+    except Exception as e:  # the stage handler raised for the whole batch
+        return {"error": str(e)}
+    if "duration" in result:
+        logger.info(f"Generation took {result['duration']:.2f}s")
+    return result
+
+def concurrency_modifier(current_concurrency):
+    return CONCURRENCY
 
-runpod.serverless.start({"handler": handler})
+runpod.serverless.start({"handler": handler, "concurrency_modifier": concurrency_modifier})
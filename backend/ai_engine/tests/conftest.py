@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Make the service modules (main.py, job_queue.py, ...) and the vendored hy3dgen importable from tests
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
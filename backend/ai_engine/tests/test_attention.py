@@ -0,0 +1,55 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("diffusers")
+
+from hy3dgen.shapegen import attention
+from hy3dgen.shapegen.attention import autotune, force_backend, resolve_backend, scaled_dot_product_attention
+
+
+@pytest.fixture(autouse=True)
+def fresh_registry():
+    attention.reset()
+    yield
+    attention.reset()
+    attention._forced.clear()
+
+
+def qkv(q_len=10, kv_len=7):
+    torch.manual_seed(0)
+    return torch.randn(1, 2, q_len, 8), torch.randn(1, 2, kv_len, 8), torch.randn(1, 2, kv_len, 8)
+
+
+class TestAttentionRegistry:
+    """Test backend dispatch, forcing and the start-up micro-benchmark"""
+
+    def test_chunked_matches_sdpa(self, monkeypatch):
+        monkeypatch.setattr(attention, "ATTENTION_CHUNK", 3)
+        q, k, v = qkv()
+        expected = torch.nn.functional.scaled_dot_product_attention(q, k, v)
+        assert torch.allclose(scaled_dot_product_attention(q, k, v, backend="chunked"), expected, atol=1e-6)
+
+    def test_autotune_decides_recorded_shapes(self):
+        q, k, v = qkv()
+        scaled_dot_product_attention(q, k, v, site="vae_cross")
+        report = autotune(repeats=1)
+        assert report["tuned"]
+        [decision] = report["decisions"]
+        assert decision["site"] == "vae_cross" and decision["q"] == [1, 2, 10, 8]
+        assert decision["backend"] in ("sdpa", "chunked")
+        assert report["site_defaults"] == {"vae_cross": decision["backend"]}
+
+    def test_forced_site_wins(self, monkeypatch):
+        calls = []
+        monkeypatch.setitem(attention.ATTENTION_BACKENDS, "chunked", (lambda q, k, v: calls.append(q) or q, lambda *a: True))
+        force_backend("dit", "chunked")
+        q, k, v = qkv()
+        scaled_dot_product_attention(q, k, v, site="dit")
+        scaled_dot_product_attention(q, k, v, site="vae_self")
+        assert len(calls) == 1
+
+    def test_legacy_modes(self):
+        assert resolve_backend("sageattn") == "sage"
+        assert resolve_backend("auto") is None
+        with pytest.raises(ValueError):
+            resolve_backend("triton")
@@ -0,0 +1,46 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+trimesh = pytest.importorskip("trimesh")
+
+from candidates import bbox_fill, pick_best, score_candidate
+
+
+def hollow_ball(n=32, radius=12, wall=3):
+    z, y, x = np.mgrid[:n, :n, :n] - n / 2
+    r = np.sqrt(x ** 2 + y ** 2 + z ** 2)
+    return (r < radius) & (r > radius - wall)
+
+
+class TestBboxFill:
+    """Test the occupancy / bounding-box ratio"""
+
+    def test_solid_box_fills_its_bbox(self):
+        occupancy = np.zeros((16, 16, 16), dtype=bool)
+        occupancy[2:10, 3:7, 4:12] = True
+        assert bbox_fill(occupancy) == 1.0
+
+    def test_empty_grid(self):
+        assert bbox_fill(np.zeros((4, 4, 4), dtype=bool)) == 0.0
+
+
+class TestScoreCandidate:
+    """Test ranking candidates by geometric sanity"""
+
+    def test_prefers_single_watertight_shape(self):
+        ball = trimesh.creation.icosphere()
+        floaters = trimesh.util.concatenate([ball, ball.copy().apply_translation([5, 0, 0])])
+        occupancy = hollow_ball()
+        scores = [score_candidate(floaters, occupancy), score_candidate(ball, occupancy)]
+        assert scores[1]["components"] == 1 and scores[1]["watertight"]
+        assert pick_best(scores) == 1
+
+    def test_penalises_box_artifacts(self):
+        mesh = trimesh.creation.box()
+        slab = np.ones((8, 8, 8), dtype=bool)
+        assert score_candidate(mesh, slab)["score"] < score_candidate(mesh, hollow_ball())["score"]
+
+    def test_failed_extraction_never_wins(self):
+        scores = [score_candidate(None, hollow_ball()), score_candidate(trimesh.creation.box(), hollow_ball())]
+        assert scores[0]["score"] == float("-inf")
+        assert pick_best(scores) == 1
@@ -0,0 +1,67 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("transformers")
+pytest.importorskip("diffusers")
+
+from hy3dgen.shapegen.models.conditioner import DinoImageEncoder
+
+
+@pytest.fixture(scope="module")
+def encoder():
+    torch.manual_seed(0)
+    config = dict(
+        hidden_size=8, num_hidden_layers=1, num_attention_heads=2, intermediate_size=16,
+        image_size=28, patch_size=14,
+    )
+    return DinoImageEncoder(config=config, image_size=28)
+
+
+def views(n, size=28):
+    torch.manual_seed(1)
+    return [torch.rand(1, 4, size, size) for _ in range(n)]
+
+
+class TestMultiViewEncoding:
+    """Test the batched multi-view path of ImageEncoder"""
+
+    def test_view_embedding_follows_the_tag(self, encoder):
+        front, back = views(2)
+        with torch.no_grad():
+            out = encoder(None, view_dict={"front": front, "back": back})[0]
+            hidden = encoder.model(encoder.prepare_views(torch.cat([front, back]))).last_hidden_state
+        patches = encoder.num_patches
+        assert torch.allclose(out[:patches], hidden[0] + encoder.view_embed[0, 0], atol=1e-5)
+        assert torch.allclose(out[patches:], hidden[1] + encoder.view_embed[0, 2], atol=1e-5)
+
+    def test_partial_view_set_embeds_by_tag(self, encoder):
+        """Fewer than four views take each tag's embedding, not the one at their list position"""
+        left, back, right = views(3)
+        with torch.no_grad():
+            out = encoder(None, view_dict={"left": left, "back": back, "right": right})[0]
+            hidden = encoder.model(encoder.prepare_views(torch.cat([left, back, right]))).last_hidden_state
+        patches = encoder.num_patches
+        for position, view_index in enumerate([1, 2, 3]):
+            rows = out[position * patches:(position + 1) * patches]
+            assert torch.allclose(rows, hidden[position] + encoder.view_embed[0, view_index], atol=1e-5)
+            assert not torch.allclose(rows, hidden[position] + encoder.view_embed[0, position], atol=1e-5)
+
+    def test_mixed_sizes_match_stacked(self, encoder):
+        front, left = views(2)
+        small = torch.nn.functional.interpolate(left, size=(56, 56))
+        with torch.no_grad():
+            stacked = encoder(None, view_dict={"front": front, "left": left})
+            mixed = encoder(None, view_dict={"front": front, "left": small})
+        assert stacked.shape == mixed.shape
+        assert torch.allclose(stacked[:, :encoder.num_patches], mixed[:, :encoder.num_patches], atol=1e-5)
+
+    def test_stage_timings_are_opt_in(self, encoder, monkeypatch):
+        front, left = views(2)
+        monkeypatch.setattr(encoder, "last_timings", None)
+        with torch.no_grad():
+            encoder(None, view_dict={"front": front, "left": left})
+            assert encoder.last_timings is None
+            monkeypatch.setattr(encoder, "time_stages", True)
+            encoder(None, view_dict={"front": front, "left": left})
+        assert encoder.last_timings["views"] == 2
+        assert {"resize_ms", "encode_ms", "view_embed_ms"} <= encoder.last_timings.keys()
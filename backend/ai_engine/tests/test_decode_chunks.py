@@ -0,0 +1,67 @@
+import json
+
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from decode_chunks import MIN_CHUNKS, ChunkTuner, is_oom
+
+
+class FakeDecode:
+    """Decode whose time falls with the chunk size and which OOMs above `max_chunks`."""
+
+    def __init__(self, max_chunks):
+        self.max_chunks = max_chunks
+        self.calls = []
+
+    def __call__(self, num_chunks):
+        self.calls.append(num_chunks)
+        if num_chunks > self.max_chunks:
+            raise torch.cuda.OutOfMemoryError("CUDA out of memory. Tried to allocate 2.00 GiB")
+        return num_chunks
+
+
+def fake_measure(run, num_chunks, device):
+    run(num_chunks)
+    return 1.0 / num_chunks, num_chunks * 2 ** 20
+
+
+class TestChunkTuner:
+    """Test probing, persistence and OOM back-off of the decode chunk size"""
+
+    def test_tune_picks_fastest_that_fits_and_persists(self, tmp_path):
+        path = tmp_path / "chunks.json"
+        tuner = ChunkTuner(str(path), default=8000)
+        decode = FakeDecode(max_chunks=32000)
+        result = tuner.tune(decode, "cpu", 256, "VanillaVolumeDecoder",
+                            limit=20000 * 2 ** 20, measure=fake_measure)
+        assert result["num_chunks"] == 16000
+        assert decode.calls == [4000, 8000, 16000, 32000]
+        assert ChunkTuner(str(path), default=8000).get("cpu", 256, "VanillaVolumeDecoder") == 16000
+        assert list(json.loads(path.read_text())) == ["cpu|256|VanillaVolumeDecoder"]
+
+    def test_tune_stops_at_first_oom(self):
+        tuner = ChunkTuner(None, default=8000)
+        decode = FakeDecode(max_chunks=8000)
+        assert tuner.tune(decode, "cpu", 384, "Hierarchical", measure=fake_measure)["num_chunks"] == 8000
+        assert decode.calls == [4000, 8000, 16000]
+
+    def test_run_backs_off_and_remembers(self):
+        tuner = ChunkTuner(None, default=8000)
+        decode = FakeDecode(max_chunks=2500)
+        assert tuner.run(decode, "cpu", 384, "Vanilla") == 2000
+        assert decode.calls == [8000, 4000, 2000]
+        assert tuner.get("cpu", 384, "Vanilla") == 2000
+        assert tuner.stats()["backoffs"] == 2
+
+    def test_run_gives_up_below_minimum(self):
+        tuner = ChunkTuner(None, default=MIN_CHUNKS)
+        with pytest.raises(torch.cuda.OutOfMemoryError):
+            tuner.run(FakeDecode(max_chunks=0), "cpu", 512, "Vanilla")
+
+    def test_other_errors_propagate(self):
+        def broken(num_chunks):
+            raise ValueError("bad latents")
+        assert not is_oom(ValueError("bad latents"))
+        with pytest.raises(ValueError):
+            ChunkTuner(None, default=8000).run(broken, "cpu", 256, "Vanilla")
@@ -0,0 +1,129 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+np = pytest.importorskip("numpy")
+torch = pytest.importorskip("torch")
+pytest.importorskip("einops")
+pytest.importorskip("diffusers")
+
+from hy3dgen.shapegen.models.autoencoders.attention_blocks import CrossAttentionDecoder, FourierEmbedder, QueryEmbeddingCache
+from hy3dgen.shapegen.models.autoencoders.attention_processors import FlashVDMCrossAttentionProcessor
+from hy3dgen.shapegen.models.autoencoders.volume_decoders import (
+    FlashVDMVolumeDecoding, HierarchicalVolumeDecoding, VanillaVolumeDecoder, generate_dense_grid_points,
+)
+
+
+@pytest.fixture(scope="module")
+def decoder():
+    torch.manual_seed(0)
+    return CrossAttentionDecoder(
+        num_latents=12, out_channels=1, fourier_embedder=FourierEmbedder(num_freqs=4),
+        width=16, heads=2, qk_norm=True,
+    ).eval()
+
+
+def inputs(batch=2):
+    torch.manual_seed(1)
+    return torch.rand(batch, 50, 3) * 2 - 1, torch.randn(batch, 12, 16)
+
+
+class TestDecodeSession:
+    """Test the once-per-mesh K/V projection of the geo decoder"""
+
+    def test_matches_per_chunk_projection(self, decoder):
+        queries, latents = inputs()
+        with torch.no_grad(), decoder.decode_session(latents) as session:
+            cached = decoder(queries=queries, latents=latents, kv=session.kv)
+            expected = decoder(queries=queries, latents=latents)
+        assert torch.allclose(cached, expected, atol=1e-6)
+
+    def test_released_on_exit(self, decoder):
+        _, latents = inputs()
+        with torch.no_grad(), decoder.decode_session(latents) as session:
+            pass
+        with pytest.raises(RuntimeError):
+            session.kv
+
+    def test_batch_one_kv_broadcasts_for_topk(self, decoder):
+        queries, latents = inputs(batch=3)
+        latents = latents[:1]
+        processor = FlashVDMCrossAttentionProcessor()
+        decoder.set_cross_attention_processor(processor)
+        try:
+            with torch.no_grad():
+                processor.topk = True
+                expected = decoder(queries=queries, latents=latents.expand(3, -1, -1))
+                with decoder.decode_session(latents) as session:
+                    processor.topk = True
+                    cached = decoder(queries=queries, latents=latents, kv=session.kv)
+        finally:
+            decoder.set_default_cross_attention_processor()
+        assert torch.allclose(cached, expected, atol=1e-6)
+
+    @pytest.mark.parametrize("volume_decoder", [VanillaVolumeDecoder(), HierarchicalVolumeDecoding()])
+    def test_volume_decoders_project_once(self, decoder, volume_decoder, monkeypatch):
+        _, latents = inputs(batch=1)
+        calls = []
+        project = decoder.project_kv
+        monkeypatch.setattr(decoder, "project_kv", lambda x: calls.append(x) or project(x))
+        volume_decoder(latents, decoder, octree_resolution=16, min_resolution=8, num_chunks=500, enable_pbar=False)
+        assert len(calls) == 1
+
+    @pytest.mark.parametrize("volume_decoder", [HierarchicalVolumeDecoding(), FlashVDMVolumeDecoding()])
+    def test_batch_rows_decode_independently(self, decoder, volume_decoder):
+        _, latents = inputs(batch=2)
+        run = lambda latents: volume_decoder(latents, decoder, octree_resolution=16, min_resolution=8,
+                                             num_chunks=500, enable_pbar=False)
+        try:
+            batched = run(latents)
+            rows = [run(latents[i:i + 1]) for i in range(2)]
+        finally:
+            decoder.set_default_cross_attention_processor()
+        assert batched.shape[0] == 2
+        for i, row in enumerate(rows):
+            assert torch.allclose(batched[i:i + 1], row, atol=1e-5, equal_nan=True)
+        assert not torch.allclose(rows[0], rows[1], equal_nan=True)
+
+
+class TestQueryEmbeddingCache:
+    """Test the per-lattice cache of projected query embeddings"""
+
+    def test_matches_projection(self, decoder):
+        lattice = ((-1.0, -1.0, -1.0), (1.0, 1.0, 1.0), 8)
+        xyz, _, _ = generate_dense_grid_points(np.array(lattice[0]), np.array(lattice[1]), 8)
+        points = torch.from_numpy(xyz).reshape(-1, 3)
+        index = torch.tensor([0, 5, 81, 400, 728])
+        with torch.no_grad():
+            expected = decoder.query_proj(decoder.fourier_embedder(points[index]))
+            cached = decoder.query_cache.embed(decoder, lattice, index, torch.float32)
+        assert torch.allclose(cached, expected, atol=1e-5)
+
+    def test_lru_bound_and_reuse(self, decoder):
+        cache = QueryEmbeddingCache(max_entries=2)
+        index = torch.arange(4)
+        for resolution in (4, 8, 4, 16):
+            cache.embed(decoder, ((-1,) * 3, (1,) * 3, resolution), index, torch.float32)
+        assert cache.stats() == {"entries": 2, "hits": 1, "misses": 3}
+
+    def test_shared_between_threads(self, decoder):
+        cache = QueryEmbeddingCache(max_entries=2)
+        index = torch.arange(4)
+        lattices = [((-1,) * 3, (1,) * 3, 4 + i % 3) for i in range(60)]
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            outs = list(pool.map(lambda lattice: cache.embed(decoder, lattice, index, torch.float32), lattices))
+        stats = cache.stats()
+        assert stats["entries"] == 2 and stats["hits"] + stats["misses"] == len(lattices)
+        for lattice, out in zip(lattices, outs):
+            assert torch.equal(out, QueryEmbeddingCache().embed(decoder, lattice, index, torch.float32))
+
+    def test_volume_decode_unchanged(self, decoder):
+        _, latents = inputs(batch=1)
+        run = lambda: VanillaVolumeDecoder()(latents, decoder, octree_resolution=8, num_chunks=100, enable_pbar=False)
+        cached = run()
+        decoder.query_cache.max_entries = 0
+        try:
+            expected = run()
+        finally:
+            decoder.query_cache.max_entries = 8
+        assert torch.allclose(cached, expected, atol=1e-5)
@@ -0,0 +1,78 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("diffusers")
+
+from hy3dgen.shapegen.models.hunyuan3ddit import Hunyuan3DDiT, StepCache
+
+
+def tiny_dit(**kwargs):
+    torch.manual_seed(0)
+    return Hunyuan3DDiT(
+        in_channels=8, context_in_dim=12, hidden_size=32, num_heads=2,
+        depth=2, depth_single_blocks=2, axes_dim=[16], **kwargs
+    ).eval()
+
+
+class TestDenoiseSession:
+    """Test that precomputed sessions match the per-step forward"""
+
+    @pytest.mark.parametrize("cfg", [True, False])
+    def test_matches_forward(self, cfg):
+        model = tiny_dit()
+        batch = 2
+        rows = 2 * batch if cfg else batch
+        contexts = {"main": torch.randn(rows, 5, 12)}
+        timesteps = torch.linspace(0, 1, 4)
+        latents = torch.randn(batch, 6, 8)
+
+        with torch.no_grad():
+            session = model.denoise_session(contexts, timesteps, cfg=cfg)
+            for i, t in enumerate(timesteps):
+                x = torch.cat([latents] * 2) if cfg else latents
+                expected = model(x, t.expand(rows), contexts)
+                assert torch.allclose(session(i, latents), expected, atol=1e-5)
+
+    def test_guidance_distilled(self):
+        model = tiny_dit(guidance_embed=True)
+        contexts = {"main": torch.randn(1, 5, 12)}
+        timesteps = torch.linspace(0, 1, 3)
+        guidance = torch.tensor([7.5])
+        latents = torch.randn(1, 6, 8)
+
+        with torch.no_grad():
+            session = model.denoise_session(contexts, timesteps, cfg=False, guidance=guidance)
+            expected = model(latents, timesteps[1:2], contexts, guidance=guidance)
+            assert torch.allclose(session(1, latents), expected, atol=1e-5)
+
+
+class TestStepCache:
+    """Test skipping the block stack between similar steps"""
+
+    def run(self, model, step_cache, steps=6):
+        contexts = {"main": torch.randn(2, 5, 12)}
+        latents = torch.randn(1, 6, 8)
+        with torch.no_grad():
+            session = model.denoise_session(contexts, torch.linspace(0, 1, steps), cfg=True, step_cache=step_cache)
+            return [session(i, latents) for i in range(steps)]
+
+    def test_zero_threshold_computes_every_step(self):
+        model = tiny_dit()
+        torch.manual_seed(1)
+        reference = self.run(model, None)
+        torch.manual_seed(1)
+        cache = StepCache(threshold=0.0)
+        cached = self.run(model, cache)
+        assert cache.stats() == {"computed": 6, "skipped": 0}
+        assert all(torch.allclose(a, b, atol=1e-5) for a, b in zip(reference, cached))
+
+    def test_skips_are_capped(self):
+        cache = StepCache(threshold=1e9, max_skips=2)
+        self.run(tiny_dit(), cache)
+        # first step, after two skips, and the last step are always computed
+        assert cache.stats() == {"computed": 3, "skipped": 3}
+
+    def test_refresh_cadence(self):
+        cache = StepCache(threshold=1e9, refresh=2, max_skips=10)
+        self.run(tiny_dit(), cache)
+        assert cache.stats() == {"computed": 4, "skipped": 2}
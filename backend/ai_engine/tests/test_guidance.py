@@ -0,0 +1,32 @@
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("diffusers")
+
+from hy3dgen.shapegen.guidance import GuidanceSchedule
+
+
+class TestGuidanceSchedule:
+    """Test which steps run the unconditional branch"""
+
+    def test_full_cfg_by_default(self):
+        assert GuidanceSchedule().plan([0.0, 0.5, 1.0]) == ["both"] * 3
+
+    def test_interval_runs_cond_alone_outside(self):
+        plan = GuidanceSchedule((0.0, 0.5)).plan([0.0, 0.25, 0.5, 0.75, 1.0])
+        assert plan == ["both", "both", "both", "none", "none"]
+
+    def test_reuses_uncond_for_k_steps(self):
+        plan = GuidanceSchedule(reuse=3).plan([i / 6 for i in range(7)])
+        assert plan == ["both", "cond", "cond", "both", "cond", "cond", "both"]
+
+    def test_gap_invalidates_cached_uncond(self):
+        schedule = GuidanceSchedule((0.2, 0.6), reuse=4)
+        schedule.applies = lambda sigma: sigma != 0.4  # a hole inside the interval
+        assert schedule.plan([0.2, 0.3, 0.4, 0.5]) == ["both", "cond", "none", "both"]
+
+    def test_rejects_bad_settings(self):
+        with pytest.raises(ValueError):
+            GuidanceSchedule((0.8, 0.2))
+        with pytest.raises(ValueError):
+            GuidanceSchedule(reuse=0)
@@ -0,0 +1,32 @@
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("trimesh")
+
+from generation import MAX_CANDIDATES, job_from_input
+
+
+class TestJobFromInput:
+    """Test parsing and validation of RunPod job inputs"""
+
+    def test_generation_job(self):
+        job = job_from_input({"image_url": "http://x/a.png", "asset_id": "a1", "candidates": "2", "draft": True})
+        assert (job.asset_id, job.candidates, job.draft, job.remesh) == ("a1", 2, True, False)
+
+    @pytest.mark.parametrize("job_input, message", [
+        ({}, "Missing image_url"),
+        ({"image_url": "u", "quality": "ultra"}, "quality must be one of"),
+        ({"image_url": "u", "candidates": "many"}, "candidates must be a number"),
+        ({"image_url": "u", "candidates": MAX_CANDIDATES + 1}, "candidates must be within"),
+        ({"remesh": True, "octree_resolution": "big"}, "octree_resolution must be a number"),
+        ({"remesh": True, "mc_level": None}, "mc_level must be a number"),
+        ({"remesh": True, "octree_resolution": 8}, "octree_resolution within 16..1024"),
+        ({"remesh": True, "mc_algo": "dual"}, "mc_algo must be one of"),
+    ])
+    def test_rejects_malformed_input(self, job_input, message):
+        with pytest.raises(ValueError, match=message):
+            job_from_input(job_input)
+
+    def test_remesh_job(self):
+        job = job_from_input({"remesh": True, "asset_id": "a1", "octree_resolution": "384", "mc_algo": "dmc"})
+        assert (job.remesh, job.octree_resolution, job.mc_algo) == (True, 384, "dmc")
@@ -0,0 +1,248 @@
+import threading
+import time
+from concurrent.futures import Future
+
+import pytest
+
+from job_queue import QueueFullError, Stage, StagedExecutor
+
+
+def single_stage(handler, **kwargs):
+    return StagedExecutor([Stage("gpu", handler, **kwargs)])
+
+
+class TestAdmission:
+    """Test admission control and accounting of a single-stage executor"""
+
+    def test_runs_jobs_in_order(self):
+        """Jobs on a single worker run one at a time, FIFO"""
+        done = []
+        finished = threading.Event()
+
+        def handler(payloads):
+            done.extend(payloads)
+            if 2 in payloads:
+                finished.set()
+
+        q = single_stage(handler, workers=1, max_queue=4)
+        for i in range(3):
+            q.submit(i)
+
+        assert finished.wait(5)
+        assert done == [0, 1, 2]
+        q.shutdown(wait=True)
+
+    def test_rejects_when_full(self):
+        """Submitting beyond max_queue raises QueueFullError"""
+        release = threading.Event()
+        started = threading.Event()
+
+        def handler(payloads):
+            started.set()
+            release.wait(5)
+
+        q = single_stage(handler, workers=1, max_queue=1)
+        q.submit("a")
+        assert started.wait(5)
+        assert q.submit("b") == 1  # waits behind the running job
+
+        with pytest.raises(QueueFullError):
+            q.submit("c")
+        assert q.stats()["rejected"] == 1
+
+        release.set()
+        q.shutdown(wait=True)
+
+    def test_stats_report_timings(self):
+        """Stage wait/run and job-reported timings show up in stats()"""
+        finished = threading.Event()
+
+        def handler(payloads):
+            with q.stage("diffusion"):
+                time.sleep(0.01)
+            finished.set()
+
+        q = single_stage(handler, workers=1, max_queue=2)
+        q.submit("a")
+        assert finished.wait(5)
+        q.shutdown(wait=True)
+
+        stats = q.stats()
+        assert stats["completed"] == 1
+        assert stats["depth"] == 0
+        assert stats["stages"]["gpu"]["run"]["count"] == 1
+        assert stats["stages"]["gpu"]["wait"]["count"] == 1
+        assert stats["timings"]["diffusion"]["avg_s"] >= 0.01
+
+    def test_failed_job_is_counted(self):
+        """An exception in the handler does not kill the worker"""
+        finished = threading.Event()
+
+        def handler(payloads):
+            if payloads == ["bad"]:
+                raise RuntimeError("boom")
+            finished.set()
+
+        q = single_stage(handler, workers=1, max_queue=2)
+        q.submit("bad")
+        q.submit("good")
+        assert finished.wait(5)
+        q.shutdown(wait=True)
+        assert q.stats()["failed"] == 1
+        assert q.stats()["completed"] == 1
+
+
+    def test_failed_batch_resolves_result_futures(self):
+        """Payloads awaited through a `result` Future get the handler's exception"""
+        class Job:
+            def __init__(self):
+                self.result = Future()
+
+        def handler(payloads):
+            raise RuntimeError("boom")
+
+        q = single_stage(handler, workers=1, max_queue=2)
+        job = Job()
+        q.submit(job)
+        with pytest.raises(RuntimeError, match="boom"):
+            job.result.result(timeout=5)
+        q.shutdown(wait=True)
+
+
+class TestMicroBatching:
+    """Test coalescing of concurrent requests into one handler call"""
+
+    def test_coalesces_within_window(self):
+        """Jobs submitted within max_wait share one batch"""
+        batches = []
+        finished = threading.Event()
+
+        def handler(payloads):
+            batches.append(list(payloads))
+            finished.set()
+
+        q = single_stage(handler, workers=1, max_queue=8, max_batch=4, max_wait=0.5)
+        for i in range(4):
+            q.submit(i)
+
+        assert finished.wait(5)
+        q.shutdown(wait=True)
+        assert batches == [[0, 1, 2, 3]]
+        assert q.stats()["stages"]["gpu"]["avg_batch_size"] == 4
+
+    def test_respects_max_batch(self):
+        """A batch never exceeds max_batch; the rest runs in the next one"""
+        batches = []
+        done = threading.Event()
+
+        def handler(payloads):
+            batches.append(list(payloads))
+            if sum(len(b) for b in batches) == 5:
+                done.set()
+
+        q = single_stage(handler, workers=1, max_queue=8, max_batch=3, max_wait=0.2)
+        for i in range(5):
+            q.submit(i)
+
+        assert done.wait(5)
+        q.shutdown(wait=True)
+        assert [len(b) for b in batches] == [3, 2]
+
+
+class TestStagedExecutor:
+    """Test hand-off, overlap and backpressure between stages"""
+
+    def test_stages_overlap(self):
+        """Job 2's first stage runs while job 1 is in the second stage"""
+        events = []
+        lock = threading.Lock()
+
+        def make(name, seconds):
+            def handler(payloads):
+                with lock:
+                    events.append((name, payloads[0], "start"))
+                time.sleep(seconds)
+                with lock:
+                    events.append((name, payloads[0], "end"))
+            return handler
+
+        q = StagedExecutor([
+            Stage("pre", make("pre", 0.05), max_queue=4),
+            Stage("gpu", make("gpu", 0.2), max_queue=2),
+        ])
+        q.submit(1)
+        q.submit(2)
+        q.shutdown(wait=True)
+
+        order = events.index
+        # job 2 finished preprocessing before job 1 left the GPU stage
+        assert order(("pre", 2, "end")) < order(("gpu", 1, "end"))
+        assert q.stats()["completed"] == 2
+
+    def test_dropped_jobs_stop_and_count_as_failed(self):
+        """Payloads a handler leaves out of its result do not reach the next stage"""
+        seen = []
+
+        def pre(payloads):
+            return [p for p in payloads if p != "bad"]
+
+        def post(payloads):
+            seen.extend(payloads)
+
+        q = StagedExecutor([Stage("pre", pre, max_queue=4), Stage("post", post)])
+        q.submit("bad")
+        q.submit("good")
+        q.shutdown(wait=True)
+
+        assert seen == ["good"]
+        stats = q.stats()
+        assert stats["completed"] == 1
+        assert stats["failed"] == 1
+
+    def test_backpressure_blocks_upstream(self):
+        """A full hand-off queue blocks the upstream worker instead of growing"""
+        release = threading.Event()
+
+        def slow(payloads):
+            release.wait(5)
+
+        q = StagedExecutor([
+            Stage("pre", lambda payloads: None, max_queue=8),
+            Stage("gpu", slow, max_queue=1),
+        ])
+        for i in range(4):
+            q.submit(i)
+        time.sleep(0.2)
+
+        stats = q.stats()
+        # one running + one waiting on the GPU; the rest held upstream
+        assert stats["stages"]["gpu"]["running"] == 1
+        assert stats["stages"]["gpu"]["depth"] == 1
+        assert stats["stages"]["pre"]["running"] == 1
+        assert stats["bottleneck"] == "gpu"
+
+        release.set()
+        q.shutdown(wait=True)
+        stats = q.stats()
+        assert stats["completed"] == 4
+        assert stats["stages"]["pre"]["blocked_s"] > 0
+
+    def test_jobs_finished_early_skip_later_stages(self):
+        """A (forward, completed) result completes jobs without running later stages"""
+        seen = []
+
+        def pre(payloads):
+            return [p for p in payloads if p != "hit"], [p for p in payloads if p == "hit"]
+
+        def post(payloads):
+            seen.extend(payloads)
+
+        q = StagedExecutor([Stage("pre", pre, max_queue=4), Stage("post", post)])
+        q.submit("hit")
+        q.submit("miss")
+        q.shutdown(wait=True)
+
+        assert seen == ["miss"]
+        stats = q.stats()
+        assert stats["completed"] == 2
+        assert stats["failed"] == 0
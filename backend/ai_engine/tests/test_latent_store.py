@@ -0,0 +1,57 @@
+import os
+import time
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from latent_store import LatentStore
+
+
+class TestLatentStore:
+    """Test saving, memory-mapped loading and aliasing of stored latents"""
+
+    def test_roundtrip_is_fp16_and_mmapped(self, tmp_path):
+        store = LatentStore(str(tmp_path))
+        latents = np.random.randn(1, 3072, 64).astype(np.float32)
+        store.save("asset-1", latents, {"steps": 50})
+
+        loaded, meta = store.load("asset-1")
+        assert isinstance(loaded, np.memmap)
+        assert loaded.dtype == np.float16
+        assert loaded.shape == (1, 3072, 64)
+        assert np.allclose(loaded, latents, atol=1e-2)
+        assert meta["steps"] == 50
+
+    def test_alias_shares_latents(self, tmp_path):
+        store = LatentStore(str(tmp_path))
+        store.save("asset-1", np.zeros((1, 4, 4)))
+        store.alias("asset-1", "asset-2")
+        assert store.exists("asset-2")
+        assert store.load("asset-2")[0].shape == (1, 4, 4)
+
+    def test_rejects_path_traversal(self, tmp_path):
+        store = LatentStore(str(tmp_path))
+        assert not store.exists("../etc/passwd")
+        with pytest.raises(ValueError):
+            store.save("../escape", np.zeros((1, 4, 4)))
+
+    def test_evicts_least_recently_loaded(self, tmp_path):
+        store = LatentStore(str(tmp_path), max_bytes=2500)
+        for asset in ("a", "b"):
+            store.save(asset, np.zeros((1, 8, 64)))  # 1152 bytes each
+            time.sleep(0.02)
+        store.load("a")  # touch: "b" is now the oldest
+        time.sleep(0.02)
+        store.save("c", np.zeros((1, 8, 64)))
+        assert not store.exists("b") and store.exists("a") and store.exists("c")
+        assert not os.path.exists(tmp_path / "b.json")
+        assert store.stats()["evictions"] == 1
+
+    def test_aliases_count_once(self, tmp_path):
+        store = LatentStore(str(tmp_path), max_bytes=2500)
+        store.save("a", np.zeros((1, 8, 64)))
+        store.alias("a", "key")
+        store.save("b", np.zeros((1, 8, 64)))
+        assert store.size_bytes() == 2 * os.path.getsize(tmp_path / "a.npy")
+        assert store.stats()["evictions"] == 0
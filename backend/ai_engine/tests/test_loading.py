@@ -0,0 +1,124 @@
+import os
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("accelerate")
+safetensors_torch = pytest.importorskip("safetensors.torch")
+
+from accelerate import init_empty_weights
+
+from hy3dgen.shapegen import conversion, loading
+from hy3dgen.shapegen.conversion import convert_checkpoint, converted_reader, load_manifest
+from hy3dgen.shapegen.loading import CheckpointReader, load_component
+
+
+def tiny():
+    return torch.nn.Sequential(torch.nn.Linear(4, 3), torch.nn.Linear(3, 2))
+
+
+@pytest.fixture
+def checkpoint(tmp_path):
+    torch.manual_seed(0)
+    model, vae = tiny(), tiny()
+    tensors = {f"model.{k}": v for k, v in model.state_dict().items()}
+    tensors.update({f"vae.{k}": v for k, v in vae.state_dict().items()})
+    path = tmp_path / "ckpt.safetensors"
+    safetensors_torch.save_file(tensors, str(path))
+    return str(path), model, vae
+
+
+class TestCheckpointLoading:
+    """Test the memory-mapped, per-component loader"""
+
+    def test_groups_by_component(self, checkpoint):
+        reader = CheckpointReader(checkpoint[0])
+        assert "model" in reader and "conditioner" not in reader
+        assert set(reader.keys("vae")) == {"0.weight", "0.bias", "1.weight", "1.bias"}
+
+    def test_load_component_matches_source(self, checkpoint):
+        path, _, vae = checkpoint
+        with init_empty_weights():
+            module = tiny()
+        report = load_component(module, CheckpointReader(path), "vae", torch.device("cpu"), torch.float16, workers=2)
+        assert report["tensors"] == 4 and report["missing"] == 0
+        for name, param in module.named_parameters():
+            assert param.dtype == torch.float16
+            assert torch.equal(param, vae.state_dict()[name].half())
+
+    def test_report_without_resource_module(self, checkpoint, monkeypatch):
+        path, _, _ = checkpoint
+        monkeypatch.setattr(loading, "resource", None)
+        with init_empty_weights():
+            module = tiny()
+        report = load_component(module, CheckpointReader(path), "vae", "cpu", torch.float32)
+        assert report["peak_rss_gb"] is None and report["missing"] == 0
+
+    def test_key_mapping_and_missing(self, checkpoint):
+        path, model, _ = checkpoint
+        with init_empty_weights():
+            module = torch.nn.Sequential(torch.nn.Linear(4, 3), torch.nn.Linear(3, 2), torch.nn.Linear(2, 1))
+        reader = CheckpointReader(path)
+        report = load_component(module, reader, "model", "cpu", torch.float32, key_mapping={"1.weight": "1.weight"})
+        assert report["missing"] == 2
+        assert torch.equal(module[0].weight, model[0].weight)
+
+
+class TestConvertedCheckpoint:
+    """Test the pre-converted per-component cache"""
+
+    @pytest.fixture
+    def renamed(self, tmp_path):
+        tensors = {
+            "model.x_embedder.weight": torch.randn(3, 4),
+            "model.single_blocks.0.bias": torch.randn(3),
+            "vae.proj.weight": torch.randn(2, 2),
+            "vae.steps": torch.arange(3),
+        }
+        path = tmp_path / "v21.safetensors"
+        safetensors_torch.save_file(tensors, str(path))
+        return str(path), tensors
+
+    def test_convert_renames_and_casts(self, renamed, tmp_path):
+        path, tensors = renamed
+        cache = str(tmp_path / "converted")
+        manifest = convert_checkpoint(path, cache, torch.float16)
+        assert manifest["config"]["model"]["params"]["depth_single_blocks"] == 16  # dit_config_mini.yaml
+        reader = converted_reader(cache, path, manifest)
+        assert set(reader.keys("model")) == {"latent_in.weight", "single_blocks.0.bias"}
+        assert reader.get("model", "latent_in.weight").dtype == torch.float16
+        assert torch.equal(reader.get("vae", "steps"), tensors["vae.steps"])
+        assert load_manifest(cache, path, torch.float16) is not None
+        assert load_manifest(cache, path, torch.bfloat16) is None
+
+    def test_changed_source_invalidates(self, renamed, tmp_path):
+        path, tensors = renamed
+        cache = str(tmp_path / "converted")
+        convert_checkpoint(path, cache)
+        tensors["vae.proj.weight"] = torch.randn(2, 2)
+        safetensors_torch.save_file(tensors, path)
+        os.utime(path, (0, 1))
+        assert load_manifest(cache, path) is None
+
+    def test_copied_source_matches_by_hash(self, renamed, tmp_path, monkeypatch):
+        path, _ = renamed
+        cache = str(tmp_path / "converted")
+        convert_checkpoint(path, cache)
+        os.utime(path, (0, 1))
+        assert load_manifest(cache, path) is not None
+        # the verified stamp is recorded: the next load trusts the hash without reading the file
+        monkeypatch.setattr(conversion, "file_sha256", lambda path: pytest.fail("hashed an unchanged source"))
+        assert load_manifest(cache, path) is not None
+
+    def test_replaced_source_with_same_mtime_is_hashed(self, renamed, tmp_path):
+        path, tensors = renamed
+        cache = str(tmp_path / "converted")
+        convert_checkpoint(path, cache)
+        stat = os.stat(path)
+        tensors["vae.proj.weight"] = torch.randn(2, 2)
+        replacement = str(tmp_path / "replacement.safetensors")
+        safetensors_torch.save_file(tensors, replacement)
+        os.utime(replacement, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        os.replace(replacement, path)
+        assert os.path.getsize(path) == stat.st_size and os.stat(path).st_mtime_ns == stat.st_mtime_ns
+        assert load_manifest(cache, path) is None
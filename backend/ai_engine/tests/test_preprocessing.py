@@ -200,3 +200,26 @@ class TestFullPreprocessingPipeline:
             
         except ImportError:
             pytest.skip("rembg not available")
+
+
+class TestMultiViewProcessor:
+    """Test the pooled multi-view loading of MVImageProcessorV2"""
+
+    def views(self):
+        img = np.zeros((64, 64, 4), np.uint8)
+        img[16:48, 16:48] = 255
+        return {"back": Image.fromarray(img), "front": Image.fromarray(img)}
+
+    def test_views_in_index_order_and_timings_opt_in(self, monkeypatch):
+        pytest.importorskip("torch")
+        pytest.importorskip("cv2")
+        from hy3dgen.shapegen.preprocessors import MVImageProcessorV2
+
+        processor = MVImageProcessorV2(size=32)
+        out = processor(self.views())
+        assert out["view_idxs"] == (0, 2)
+        assert tuple(out["image"].shape) == (1, 2, 3, 32, 32)
+        assert processor.last_timings is None
+        monkeypatch.setattr(processor, "time_stages", True)
+        processor(self.views())
+        assert processor.last_timings["views"] == 2
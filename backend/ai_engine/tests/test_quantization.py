@@ -0,0 +1,145 @@
+import os
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("diffusers")
+pytest.importorskip("safetensors")
+
+from hy3dgen.shapegen.models.hunyuan3ddit import Hunyuan3DDiT
+from hy3dgen.shapegen import quantization
+from hy3dgen.shapegen.loading import CheckpointReader, load_component
+from hy3dgen.shapegen.quantization import Int8Linear, cache_path, int8_matmul, load_int8, module_bytes, quantize_int8
+
+
+def tiny_dit():
+    torch.manual_seed(0)
+    return Hunyuan3DDiT(
+        in_channels=8, context_in_dim=12, hidden_size=32, num_heads=2,
+        depth=2, depth_single_blocks=2, axes_dim=[16],
+    ).eval()
+
+
+def relative_error(a, b):
+    return ((a - b).norm() / b.norm()).item()
+
+
+class TestInt8Linear:
+    """Test per-channel int8 weights against the fp32 layer"""
+
+    def test_matches_linear(self):
+        torch.manual_seed(0)
+        linear = torch.nn.Linear(64, 48)
+        x = torch.randn(5, 64)
+        assert relative_error(Int8Linear.from_linear(linear)(x), linear(x)) < 0.01
+
+    def test_blockwise_matmul_matches_full_weight(self, monkeypatch):
+        torch.manual_seed(0)
+        layer = Int8Linear.from_linear(torch.nn.Linear(64, 48))
+        x = torch.randn(2, 5, 64)
+        expected = torch.nn.functional.linear(x, layer.qweight.float() * layer.scale[:, None])
+        monkeypatch.setattr(quantization, "DEQUANT_BLOCK", 16)
+        out = int8_matmul(x, layer.qweight, layer.scale)
+        assert out.shape == (2, 5, 48)
+        assert torch.allclose(out, expected, atol=1e-5)
+
+    def test_stores_int8(self):
+        layer = Int8Linear.from_linear(torch.nn.Linear(64, 48))
+        assert layer.qweight.dtype == torch.int8
+        assert layer.scale.shape == (48,)
+
+
+class TestQuantizeInt8:
+    """Test swapping the DiT block layers and caching the converted weights"""
+
+    def run(self, model):
+        torch.manual_seed(1)
+        x, t, contexts = torch.randn(1, 6, 8), torch.tensor([0.3]), {"main": torch.randn(1, 5, 12)}
+        with torch.no_grad():
+            return model(x, t, contexts)
+
+    def test_blocks_quantized_and_output_close(self):
+        model = tiny_dit()
+        reference = self.run(model)
+        report = quantize_int8({"model": model})
+        assert isinstance(model.double_blocks[0].img_attn.qkv, Int8Linear)
+        assert isinstance(model.latent_in, torch.nn.Linear)
+        assert report["after"] < report["before"] == module_bytes(tiny_dit())
+        assert relative_error(self.run(model), reference) < 0.05
+
+    def test_cache_roundtrip(self, tmp_path):
+        ckpt = tmp_path / "model.safetensors"
+        ckpt.write_bytes(b"weights")
+        first = tiny_dit()
+        assert quantize_int8({"model": first}, str(tmp_path), str(ckpt))["cached"] is False
+        assert os.path.exists(cache_path(str(tmp_path), str(ckpt)))
+
+        second = tiny_dit()
+        assert quantize_int8({"model": second}, str(tmp_path), str(ckpt))["cached"] is True
+        assert torch.equal(self.run(first), self.run(second))
+
+    def test_stale_cache_is_rebuilt(self, tmp_path):
+        ckpt = tmp_path / "model.safetensors"
+        ckpt.write_bytes(b"weights")
+        quantize_int8({"model": tiny_dit()}, str(tmp_path), str(ckpt))
+        ckpt.write_bytes(b"new weights")
+        assert quantize_int8({"model": tiny_dit()}, str(tmp_path), str(ckpt))["cached"] is False
+
+    def test_copied_checkpoint_is_restamped(self, tmp_path, monkeypatch):
+        ckpt = tmp_path / "model.safetensors"
+        ckpt.write_bytes(b"weights")
+        quantize_int8({"model": tiny_dit()}, str(tmp_path), str(ckpt))
+        os.utime(ckpt, (0, 1))
+        assert quantize_int8({"model": tiny_dit()}, str(tmp_path), str(ckpt))["cached"] is True
+        # the verified stamp is recorded: the next load trusts the hash without reading the checkpoint
+        monkeypatch.setattr(quantization, "file_sha256", lambda path: pytest.fail("hashed an unchanged checkpoint"))
+        assert quantize_int8({"model": tiny_dit()}, str(tmp_path), str(ckpt))["cached"] is True
+
+    def test_same_size_rewrite_is_stale(self, tmp_path):
+        ckpt = tmp_path / "model.safetensors"
+        ckpt.write_bytes(b"weights")
+        quantize_int8({"model": tiny_dit()}, str(tmp_path), str(ckpt))
+        stat = os.stat(ckpt)
+        replacement = tmp_path / "replacement"
+        replacement.write_bytes(b"WEIGHTS")
+        os.utime(replacement, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        os.replace(replacement, ckpt)
+        assert quantize_int8({"model": tiny_dit()}, str(tmp_path), str(ckpt))["cached"] is False
+
+
+class TestLoadInt8:
+    """Test filling empty modules from the int8 cache before the checkpoint is read"""
+
+    def test_cached_layers_skip_checkpoint_reads(self, tmp_path):
+        from accelerate import init_empty_weights
+        import safetensors.torch
+
+        ckpt = str(tmp_path / "model.safetensors")
+        source = tiny_dit()
+        safetensors.torch.save_file({f"model.{k}": v.contiguous() for k, v in source.state_dict().items()}, ckpt)
+        reference = tiny_dit()
+        quantize_int8({"model": reference}, str(tmp_path), ckpt)
+
+        with init_empty_weights():
+            model = tiny_dit()
+        assert load_int8({"model": model}, str(tmp_path), ckpt, "cpu") is True
+        assert isinstance(model.double_blocks[0].img_attn.qkv, Int8Linear)
+
+        reader, read = CheckpointReader(ckpt), []
+        get = reader.get
+        reader.get = lambda component, key: read.append(key) or get(component, key)
+        report = load_component(model, reader, "model", "cpu", torch.float32)
+        assert report["missing"] == 0
+        quantized = {f"{name}.weight" for name, module in model.named_modules() if isinstance(module, Int8Linear)}
+        assert quantized and not quantized & set(read)
+        assert torch.equal(TestQuantizeInt8().run(model), TestQuantizeInt8().run(reference))
+
+    def test_stale_or_missing_cache_leaves_modules(self, tmp_path):
+        ckpt = tmp_path / "model.safetensors"
+        ckpt.write_bytes(b"weights")
+        model = tiny_dit()
+        assert load_int8({"model": model}, str(tmp_path), str(ckpt), "cpu") is False
+        quantize_int8({"model": tiny_dit()}, str(tmp_path), str(ckpt))
+        ckpt.write_bytes(b"new weights")
+        assert load_int8({"model": model}, str(tmp_path), str(ckpt), "cpu") is False
+        assert isinstance(model.double_blocks[0].img_attn.qkv, torch.nn.Linear)
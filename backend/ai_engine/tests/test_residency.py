@@ -0,0 +1,46 @@
+import time
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("diffusers")
+
+from hy3dgen.shapegen.residency import make_residency_policy
+
+
+def linear():
+    return torch.nn.Linear(4, 4)
+
+
+class TestResidencyPolicies:
+    """Test when each policy moves weights between devices (cpu stands in for both)"""
+
+    def test_offload_moves_every_use(self):
+        policy = make_residency_policy("offload", "cpu", "cpu")
+        policy.register("model", linear())
+        for _ in range(3):
+            with policy.use("model"):
+                pass
+        stats = policy.stats()["components"]["model"]
+        assert stats["transfers"] == 6
+
+    def test_resident_moves_once(self):
+        policy = make_residency_policy("resident", "cpu", "cpu")
+        policy.register("model", linear())
+        for _ in range(3):
+            with policy.use("model"):
+                pass
+        assert policy.stats()["components"]["model"]["transfers"] == 1
+
+    def test_idle_offloads_after_timeout(self):
+        policy = make_residency_policy("idle", "cpu", "cpu", idle_timeout=0.05)
+        policy.register("model", linear())
+        with policy.use("model"):
+            pass
+        assert policy.components["model"].on_device
+        time.sleep(0.2)
+        assert not policy.components["model"].on_device
+
+    def test_rejects_unknown_policy(self):
+        with pytest.raises(ValueError):
+            make_residency_policy("sometimes", "cpu", "cpu")
@@ -0,0 +1,60 @@
+import os
+import time
+
+from result_cache import ResultCache, cache_key
+
+
+class TestCacheKey:
+    """Test the content-addressed key"""
+
+    def test_param_order_does_not_matter(self):
+        assert cache_key(b"canvas", {"a": 1, "b": 2}) == cache_key(b"canvas", {"b": 2, "a": 1})
+
+    def test_any_change_changes_key(self):
+        base = cache_key(b"canvas", {"steps": 50})
+        assert cache_key(b"canvaz", {"steps": 50}) != base
+        assert cache_key(b"canvas", {"steps": 30}) != base
+
+
+class TestResultCache:
+    """Test hits, misses and LRU eviction of the disk cache"""
+
+    def test_hit_and_miss(self, tmp_path):
+        cache = ResultCache(str(tmp_path), max_bytes=1024)
+        assert cache.get("ab" * 32) is None
+        cache.put("ab" * 32, b"mesh")
+        assert cache.get("ab" * 32) == b"mesh"
+
+        stats = cache.stats()
+        assert (stats["hits"], stats["misses"], stats["stores"]) == (1, 1, 1)
+
+    def test_eviction_after_read_is_a_hit(self, tmp_path, monkeypatch):
+        cache = ResultCache(str(tmp_path), max_bytes=1024)
+        cache.put("ef" * 32, b"mesh")
+
+        def evicted(path, *args):
+            os.remove(path)
+            raise FileNotFoundError(path)
+
+        monkeypatch.setattr(os, "utime", evicted)
+        assert cache.get("ef" * 32) == b"mesh"
+        assert cache.stats()["hits"] == 1
+
+    def test_no_temp_files_left_behind(self, tmp_path):
+        cache = ResultCache(str(tmp_path), max_bytes=1024)
+        cache.put("cd" * 32, b"mesh")
+        assert os.listdir(tmp_path / "cd") == ["cd" * 32 + ".stl"]
+
+    def test_evicts_least_recently_used(self, tmp_path):
+        cache = ResultCache(str(tmp_path), max_bytes=250)
+        for key in ("aa", "bb"):
+            cache.put(key * 32, b"x" * 100)
+            time.sleep(0.02)
+        cache.get("aa" * 32)  # touch: "bb" is now the oldest
+        time.sleep(0.02)
+        cache.put("cc" * 32, b"x" * 100)
+
+        assert cache.get("bb" * 32) is None
+        assert cache.get("aa" * 32) is not None
+        assert cache.size_bytes() <= 250
+        assert cache.stats()["evictions"] == 1
@@ -0,0 +1,127 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+torch = pytest.importorskip("torch")
+pytest.importorskip("diffusers")
+
+from hy3dgen.shapegen.models.hunyuan3ddit import Hunyuan3DDiT
+from hy3dgen.shapegen.schedulers import (
+    ConsistencyFlowMatchEulerDiscreteScheduler,
+    FlowMatchDPMSolverMultistepScheduler,
+    FlowMatchEulerDiscreteScheduler,
+    FlowMatchHeunDiscreteScheduler,
+    make_scheduler,
+)
+
+
+@pytest.fixture(scope="module")
+def velocity():
+    """A tiny random-weight DiT; time_factor=1 keeps its velocity field smooth in sigma."""
+    torch.manual_seed(0)
+    model = Hunyuan3DDiT(
+        in_channels=8, context_in_dim=12, hidden_size=32, num_heads=2,
+        depth=1, depth_single_blocks=1, axes_dim=[16], time_factor=1.0,
+    ).eval()
+    contexts = {"main": torch.randn(1, 5, 12)}
+
+    def run(x, t):
+        return model(x, t.expand(x.shape[0]) / 1000, contexts)
+    return run
+
+
+@pytest.fixture(scope="module")
+def linear_field():
+    """v(x) = a * x + b and its exact flow from sigma 0 to 1 of sample()'s starting latents."""
+    a = -0.5
+    torch.manual_seed(3)
+    b = torch.randn(1, 6, 8)
+    torch.manual_seed(0)
+    x = torch.randn(1, 6, 8)
+    return (lambda x, t: a * x + b), (x + b / a) * np.exp(a) - b / a
+
+
+def sample(scheduler, velocity, steps, seed=0):
+    """The pipeline's loop: one model call and one scheduler step per timestep."""
+    torch.manual_seed(seed)
+    x = torch.randn(1, 6, 8)
+    scheduler.set_timesteps(sigmas=np.linspace(0, 1, steps))
+    with torch.no_grad():
+        for t in scheduler.timesteps:
+            x = scheduler.step(velocity(x, t), t, x).prev_sample
+    return x
+
+
+def error(x, reference):
+    return (x - reference).abs().max().item()
+
+
+class TestFlowMatchSolvers:
+    """Test higher-order solvers against a fine-grained reference trajectory"""
+
+    def test_higher_order_beats_euler_at_equal_steps(self, velocity):
+        reference = sample(FlowMatchHeunDiscreteScheduler(), velocity, 400)
+        euler = error(sample(FlowMatchEulerDiscreteScheduler(), velocity, 17), reference)
+        heun = error(sample(FlowMatchHeunDiscreteScheduler(), velocity, 17), reference)
+        dpm = error(sample(FlowMatchDPMSolverMultistepScheduler(), velocity, 17), reference)
+        assert heun < euler
+        assert dpm < euler
+
+    def test_euler_converges_to_the_same_latents(self, velocity):
+        reference = sample(FlowMatchHeunDiscreteScheduler(), velocity, 400)
+        coarse = error(sample(FlowMatchEulerDiscreteScheduler(), velocity, 17), reference)
+        fine = error(sample(FlowMatchEulerDiscreteScheduler(), velocity, 200), reference)
+        assert fine < coarse
+
+    def test_timesteps_drop_the_zero_length_step(self):
+        heun, dpm = FlowMatchHeunDiscreteScheduler(), FlowMatchDPMSolverMultistepScheduler()
+        heun.set_timesteps(sigmas=np.linspace(0, 1, 5))
+        dpm.set_timesteps(sigmas=np.linspace(0, 1, 5))
+        assert heun.timesteps.tolist() == [0, 250, 250, 500, 500, 750, 750, 1000]
+        assert dpm.timesteps.tolist() == [0, 250, 500, 750]
+
+    def test_shift_moves_steps_towards_noise(self):
+        scheduler = FlowMatchDPMSolverMultistepScheduler(shift=1 / 3)
+        scheduler.set_timesteps(sigmas=np.linspace(0, 1, 5))
+        sigmas = scheduler.sigmas.tolist()
+        assert sigmas[0] == 0 and sigmas[-1] == pytest.approx(1)
+        assert sigmas[1] < 0.25
+
+
+class TestLinearVelocityField:
+    """Test the solvers on v(x) = a * x + b, whose flow from sigma 0 to 1 is known in closed form"""
+
+    @pytest.mark.parametrize("steps", [15, 20])
+    @pytest.mark.parametrize("solver", [FlowMatchHeunDiscreteScheduler, FlowMatchDPMSolverMultistepScheduler])
+    def test_matches_fine_euler_endpoint(self, linear_field, solver, steps):
+        velocity, exact = linear_field
+        euler = sample(FlowMatchEulerDiscreteScheduler(), velocity, 50)
+        x = sample(solver(), velocity, steps)
+        assert error(x, euler) < 0.02
+        # second order: closer to the exact flow than Euler with 2.5-3x the steps
+        assert error(x, exact) < error(euler, exact)
+
+
+class TestSchedulerRegistry:
+    """Test building per-call schedulers by name"""
+
+    def test_keys_and_class_names(self):
+        assert isinstance(make_scheduler("heun"), FlowMatchHeunDiscreteScheduler)
+        assert isinstance(make_scheduler("FlowMatchDPMSolverMultistepScheduler"), FlowMatchDPMSolverMultistepScheduler)
+        consistency = make_scheduler("consistency")
+        assert isinstance(consistency, ConsistencyFlowMatchEulerDiscreteScheduler)
+        assert consistency.config.pcm_timesteps == 100
+
+    def test_instances_pass_through(self):
+        scheduler = FlowMatchEulerDiscreteScheduler()
+        assert make_scheduler(scheduler) is scheduler
+
+    def test_rejects_unknown_names(self):
+        with pytest.raises(ValueError):
+            make_scheduler("ddim")
+
+    def test_from_config_copies_are_independent(self):
+        default = make_scheduler("dpmpp_2m", shift=0.5)
+        copy = default.__class__.from_config(default.config)
+        copy.set_timesteps(sigmas=np.linspace(0, 1, 5))
+        assert copy.config.shift == 0.5
+        assert len(copy.timesteps) == 4 and len(default.timesteps) == 1000
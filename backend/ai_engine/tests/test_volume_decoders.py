@@ -0,0 +1,90 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+torch = pytest.importorskip("torch")
+pytest.importorskip("einops")
+pytest.importorskip("diffusers")
+
+from hy3dgen.shapegen.models.autoencoders.attention_processors import (
+    FlashVDMCrossAttentionProcessor, FlashVDMTopMCrossAttentionProcessor,
+)
+from hy3dgen.shapegen.models.autoencoders.volume_decoders import (
+    dilate_indices, extract_near_surface_volume_fn, generate_dense_grid_points, lattice_axes, lattice_points,
+)
+
+
+def dense_dilate(index, size, radius):
+    mask = torch.zeros(size ** 3)
+    mask[index] = 1
+    mask = mask.view(1, 1, size, size, size)
+    for _ in range(radius):
+        mask = torch.nn.functional.conv3d(mask, torch.ones(1, 1, 3, 3, 3), padding=1)
+    return torch.nonzero(mask.view(-1) > 0).squeeze(-1)
+
+
+class TestLatticeQueries:
+    """Test per-chunk lattice coordinates and sparse dilation against the dense versions"""
+
+    def test_points_match_dense_grid(self):
+        bbox_min, bbox_max = np.array([-1.01] * 3), np.array([1.01] * 3)
+        xyz, _, _ = generate_dense_grid_points(bbox_min, bbox_max, 12)
+        index = torch.tensor([0, 13, 169, 1000, 2196])
+        points = lattice_points(lattice_axes(bbox_min, bbox_max, 12, "cpu", torch.float32), index)
+        assert torch.equal(points, torch.from_numpy(xyz).reshape(-1, 3)[index])
+
+    @pytest.mark.parametrize("radius", [0, 1, 2])
+    def test_sparse_dilation_matches_conv(self, radius):
+        torch.manual_seed(0)
+        index = torch.unique(torch.randint(0, 9 ** 3, (12,)))
+        assert torch.equal(dilate_indices(index, 9, radius), dense_dilate(index, 9, radius))
+
+    def test_near_surface_of_sphere(self):
+        r = torch.linspace(-1, 1, 9)
+        x, y, z = torch.meshgrid(r, r, r, indexing="ij")
+        field = 0.5 - (x ** 2 + y ** 2 + z ** 2).sqrt()
+        mask = extract_near_surface_volume_fn(field, 0.0).bool()
+        sign = torch.sign(field)  # the lattice hits the surface exactly at 6 points (sign 0)
+        shells = torch.zeros_like(mask)
+        for axis in range(3):
+            for shift in (1, -1):
+                shells |= sign != torch.roll(sign, shift, axis)
+        assert mask.any() and torch.equal(mask, shells)
+
+
+class TestSegmentedTopK:
+    """Test the batched per-bucket top-k attention against the per-bucket loop"""
+
+    def attend(self, processor, segmented, q, k, v, counts):
+        processor.segmented = segmented
+        processor.topk = [list(range(len(counts))), counts]
+        return processor(None, q, k, v)
+
+    def test_matches_loop(self):
+        torch.manual_seed(0)
+        counts = [5, 120, 1, 61]
+        q = torch.randn(2, 3, sum(counts), 8)
+        k, v = torch.randn(2, 3, 30, 8), torch.randn(2, 3, 30, 8)
+        processor = FlashVDMCrossAttentionProcessor()
+        expected = self.attend(processor, False, q, k, v, counts)
+        out = self.attend(processor, True, q, k, v, counts)
+        assert out.shape == q.shape
+        assert torch.allclose(out, expected, atol=1e-5)
+        assert processor.topk is False
+
+    def test_skewed_buckets_bound_padding(self):
+        torch.manual_seed(0)
+        counts = [3, 400, 2, 5, 1, 7, 380]
+        groups = FlashVDMCrossAttentionProcessor.group_buckets(counts, 2.0)
+        assert sorted(i for group in groups for i in group) == list(range(len(counts)))
+        for group in groups:
+            assert len(group) * max(counts[i] for i in group) <= 2.0 * sum(counts[i] for i in group)
+        assert [0, 2, 3, 4] in groups
+        assert FlashVDMCrossAttentionProcessor.group_buckets([1000, 1, 1, 1], 1.5) == [[0], [1, 2, 3]]
+        q = torch.randn(2, 3, sum(counts), 8)
+        k, v = torch.randn(2, 3, 30, 8), torch.randn(2, 3, 30, 8)
+        processor = FlashVDMCrossAttentionProcessor()
+        expected = self.attend(processor, False, q, k, v, counts)
+        assert torch.allclose(self.attend(processor, True, q, k, v, counts), expected, atol=1e-5)
+
+    def test_topm_keeps_loop(self):
+        assert FlashVDMTopMCrossAttentionProcessor.segmented is False
@@ -0,0 +1,199 @@
+"""
+Startup compile + warm-up for `main.py` and `runpod_handler.py`.
+
+Without it the first request after a cold start pays every torch.compile trace, Inductor
+codegen and Triton autotuning cost. At startup we instead
+
+  1. run one eager dummy generation (baseline, and the CUDA/cuDNN init); the attention
+     shapes it hits are benchmarked per backend (hy3dgen/shapegen/attention.py)
+  2. compile the DiT and the VAE geo_decoder in place (`compile_models`)
+  3. run the dummy generation twice: the first call compiles, the second is steady state
+  4. save the compile artifacts to COMPILE_CACHE_DIR
+  5. probe the volume-decode chunk sizes for every service resolution not tuned yet on
+     this GPU (decode_chunks.py); the results persist in DECODE_CHUNK_CACHE
+
+COMPILE_CACHE_DIR should live on the network volume (`/runpod-volume/compile-cache` in
+the Docker image): Inductor's FX graph cache, the Triton kernel cache and the portable
+`torch.compiler.save_cache_artifacts()` bundle all go there, so later cold starts load
+kernels instead of building them. The dummy passes use the production shapes (guidance on,
+OCTREE_RESOLUTION, NUM_CHUNKS) with only WARMUP_STEPS diffusion steps — every step runs
+the same graph.
+
+Works on the CPU backend as well (Inductor emits C++ there), so it can be tried off-GPU.
+"""
+
+import logging
+import os
+import tempfile
+import time
+
+import torch
+from PIL import Image
+
+from decode_chunks import device_name
+from generation import BOUNDS, GUIDANCE_SCALE, OCTREE_RESOLUTION, decode_resolutions
+
+logger = logging.getLogger("AI-Engine")
+
+COMPILE_CACHE_DIR = os.environ.get("COMPILE_CACHE_DIR", "cache/compile")
+# torch.compile mode ("default", "reduce-overhead", "max-autotune", ...); "off" disables compile
+COMPILE_MODE = os.environ.get("COMPILE_MODE", "default")
+COMPILE_BACKEND = os.environ.get("COMPILE_BACKEND", "inductor")
+# diffusion steps per dummy generation; 0 skips the warm-up (and the compile) entirely
+WARMUP_STEPS = int(os.environ.get("WARMUP_STEPS", "2"))
+# benchmark the attention backends on the shapes of the eager dummy run (0 keeps sdpa)
+ATTENTION_AUTOTUNE = int(os.environ.get("ATTENTION_AUTOTUNE", "1"))
+# probe the decode chunk sizes of untuned resolutions (0 keeps NUM_CHUNKS / the stored sizes)
+DECODE_CHUNK_AUTOTUNE = int(os.environ.get("DECODE_CHUNK_AUTOTUNE", "1"))
+
+# Inductor and Triton read these when they first compile, so setting them at import is
+# enough; explicit env vars win.
+if COMPILE_CACHE_DIR:
+    os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", os.path.join(COMPILE_CACHE_DIR, "inductor"))
+    os.environ.setdefault("TRITON_CACHE_DIR", os.path.join(COMPILE_CACHE_DIR, "triton"))
+    os.environ.setdefault("TORCHINDUCTOR_FX_GRAPH_CACHE", "1")
+    os.environ.setdefault("TORCHINDUCTOR_AUTOGRAD_CACHE", "1")
+
+
+def compile_args() -> dict:
+    return {
+        "compile_transformer": True,
+        "compile_geo_decoder": True,
+        "mode": COMPILE_MODE,
+        "backend": COMPILE_BACKEND,
+        # micro-batching changes the batch dimension; leave room for those recompiles
+        "dynamo_cache_size_limit": 64,
+    }
+
+
+def artifacts_path(root: str, device) -> str:
+    """The portable cache bundle is only valid for one torch build and GPU model."""
+    device = torch.device(device)
+    name = torch.cuda.get_device_name(device) if device.type == "cuda" else "cpu"
+    tag = f"{torch.__version__}-{name}".replace(" ", "_").replace("/", "_")
+    return os.path.join(root, f"artifacts-{tag}.bin")
+
+
+def load_artifacts(path: str) -> bool:
+    if not hasattr(torch.compiler, "load_cache_artifacts") or not os.path.exists(path):
+        return False
+    try:
+        with open(path, "rb") as f:
+            torch.compiler.load_cache_artifacts(f.read())
+    except Exception as e:
+        logger.warning(f"[WARMUP] Ignoring unreadable compile artifacts {path}: {e}")
+        return False
+    return True
+
+
+def save_artifacts(path: str) -> int:
+    """Atomically write the compile artifacts collected so far; returns their size in bytes."""
+    if not hasattr(torch.compiler, "save_cache_artifacts"):
+        return 0
+    saved = torch.compiler.save_cache_artifacts()
+    if saved is None:
+        return 0
+    data = saved[0]
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return len(data)
+
+
+def dummy_image(size: int = 512) -> Image.Image:
+    """A grey cube-ish silhouette on a transparent canvas, like preprocess_image's output."""
+    image = Image.new("RGBA", (size, size), (0, 0, 0, 0))
+    image.paste((128, 128, 128, 255), (size // 4, size // 4, 3 * size // 4, 3 * size // 4))
+    return image
+
+
+def _synchronize(device):
+    if torch.device(device).type == "cuda":
+        torch.cuda.synchronize(device)
+
+
+def dummy_generation(stages, steps: int, octree_resolution: int = OCTREE_RESOLUTION) -> float:
+    """Seconds for image → latents → grid logits (marching cubes is not compiled)."""
+    start = time.perf_counter()
+    with torch.no_grad():
+        latents = stages.pipeline(
+            image=dummy_image(),
+            num_inference_steps=steps,
+            guidance_scale=GUIDANCE_SCALE,
+            enable_pbar=False
+        )
+        latents = latents.to(stages.device, dtype=stages.pipeline.dtype)
+        stages.decode_grid(latents, octree_resolution, BOUNDS)
+    _synchronize(stages.device)
+    return time.perf_counter() - start
+
+
+def tune_decode_chunks(stages, steps: int) -> dict:
+    """{octree resolution: chunk size} for the decode resolutions not yet tuned on this GPU."""
+    tuner = stages.chunk_tuner
+    if not DECODE_CHUNK_AUTOTUNE or tuner is None:
+        return {}
+    name, decoder = device_name(stages.device), type(stages.vae.volume_decoder).__name__
+    todo = [r for r in decode_resolutions() if not tuner.tuned(name, r, decoder)]
+    if not todo:
+        return {}
+    with torch.no_grad():
+        latents = stages.pipeline(
+            image=dummy_image(),
+            num_inference_steps=steps,
+            guidance_scale=GUIDANCE_SCALE,
+            enable_pbar=False
+        )
+    latents = latents.to(stages.device, dtype=stages.pipeline.dtype)
+    tuned = {resolution: stages.tune_chunks(latents, resolution)["num_chunks"] for resolution in todo}
+    logger.info(f"[WARMUP] Decode chunk sizes: {tuned}")
+    return tuned
+
+
+def warm_up(stages, steps: int = WARMUP_STEPS) -> dict:
+    """
+    Compile (unless COMPILE_MODE=off) and warm the attached pipeline. Returns the timings
+    that are also logged: eager, first (compile) and steady-state seconds per dummy run.
+    """
+    if steps <= 0 or stages.pipeline is None:
+        return {}
+    report = {"steps": steps, "compiled": COMPILE_MODE != "off"}
+    report["eager_s"] = round(dummy_generation(stages, steps), 3)
+    if ATTENTION_AUTOTUNE:
+        from hy3dgen.shapegen.attention import autotune
+        report["attention_sites"] = autotune()["site_defaults"]
+        logger.info(f"[WARMUP] Attention backends: {report['attention_sites']}")
+    if not report["compiled"]:
+        report["decode_chunks"] = tune_decode_chunks(stages, steps)
+        logger.info(f"[WARMUP] Eager warm-up done in {report['eager_s']}s")
+        return report
+
+    path = artifacts_path(COMPILE_CACHE_DIR, stages.device)
+    report["artifacts_loaded"] = load_artifacts(path)
+    from hy3dgen.shapegen.pipelines import compile_models
+    compile_models(stages.pipeline.model, stages.vae, compile_args())
+
+    report["first_s"] = round(dummy_generation(stages, steps), 3)
+    report["steady_s"] = round(dummy_generation(stages, steps), 3)
+    report["compile_s"] = round(report["first_s"] - report["steady_s"], 3)
+    report["gain"] = round(1 - report["steady_s"] / report["eager_s"], 3)
+    try:
+        report["artifacts_bytes"] = save_artifacts(path)
+    except OSError as e:
+        logger.warning(f"[WARMUP] Could not save compile artifacts to {path}: {e}")
+    report["decode_chunks"] = tune_decode_chunks(stages, steps)
+
+    logger.info(
+        f"[WARMUP] compile {report['compile_s']}s "
+        f"(artifacts {'reused' if report['artifacts_loaded'] else 'built'}), "
+        f"eager {report['eager_s']}s → compiled {report['steady_s']}s per {steps}-step run "
+        f"({report['gain']:.0%} faster)"
+    )
+    return report
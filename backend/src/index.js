@@ -464,7 +464,7 @@ Structure:
 
             // 4. Handle Concept Selection & Trigger 3D Gen
             if (url.pathname === "/api/session/select" && request.method === "POST") {
-                const { session_id, concept_id, image_url } = await request.json();
+                const { session_id, concept_id, image_url, quality, candidates } = await request.json();
 
                 console.log(`[SELECT] Concept: ${concept_id}, Session: ${session_id}`);
 
@@ -502,6 +502,14 @@ Structure:
                 // Trigger 3D Engine
                 try {
                     const IS_RUNPOD = AI_ENGINE_URL.includes("api.runpod.ai");
+                    // Coarse preview mesh (webhook status "draft") ahead of the full one. Opt-in:
+                    // the extra draft pass runs on the GPU stage before the full one, delaying the
+                    // final mesh and costing throughput under load
+                    const DRAFT_PREVIEW = env.DRAFT_PREVIEW === "true";
+                    // AI engine quality tier (fast / balanced / standard / high); omitted = engine default
+                    const QUALITY = quality || env.GENERATION_QUALITY;
+                    // seeds diffused per request; the engine meshes only the best-scoring one
+                    const CANDIDATES = Number(candidates || env.GENERATION_CANDIDATES || 1);
 
                     // RunPod Serverless expects payload wrapped in "input"
                     const payload = IS_RUNPOD ? {
@@ -509,13 +517,19 @@ Structure:
                             image_url: image_url.startsWith('http') ? image_url : `${url.origin}${image_url}`,
                             webhook_url: WEBHOOK_URL,
                             session_id: session_id,
-                            asset_id: concept_id
+                            asset_id: concept_id,
+                            draft: DRAFT_PREVIEW,
+                            quality: QUALITY,
+                            candidates: CANDIDATES
                         }
                     } : {
                         image_url: image_url.startsWith('http') ? image_url : `${url.origin}${image_url}`,
                         webhook_url: WEBHOOK_URL,
                         session_id: session_id,
-                        asset_id: concept_id
+                        asset_id: concept_id,
+                        draft: DRAFT_PREVIEW,
+                        quality: QUALITY,
+                        candidates: CANDIDATES
                     };
 
                     const headers = {
@@ -531,18 +545,37 @@ Structure:
 
                     console.log("[AI-ENGINE] Triggering:", AI_ENGINE_URL, "IsRunPod:", IS_RUNPOD);
 
-                    const aiPromise = fetch(AI_ENGINE_URL, {
-                        method: "POST",
-                        headers: headers,
-                        body: JSON.stringify(payload),
-                        signal: AbortSignal.timeout(60000)
-                    }).then(async r => {
-                        const txt = await r.text();
-                        console.log(`[AI-ENGINE] Response status: ${r.status}`);
-                        if (r.status !== 200 && r.status !== 202) {
+                    // A full engine queue answers 429 ("rejected"): retry with backoff, and if
+                    // it never accepts, fail the asset like the failure webhook would so the
+                    // frontend stops polling a job that was never queued
+                    const AI_ENGINE_RETRIES = Number(env.AI_ENGINE_RETRIES || 3);
+                    const markFailed = () => env.DB.prepare(
+                        "UPDATE Assets SET status = 'failed' WHERE session_id = ? AND (id = ? OR image_url LIKE ?)"
+                    ).bind(session_id, concept_id, `%${concept_id}%`).run();
+
+                    const aiPromise = (async () => {
+                        for (let attempt = 0; ; attempt++) {
+                            const r = await fetch(AI_ENGINE_URL, {
+                                method: "POST",
+                                headers: headers,
+                                body: JSON.stringify(payload),
+                                signal: AbortSignal.timeout(60000)
+                            });
+                            const txt = await r.text();
+                            console.log(`[AI-ENGINE] Response status: ${r.status}`);
+                            if (r.status === 200 || r.status === 202) return;
+                            if (r.status === 429 && attempt < AI_ENGINE_RETRIES) {
+                                const delay = 2000 * 2 ** attempt;
+                                console.warn(`[AI-ENGINE] Queue full, retrying in ${delay}ms (${attempt + 1}/${AI_ENGINE_RETRIES})`);
+                                await new Promise(resolve => setTimeout(resolve, delay));
+                                continue;
+                            }
                             console.error(`[AI-ENGINE] Error response! ${txt.substring(0, 200)}`);
+                            await markFailed();
+                            return;
                         }
-                    }).catch(e => {
+                    })().catch(e => {
+                        // a timeout may still have reached the engine, whose webhook settles the asset
                         console.error("[AI-ENGINE] Fetch exception:", e.message);
                     });
 
@@ -585,6 +618,21 @@ Structure:
 
                         console.log(`[WEBHOOK] D1 Update Result:`, JSON.stringify(d1Result));
 
+                        return new Response("OK", { status: 200 });
+                    } else if (status === "draft" && file) {
+                        const draftKey = `models___${session_id}___${asset_id}_draft.stl`;
+
+                        await env.ASSETS_BUCKET.put(draftKey, await file.arrayBuffer(), {
+                            httpMetadata: { contentType: "model/stl" }
+                        });
+
+                        console.log(`[WEBHOOK] Saved draft to R2: ${draftKey}`);
+
+                        // Never downgrade an asset whose full-quality mesh already arrived
+                        await env.DB.prepare(
+                            "UPDATE Assets SET status = 'draft', stl_r2_path = ? WHERE session_id = ? AND (id = ? OR image_url LIKE ?) AND status != 'completed'"
+                        ).bind(draftKey, session_id, asset_id, `%${asset_id}%`).run();
+
                         return new Response("OK", { status: 200 });
                     } else {
                         console.warn(`[WEBHOOK] Failure status or missing file.`);
@@ -255,6 +255,10 @@ export default function ThreeSceneViewer({ selectedConcept, sessionId, line1, se
                     setMeshProgress(100);
                     setStatus('completed');
                     setStlUrl(`${API_BASE_URL}/api/assets/${currentAsset.stl_r2_path}`);
+                } else if (currentAsset?.status === 'draft' && currentAsset.stl_r2_path) {
+                    // Coarse preview: show it, keep polling for the full-quality mesh
+                    setStlUrl(`${API_BASE_URL}/api/assets/${currentAsset.stl_r2_path}`);
+                    setMeshProgress(prev => Math.min(prev + (Math.random() * 3), 95));
                 } else if (currentAsset?.status === 'failed') {
                     setStatus('failed');
                 } else {